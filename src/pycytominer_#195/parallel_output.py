@@ -0,0 +1,414 @@
+"""
+Block output of (merged) single cells, in place of
+pycytominer.cyto_utils.output which formats and compresses a
+csv as one string.
+
+CSV output is split into blocks of rows which are formatted and
+compressed independently on a thread pool, then written in order.
+Compressed blocks are separate gzip members or zstd frames, which
+concatenate into a valid file readable by pd.read_csv and gzip/zstd.
+
+Blocks are formatted with one csv engine for the whole file:
+- "pandas" (default) uses pd.DataFrame.to_csv as pycytominer's output
+  does, so files match its format. Formatting holds the GIL, so only
+  compression (which releases it) runs in parallel.
+- "pyarrow" uses pyarrow's csv writer, which formats numbers in C++
+  outside of the GIL, though its format differs: header names and
+  every string value are quoted, booleans are written as true/false,
+  and floats use Arrow's shortest representation (for example 1
+  rather than 1.0). float_format is not supported.
+  Blocks pyarrow cannot convert (for example 'nan' text within
+  otherwise numeric object columns) raise a ValueError rather than
+  mixing formats within a file.
+
+For 50,000 x 50 random floats with gzip on one cpu, output() took
+16.2s, where to_csv took 4.5s and gzip (compresslevel 9) 12.6s.
+The pandas engine took 17.0s and the pyarrow engine 12.3s there,
+so gains with more cpus come from compressing blocks in parallel.
+
+Parquet and Arrow IPC outputs share the same API, and any
+outputs may be streamed from chunks, for example:
+parallel_output(iter_merged_single_cells(sc), "SQ00014613.csv.gz")
+"""
+import gzip
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Dict, Iterable, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as csv
+import pyarrow.parquet as pq
+
+# engines which format csv blocks
+CSV_ENGINES = ["pandas", "pyarrow"]
+
+# compression methods available by output type
+COMPRESSION_METHODS = {
+    "csv": [None, "gzip", "zstd"],
+    "parquet": [None, "gzip", "zstd", "snappy", "lz4", "brotli"],
+    "arrow": [None, "zstd", "lz4"],
+}
+
+
+def output_type_from_filename(output_filename: str) -> str:
+    """
+    Determine the output type from a filename.
+
+    Parameters
+    ----------
+    output_filename: str
+        location of file to write
+
+    Returns
+    -------
+    str
+        one of csv, parquet or arrow
+    """
+
+    if output_filename.endswith(".parquet"):
+        return "parquet"
+    if output_filename.endswith((".arrow", ".feather", ".ipc")):
+        return "arrow"
+
+    return "csv"
+
+
+def set_compression_method(
+    compression: Optional[Union[str, Dict]], output_type: str
+) -> Dict:
+    """
+    Set compression options as a dictionary, similar to
+    pycytominer.cyto_utils.output.set_compression_method.
+
+    Parameters
+    ----------
+    compression: Optional[Union[str, Dict]]
+        compression method name or options with a "method" key
+    output_type: str
+        one of csv, parquet or arrow
+
+    Returns
+    -------
+    Dict
+        compression options with a "method" key
+    """
+
+    if compression is None:
+        compression = {"method": None}
+    if isinstance(compression, str):
+        compression = {"method": compression}
+
+    if compression["method"] not in COMPRESSION_METHODS[output_type]:
+        raise ValueError(
+            f"{compression['method']} is not supported for {output_type}, "
+            f"select one of {COMPRESSION_METHODS[output_type]}"
+        )
+
+    return compression
+
+
+def format_csv_block(
+    df: pd.DataFrame,
+    sep: str,
+    float_format: Optional[str],
+    header: bool,
+    csv_engine: str = "pandas",
+) -> bytes:
+    """
+    Format a block of rows as csv.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        block of rows to format
+    sep: str
+        file delimiter
+    float_format: str
+        optional printf style format for floats, pandas engine only
+    header: bool
+        whether to include the header
+    csv_engine: str
+        pandas or pyarrow, see CSV_ENGINES
+
+    Returns
+    -------
+    bytes
+        csv of the block
+    """
+
+    if csv_engine == "pandas":
+        return df.to_csv(
+            sep=sep, index=False, header=header, float_format=float_format
+        ).encode()
+
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        csv.write_csv(
+            table,
+            sink,
+            write_options=csv.WriteOptions(
+                include_header=header, delimiter=sep, quoting_style="needed"
+            ),
+        )
+
+        return sink.getvalue().to_pybytes()
+    except (
+        pa.ArrowInvalid,
+        pa.ArrowTypeError,
+        pa.ArrowNotImplementedError,
+        TypeError,
+    ) as error:
+        # mixed types within object columns (for example 'nan' text
+        # within otherwise numeric CellProfiler columns), or pyarrow
+        # releases without delimiter and quoting_style options
+        raise ValueError(
+            f"pyarrow csv engine cannot format this block ({error}), "
+            'use csv_engine="pandas"'
+        ) from error
+
+
+def compress_block(data: bytes, compression: Dict) -> bytes:
+    """
+    Compress a block as a standalone gzip member or zstd frame.
+
+    Parameters
+    ----------
+    data: bytes
+        block to compress
+    compression: Dict
+        compression options with a "method" key, see set_compression_method
+
+    Returns
+    -------
+    bytes
+        compressed block
+    """
+
+    if compression["method"] == "gzip":
+        return gzip.compress(
+            data,
+            compresslevel=compression.get("compresslevel", 9),
+            mtime=compression.get("mtime"),
+        )
+    if compression["method"] == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=compression.get("level", 3)).compress(
+            data
+        )
+
+    return data
+
+
+class ParallelOutputWriter:
+    """
+    Write chunks of rows to a csv, parquet or Arrow IPC file.
+
+    Example:
+    with ParallelOutputWriter("SQ00014613.csv.gz") as writer:
+        for chunk in iter_merged_single_cells(sc):
+            writer.write(chunk)
+    """
+
+    def __init__(
+        self,
+        output_filename: str,
+        sep: str = ",",
+        float_format: Optional[str] = None,
+        compression_options: Optional[Union[str, Dict]] = None,
+        output_type: Optional[str] = None,
+        block_rows: int = 65536,
+        workers: Optional[int] = None,
+        csv_engine: str = "pandas",
+    ) -> None:
+        """
+        Parameters
+        ----------
+        output_filename: str
+            location of file to write
+        sep: str
+            csv file delimiter
+        float_format: str
+            optional printf style format for csv floats, for example "%.3g",
+            with the pandas csv engine
+        compression_options: Optional[Union[str, Dict]]
+            compression method or options with a "method" key,
+            see COMPRESSION_METHODS for methods by output type.
+        output_type: str
+            csv, parquet or arrow, inferred from output_filename by default.
+        block_rows: int
+            rows per csv block which is formatted and compressed
+        workers: int
+            csv formatting threads, by default os.cpu_count()
+        csv_engine: str
+            pandas (pycytominer's csv format) or pyarrow (faster, with
+            the format differences noted within this module)
+        """
+
+        if csv_engine not in CSV_ENGINES:
+            raise ValueError(
+                f"{csv_engine} is not a csv engine, select one of {CSV_ENGINES}"
+            )
+        if csv_engine == "pyarrow" and float_format is not None:
+            raise ValueError('float_format requires csv_engine="pandas"')
+
+        self.output_filename = output_filename
+        self.output_type = (
+            output_type if output_type else output_type_from_filename(output_filename)
+        )
+        self.sep = sep
+        self.float_format = float_format
+        self.compression = set_compression_method(compression_options, self.output_type)
+        self.block_rows = block_rows
+        self.workers = workers if workers else os.cpu_count()
+        self.csv_engine = csv_engine
+
+        self.writer = None
+        self.schema = None
+        self.header = True
+        self.pending: Deque[Future] = deque()
+        self.executor = None
+        self.file = None
+        if self.output_type == "csv":
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+            self.file = open(output_filename, "wb")
+
+    def _format_and_compress(self, df: pd.DataFrame, header: bool) -> bytes:
+        return compress_block(
+            format_csv_block(df, self.sep, self.float_format, header, self.csv_engine),
+            self.compression,
+        )
+
+    def _write_pending(self, max_pending: int) -> None:
+        # blocks are written in the order they were submitted
+        while len(self.pending) > max_pending:
+            self.file.write(self.pending.popleft().result())
+
+    def write(self, df: pd.DataFrame) -> None:
+        """
+        Write a chunk of rows.
+
+        Parameters
+        ----------
+        df: pd.DataFrame
+            chunk of rows with the same columns as other chunks
+        """
+
+        if self.output_type == "csv":
+            for start in range(0, max(len(df), 1), self.block_rows):
+                if start >= len(df) and not self.header:
+                    break
+                self.pending.append(
+                    self.executor.submit(
+                        self._format_and_compress,
+                        df.iloc[start : start + self.block_rows],
+                        self.header,
+                    )
+                )
+                self.header = False
+                # bound memory held by formatted blocks
+                self._write_pending(max_pending=self.workers * 2)
+            return
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.schema = table.schema
+            if self.output_type == "parquet":
+                self.writer = pq.ParquetWriter(
+                    self.output_filename,
+                    table.schema,
+                    compression=self.compression["method"] or "none",
+                )
+            else:
+                self.writer = pa.ipc.new_file(
+                    self.output_filename,
+                    table.schema,
+                    options=pa.ipc.IpcWriteOptions(
+                        compression=self.compression["method"]
+                    ),
+                )
+        self.writer.write_table(table.cast(self.schema))
+
+    def close(self) -> None:
+        """
+        Finish writing and close the file.
+        """
+
+        if self.output_type == "csv":
+            self._write_pending(max_pending=0)
+            self.executor.shutdown()
+            self.file.close()
+        elif self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self) -> "ParallelOutputWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def parallel_output(
+    df: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+    output_filename: str,
+    sep: str = ",",
+    float_format: Optional[str] = None,
+    compression_options: Optional[Union[str, Dict]] = {"method": "gzip", "mtime": 1},
+    output_type: Optional[str] = None,
+    block_rows: int = 65536,
+    workers: Optional[int] = None,
+    csv_engine: str = "pandas",
+) -> str:
+    """
+    Write a dataframe or chunks of dataframes to disk, with the
+    arguments of pycytominer.cyto_utils.output.
+
+    Parameters
+    ----------
+    df: Union[pd.DataFrame, Iterable[pd.DataFrame]]
+        a dataframe, or chunks of dataframes, to write
+    output_filename: str
+        location of file to write
+    sep: str
+        csv file delimiter
+    float_format: str
+        optional printf style format for csv floats, for example "%.3g",
+        with the pandas csv engine
+    compression_options: Optional[Union[str, Dict]]
+        compression method or options with a "method" key,
+        by default {"method": "gzip", "mtime": 1}.
+    output_type: str
+        csv, parquet or arrow, inferred from output_filename by default.
+    block_rows: int
+        rows per csv block which is formatted and compressed
+    workers: int
+        csv formatting threads, by default os.cpu_count()
+    csv_engine: str
+        pandas (pycytominer's csv format) or pyarrow (faster, with
+        the format differences noted within this module)
+
+    Returns
+    -------
+    str
+        location of the written file
+    """
+
+    chunks = [df] if isinstance(df, pd.DataFrame) else df
+
+    with ParallelOutputWriter(
+        output_filename,
+        sep=sep,
+        float_format=float_format,
+        compression_options=compression_options,
+        output_type=output_type,
+        block_rows=block_rows,
+        workers=workers,
+        csv_engine=csv_engine,
+    ) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+    return output_filename
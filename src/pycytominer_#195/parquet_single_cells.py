@@ -0,0 +1,386 @@
+"""
+SingleCells which loads compartments and images from a converted
+parquet (or Arrow IPC) dataset instead of SQLite, so existing
+merge_single_cells and aggregate_profiles callers read columnar
+data without monkeypatching load_compartment.
+
+Expects one file per table named by table (Image.parquet, Cells.parquet...)
+with columns prefixed by table name other than the join keys, such as
+those written by DatabaseFrame.to_parquet_dataset within
+pycytominer_#205/databaseframe_arrow_concat_dataset.py.
+"""
+import pathlib
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pycytominer.cyto_utils.cells import SingleCells
+
+# file extensions which may be read, in order of preference
+DATASET_EXTENSIONS = [".arrow", ".feather", ".parquet"]
+
+
+class ParquetSingleCells(SingleCells):
+    """
+    SingleCells backed by a parquet dataset directory.
+
+    Example:
+    sc_p = ParquetSingleCells(
+        "SQ00014613_dataset",
+        strata=["Image_Metadata_Plate", "Image_Metadata_Well"],
+        image_cols=["TableNumber", "ImageNumber"],
+        fields_of_view_feature=[],
+    )
+    merged_sc = sc_p.merge_single_cells()
+    """
+
+    def __init__(
+        self,
+        dataset_dir: str,
+        merge_cols: List[str] = None,
+        compartment_columns: Optional[Dict[str, List[str]]] = None,
+        load_image_data: bool = True,
+        **kwargs,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        dataset_dir: str
+            directory of the converted dataset with one file per table
+        merge_cols: List[str]
+            keys which are not prefixed by table name within the dataset.
+            By default TableNumber and ImageNumber.
+        compartment_columns: Dict[str, List[str]]
+            optional compartment name to (unprefixed) columns to load,
+            all columns are loaded otherwise. Merge, ObjectNumber and
+            linking columns are always loaded.
+        load_image_data: bool
+            whether to load the image table on creation
+        **kwargs
+            other SingleCells arguments, for example strata and image_cols
+        """
+
+        # set default merge_cols
+        if not merge_cols:
+            merge_cols = ["TableNumber", "ImageNumber"]
+
+        # an in-memory sqlite url satisfies SingleCells without a database
+        super().__init__(
+            "sqlite://", merge_cols=merge_cols, load_image_data=False, **kwargs
+        )
+
+        self.dataset_dir = dataset_dir
+        self.compartment_columns = (
+            compartment_columns if compartment_columns is not None else {}
+        )
+
+        if load_image_data:
+            self.load_image()
+            self.load_image_data = True
+
+    def table_filepath(self, table_name: str) -> pathlib.Path:
+        """
+        Find the file of a table within the dataset, ignoring case as
+        SingleCells uses lowercase compartment and image table names.
+
+        Parameters
+        ----------
+        table_name: str
+            table or compartment name
+
+        Returns
+        -------
+        pathlib.Path
+            filepath of the table
+        """
+
+        filepaths = {
+            filepath.stem.lower(): filepath
+            for extension in reversed(DATASET_EXTENSIONS)
+            for filepath in pathlib.Path(self.dataset_dir).glob(f"*{extension}")
+        }
+
+        if table_name.lower() not in filepaths:
+            raise FileNotFoundError(
+                f"No file for table {table_name} within {self.dataset_dir}"
+            )
+
+        return filepaths[table_name.lower()]
+
+    def read_table(
+        self, table_name: str, columns: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        """
+        Read a table from the dataset with its original column names,
+        memory-mapping the file and reading only requested columns.
+
+        Parameters
+        ----------
+        table_name: str
+            table or compartment name
+        columns: List[str]
+            optional unprefixed columns to read, all columns otherwise.
+
+        Returns
+        -------
+        pd.DataFrame
+            table data with table name prefixes removed
+        """
+
+        filepath = self.table_filepath(table_name)
+        names = self.get_sql_table_col_names(table_name)
+        prefixed = {
+            name: (name if name in self.merge_cols else f"{filepath.stem}_{name}")
+            for name in names
+        }
+        read_columns = [prefixed[name] for name in (columns or names)]
+
+        if filepath.suffix == ".parquet":
+            table = pq.read_table(filepath, columns=read_columns, memory_map=True)
+        else:
+            table = (
+                pa.ipc.open_file(pa.memory_map(str(filepath), "r"))
+                .read_all()
+                .select(read_columns)
+            )
+
+        table = table.rename_columns(columns or names)
+
+        # split blocks and release arrow buffers as columns are converted
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+
+    def get_sql_table_col_names(self, table: str) -> List[str]:
+        """
+        Get column names of a table from the dataset file schema
+        with table name prefixes removed.
+
+        Parameters
+        ----------
+        table: str
+            table or compartment name
+
+        Returns
+        -------
+        List[str]
+            column names of the table
+        """
+
+        filepath = self.table_filepath(table)
+        if filepath.suffix == ".parquet":
+            schema = pq.read_schema(filepath)
+        else:
+            schema = pa.ipc.open_file(pa.memory_map(str(filepath), "r")).schema
+
+        return [
+            name if name in self.merge_cols else name[len(filepath.stem) + 1 :]
+            for name in schema.names
+        ]
+
+    def object_keys(self, compartment: str) -> pd.DataFrame:
+        """
+        Read only merge columns and ObjectNumber of a compartment,
+        in place of the SQL queries used for counts and subsampling.
+
+        Parameters
+        ----------
+        compartment: str
+            The compartment to process.
+
+        Returns
+        -------
+        pd.DataFrame
+            merge columns and ObjectNumber of each object
+        """
+
+        return self.read_table(
+            compartment, columns=list(self.merge_cols) + ["ObjectNumber"]
+        )
+
+    def load_image(self, image_table_name: Optional[str] = None) -> None:
+        """
+        Load image table data, reading only image_cols and strata
+        unless image features were requested.
+
+        Parameters
+        ----------
+        image_table_name: str
+            image table name, by default self.image_table_name.
+        """
+
+        # image_table_name is only an attribute in later pycytominer releases
+        if image_table_name is None:
+            image_table_name = getattr(self, "image_table_name", "image")
+
+        image_features = list(np.union1d(self.image_cols, self.strata))
+
+        self.image_df = self.read_table(
+            image_table_name,
+            columns=None if self.add_image_features else image_features,
+        )
+
+        if self.add_image_features:
+            from pycytominer.cyto_utils import extract_image_features
+
+            self.image_features_df = extract_image_features(
+                image_feature_categories=self.image_feature_categories,
+                image_df=self.image_df,
+                image_cols=self.image_cols,
+                strata=self.strata,
+            )
+
+        self.image_df = self.image_df[image_features]
+
+        if self.fields_of_view != "all":
+            self.image_df = self.image_df.query(
+                f"{self.fields_of_view_feature}==@self.fields_of_view"
+            )
+            if self.add_image_features:
+                self.image_features_df = self.image_features_df.query(
+                    f"{self.fields_of_view_feature}==@self.fields_of_view"
+                )
+
+    def load_compartment(self, compartment: str) -> pd.DataFrame:
+        """
+        Creates the compartment dataframe.
+
+        Parameters
+        ----------
+        compartment: str
+            The compartment to process.
+
+        Returns
+        -------
+        pd.DataFrame
+            Compartment dataframe.
+        """
+
+        columns = self.compartment_columns.get(compartment)
+        if columns is not None:
+            # always keep object keys and the columns merge_single_cells joins on
+            linking_cols = list(
+                self.compartment_linking_cols.get(compartment, {}).values()
+            )
+            columns = list(
+                dict.fromkeys(
+                    list(self.merge_cols)
+                    + ["ObjectNumber"]
+                    + linking_cols
+                    + list(columns)
+                )
+            )
+
+        return self.read_table(compartment, columns=columns)
+
+    def count_cells(
+        self, compartment: str = "cells", count_subset: bool = False
+    ) -> pd.DataFrame:
+        """
+        Determine how many cells are measured per well.
+
+        Parameters
+        ----------
+        compartment: str
+            Compartment to subset, by default cells.
+        count_subset: bool
+            Whether or not count the number of cells as specified by the strata groups.
+
+        Returns
+        -------
+        pd.DataFrame
+            DataFrame of cell counts in the experiment.
+        """
+
+        if count_subset:
+            return super().count_cells(compartment=compartment, count_subset=True)
+
+        return (
+            self.image_df.merge(
+                self.object_keys(compartment), how="inner", on=self.merge_cols
+            )
+            .groupby(self.strata)["ObjectNumber"]
+            .count()
+            .reset_index()
+            .rename({"ObjectNumber": "cell_count"}, axis="columns")
+        )
+
+    def get_subsample(
+        self,
+        df: Optional[pd.DataFrame] = None,
+        compartment: str = "cells",
+        rename_col: bool = True,
+    ) -> None:
+        """
+        Apply the subsampling procedure.
+
+        Parameters
+        ----------
+        df: pd.DataFrame
+            optional DataFrame of a single cell profile, by default
+            the keys of the compartment.
+        compartment: str
+            The compartment to process, by default cells.
+        rename_col: bool
+            Whether or not to rename the columns.
+        """
+
+        if df is None:
+            df = self.object_keys(compartment)
+
+        super().get_subsample(df=df, compartment=compartment, rename_col=rename_col)
+
+    def _compartment_df_generator(
+        self, compartment: str, n_aggregation_memory_strata: int = 1
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Yield chunks of a compartment where rows of an aggregation
+        stratum are never split between chunks, reading only the
+        row groups of each chunk's images.
+
+        Parameters
+        ----------
+        compartment: str
+            Compartment to aggregate.
+        n_aggregation_memory_strata: int
+            Number of unique strata to read into memory at once.
+
+        Yields
+        ------
+        pd.DataFrame
+            chunk of the compartment table
+        """
+
+        assert (
+            n_aggregation_memory_strata > 0
+        ), "Number of strata to pull into memory at once (n_aggregation_memory_strata) must be > 0"
+
+        strata_keys = [
+            keys_df[self.merge_cols].drop_duplicates()
+            for _, keys_df in self.image_df.groupby(self.strata)
+        ]
+
+        filepath = self.table_filepath(compartment)
+        names = self.get_sql_table_col_names(compartment)
+        for i in range(0, len(strata_keys), n_aggregation_memory_strata):
+            keys_df = pd.concat(strata_keys[i : i + n_aggregation_memory_strata])
+            if filepath.suffix == ".parquet":
+                table = pq.read_table(
+                    filepath,
+                    memory_map=True,
+                    # one conjunction per key combination of the chunk's images
+                    filters=[
+                        [(key, "=", value) for key, value in zip(self.merge_cols, row)]
+                        for row in keys_df.itertuples(index=False)
+                    ],
+                )
+            else:
+                table = pa.ipc.open_file(pa.memory_map(str(filepath), "r")).read_all()
+                table = table.join(
+                    pa.Table.from_pandas(keys_df, preserve_index=False),
+                    keys=list(self.merge_cols),
+                    join_type="inner",
+                ).select(table.column_names)
+            yield table.rename_columns(names).to_pandas(
+                split_blocks=True, self_destruct=True
+            )
@@ -0,0 +1,286 @@
+"""
+Infer CellProfiler features from a schema catalog (table, column and
+declared type) instead of the columns of a merged DataFrame, so features
+are known before any data is loaded.
+
+Inferred features may be used to project compartment reads (for example
+ParquetSingleCells(compartment_columns=...)), to type reads, and as the
+features of normalize or StreamingNormalizer in place of "infer".
+Results are cached per schema hash, so repeated calls for the same
+database do not repeat prefix checks over tens of thousands of columns.
+
+Example:
+catalog = sqlite_schema_catalog("SQ00014613.sqlite")
+features = merged_features(infer_schema_features(catalog))
+"""
+import hashlib
+import json
+import pathlib
+import sqlite3
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pycytominer.cyto_utils import (
+    get_default_linking_cols,
+    provide_linking_cols_feature_name_update,
+)
+
+# inferred features by schema hash and inference options
+_SCHEMA_FEATURES_CACHE = {}
+
+
+def sqlite_schema_catalog(sql_file: str) -> List[Dict[str, str]]:
+    """
+    Read a schema catalog of a SQLite database from table metadata only.
+
+    Parameters
+    ----------
+    sql_file: str
+        SQLite url or filepath
+
+    Returns
+    -------
+    List[Dict[str, str]]
+        list of dictionaries similar to the following.
+        [{'table_name', 'column_name', 'column_type'},...]
+    """
+
+    sql_path = str(sql_file)
+    for prefix in ["sqlite:///", "sqlite://"]:
+        if sql_path.startswith(prefix):
+            sql_path = sql_path[len(prefix) :]
+
+    # as_uri percent-encodes characters such as # within the path
+    connection = sqlite3.connect(
+        pathlib.Path(sql_path).resolve().as_uri() + "?mode=ro", uri=True
+    )
+    catalog = [
+        {"table_name": table_name, "column_name": name, "column_type": column_type}
+        for (table_name,) in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name NOT LIKE 'sqlite_%' ORDER BY name;"
+        ).fetchall()
+        for name, column_type in connection.execute(
+            "SELECT name, type FROM pragma_table_info(?);", [table_name]
+        ).fetchall()
+    ]
+    connection.close()
+
+    return catalog
+
+
+def dataset_schema_catalog(
+    dataset_dir: str, merge_cols: List[str] = None
+) -> List[Dict[str, str]]:
+    """
+    Read a schema catalog from the file schemas of a converted dataset
+    (see parquet_single_cells.py), with table name prefixes removed.
+
+    Parameters
+    ----------
+    dataset_dir: str
+        directory of the converted dataset with one file per table
+    merge_cols: List[str]
+        keys which are not prefixed by table name within the dataset.
+        By default TableNumber and ImageNumber.
+
+    Returns
+    -------
+    List[Dict[str, str]]
+        list of dictionaries similar to the following.
+        [{'table_name', 'column_name', 'column_type'},...]
+    """
+
+    # set default merge_cols
+    if not merge_cols:
+        merge_cols = ["TableNumber", "ImageNumber"]
+
+    catalog = []
+    for filepath in sorted(pathlib.Path(dataset_dir).iterdir()):
+        if filepath.suffix == ".parquet":
+            schema = pq.read_schema(filepath)
+        elif filepath.suffix in [".arrow", ".feather"]:
+            schema = pa.ipc.open_file(pa.memory_map(str(filepath), "r")).schema
+        else:
+            continue
+        catalog += [
+            {
+                "table_name": filepath.stem,
+                "column_name": (
+                    field.name
+                    if field.name in merge_cols
+                    else field.name[len(filepath.stem) + 1 :]
+                ),
+                "column_type": str(field.type),
+            }
+            for field in schema
+        ]
+
+    return catalog
+
+
+def schema_hash(catalog: List[Dict[str, str]]) -> str:
+    """
+    Hash a schema catalog by its tables, columns and types.
+
+    Parameters
+    ----------
+    catalog: List[Dict[str, str]]
+        schema catalog, see sqlite_schema_catalog
+
+    Returns
+    -------
+    str
+        hex digest of the schema
+    """
+
+    return hashlib.sha256(
+        json.dumps(
+            [
+                [entry["table_name"], entry["column_name"], entry["column_type"]]
+                for entry in catalog
+            ]
+        ).encode()
+    ).hexdigest()
+
+
+def infer_schema_features(
+    catalog: List[Dict[str, str]],
+    compartments: List[str] = None,
+    linking_cols: Optional[Dict[str, Dict[str, str]]] = None,
+) -> Dict[str, List[str]]:
+    """
+    Infer the features of each compartment table as infer_cp_features
+    would for the output of SingleCells.merge_single_cells.
+
+    Parameters
+    ----------
+    catalog: List[Dict[str, str]]
+        schema catalog, see sqlite_schema_catalog
+    compartments: List[str]
+        compartments to infer, by default cells, cytoplasm and nuclei.
+    linking_cols: Dict[str, Dict[str, str]]
+        compartment linking columns, which are renamed as metadata
+        when merged. By default get_default_linking_cols().
+
+    Returns
+    -------
+    Dict[str, List[str]]
+        compartment table name to features, in merged column order.
+    """
+
+    # set defaults
+    if not compartments:
+        compartments = ["cells", "cytoplasm", "nuclei"]
+    if linking_cols is None:
+        linking_cols = get_default_linking_cols()
+
+    cache_key = (
+        schema_hash(catalog),
+        tuple(compartments),
+        json.dumps(linking_cols, sort_keys=True),
+    )
+    # cached as tuples and returned as new lists so callers may modify them
+    if cache_key in _SCHEMA_FEATURES_CACHE:
+        return {
+            compartment: list(columns)
+            for compartment, columns in _SCHEMA_FEATURES_CACHE[cache_key].items()
+        }
+
+    prefixes = tuple(compartment.title() for compartment in compartments)
+    renamed = provide_linking_cols_feature_name_update(linking_cols)
+
+    # merge_single_cells merges compartments in linking order
+    merge_order = list(
+        dict.fromkeys(
+            compartment
+            for left_compartment in linking_cols
+            for compartment in [left_compartment] + list(linking_cols[left_compartment])
+        )
+    )
+    merge_order += [
+        compartment
+        for compartment in compartments
+        if compartment.lower() not in merge_order
+    ]
+
+    table_columns = {}
+    for entry in catalog:
+        table_columns.setdefault(entry["table_name"].lower(), []).append(
+            entry["column_name"]
+        )
+
+    features = {
+        compartment: [
+            column
+            for column in table_columns[compartment.lower()]
+            if column.startswith(prefixes) and column not in renamed
+        ]
+        for compartment in merge_order
+        if compartment.lower() in table_columns
+        and compartment.lower() in [name.lower() for name in compartments]
+    }
+    _SCHEMA_FEATURES_CACHE[cache_key] = {
+        compartment: tuple(columns) for compartment, columns in features.items()
+    }
+
+    return features
+
+
+def merged_features(features: Dict[str, List[str]]) -> List[str]:
+    """
+    Flatten compartment features into merged column order.
+
+    Parameters
+    ----------
+    features: Dict[str, List[str]]
+        compartment table name to features, see infer_schema_features
+
+    Returns
+    -------
+    List[str]
+        features of the merged single cells
+    """
+
+    return [feature for columns in features.values() for feature in columns]
+
+
+def feature_dtypes(
+    catalog: List[Dict[str, str]], features: Dict[str, List[str]]
+) -> Dict[str, str]:
+    """
+    Find the pandas dtype to read each feature as from declared types,
+    so numeric features are read as float64 rather than objects
+    (for example where 'nan' text is found within REAL columns).
+
+    Parameters
+    ----------
+    catalog: List[Dict[str, str]]
+        schema catalog, see sqlite_schema_catalog
+    features: Dict[str, List[str]]
+        compartment table name to features, see infer_schema_features
+
+    Returns
+    -------
+    Dict[str, str]
+        feature to float64 or object
+    """
+
+    column_types = {
+        (entry["table_name"].lower(), entry["column_name"]): entry["column_type"]
+        for entry in catalog
+    }
+
+    dtypes = {}
+    for compartment, columns in features.items():
+        for column in columns:
+            column_type = column_types[(compartment.lower(), column)].upper()
+            # declared sqlite types and arrow type names
+            numeric = any(
+                name in column_type
+                for name in ["INT", "REAL", "FLOA", "DOUB", "NUMERIC", "DECIMAL"]
+            )
+            dtypes[column] = "float64" if numeric else "object"
+
+    return dtypes
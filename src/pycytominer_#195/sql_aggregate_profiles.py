@@ -0,0 +1,277 @@
+"""
+Aggregate profiles by pushing GROUP BY strata into the database
+rather than merging every single cell into pandas first.
+
+Each compartment is aggregated within SQLite (mean) or DuckDB (mean or
+median) joined only to the image table for its strata, and the small
+per-compartment results are merged on strata, similar to
+SingleCells.aggregate_profiles.
+
+DuckDB reads SQLite files through its sqlite extension, or may
+be given a DuckDB database (see quick-sqlite-to-duckdb-convert.py).
+
+Note: values which are not numeric (for example 'nan' text within
+CellProfiler REAL columns) are treated as missing, as they become NaN's
+and are skipped when aggregated by pandas.
+"""
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+from pycytominer.cyto_utils import get_default_linking_cols
+
+
+def compartment_features(
+    columns: List[str],
+    compartment: str,
+    linking_cols: Dict[str, Dict[str, str]],
+    features: Optional[List[str]] = None,
+) -> List[str]:
+    """
+    Find features of a compartment table as infer_cp_features would
+    after linking columns have been renamed as metadata.
+
+    Parameters
+    ----------
+    columns: List[str]
+        columns of the compartment table
+    compartment: str
+        compartment name
+    linking_cols: Dict[str, Dict[str, str]]
+        compartment linking columns, see get_default_linking_cols()
+    features: List[str]
+        optional features to aggregate, inferred when None.
+
+    Returns
+    -------
+    List[str]
+        features of the compartment to aggregate
+    """
+
+    linking = set(linking_cols.get(compartment.lower(), {}).values())
+
+    return [
+        column
+        for column in columns
+        if column.startswith(compartment.title())
+        and column not in linking
+        and (features is None or column in features)
+    ]
+
+
+def aggregate_query(
+    compartment: str,
+    features: List[str],
+    strata: List[str],
+    merge_cols: List[str],
+    image_table_name: str,
+    operation: str,
+    dialect: str,
+    compute_object_count: bool,
+    schema: str = "",
+) -> str:
+    """
+    Create a query which aggregates a compartment by strata.
+
+    Parameters
+    ----------
+    compartment: str
+        compartment table name
+    features: List[str]
+        features to aggregate
+    strata: List[str]
+        image table columns to group by
+    merge_cols: List[str]
+        keys which link compartments to images
+    image_table_name: str
+        image table name
+    operation: str
+        mean or median (median requires duckdb)
+    dialect: str
+        sqlite or duckdb
+    compute_object_count: bool
+        whether to count objects as Metadata_Object_Count
+    schema: str
+        optional schema prefix for tables, for example "source."
+
+    Returns
+    -------
+    str
+        SQL aggregation query
+    """
+
+    selects = [f'i."{column}"' for column in strata]
+    if compute_object_count:
+        selects.append('count(c."ObjectNumber") AS "Metadata_Object_Count"')
+
+    for feature in features:
+        if dialect == "sqlite":
+            # text such as 'nan' is skipped like NULL
+            selects.append(
+                f"avg(CASE WHEN typeof(c.\"{feature}\") IN ('integer', 'real') "
+                f'THEN c."{feature}" END) AS "{feature}"'
+            )
+        else:
+            value = f'TRY_CAST(c."{feature}" AS DOUBLE)'
+            function = "median" if operation == "median" else "avg"
+            # duckdb casts 'nan' text to NaN, which would spread through aggregates
+            selects.append(
+                f"{function}({value}) FILTER (WHERE NOT isnan({value})) "
+                f'AS "{feature}"'
+            )
+
+    join_str = " AND ".join(f'c."{key}" = i."{key}"' for key in merge_cols)
+    strata_str = ", ".join(f'i."{column}"' for column in strata)
+
+    return (
+        f"SELECT {', '.join(selects)} "
+        f'FROM {schema}"{compartment}" AS c '
+        f'JOIN {schema}"{image_table_name}" AS i ON {join_str} '
+        f"GROUP BY {strata_str} ORDER BY {strata_str}"
+    )
+
+
+def sql_aggregate_profiles(
+    sql_file: str,
+    strata: List[str] = None,
+    compartments: List[str] = None,
+    merge_cols: List[str] = None,
+    image_table_name: str = "image",
+    operation: str = "median",
+    features: Optional[List[str]] = None,
+    compute_object_count: bool = True,
+    fields_of_view_feature: Optional[str] = None,
+    linking_cols: Optional[Dict[str, Dict[str, str]]] = None,
+    engine: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Aggregate and merge compartments using the database engine.
+
+    Parameters
+    ----------
+    sql_file: str
+        SQLite url or filepath, or a DuckDB database filepath (*.duckdb)
+    strata: List[str]
+        image table columns to aggregate by.
+        By default Image_Metadata_Plate and Image_Metadata_Well.
+    compartments: List[str]
+        compartments to aggregate, by default cells, cytoplasm, nuclei.
+    merge_cols: List[str]
+        keys which link compartments to images.
+        By default TableNumber and ImageNumber.
+    image_table_name: str
+        image table name, by default image.
+    operation: str
+        mean or median, by default median (requires duckdb).
+    features: List[str]
+        optional features to aggregate, inferred from compartment
+        name prefixes when None.
+    compute_object_count: bool
+        whether to add Metadata_Object_Count from the first compartment
+    fields_of_view_feature: str
+        optional image column to count as Metadata_Site_Count
+    linking_cols: Dict[str, Dict[str, str]]
+        compartment linking columns which are not aggregated.
+        By default get_default_linking_cols().
+    engine: str
+        sqlite or duckdb. By default sqlite for mean aggregation of
+        SQLite files and duckdb otherwise.
+
+    Returns
+    -------
+    pd.DataFrame
+        aggregated profiles with one row per strata combination
+    """
+
+    # set defaults
+    if not strata:
+        strata = ["Image_Metadata_Plate", "Image_Metadata_Well"]
+    if not compartments:
+        compartments = ["cells", "cytoplasm", "nuclei"]
+    if not merge_cols:
+        merge_cols = ["TableNumber", "ImageNumber"]
+    if linking_cols is None:
+        linking_cols = get_default_linking_cols()
+
+    if operation not in ["mean", "median"]:
+        raise ValueError(f"Unsupported operation {operation}, use mean or median")
+
+    sql_path = str(sql_file)
+    for prefix in ["sqlite:///", "sqlite://"]:
+        if sql_path.startswith(prefix):
+            sql_path = sql_path[len(prefix) :]
+    is_duckdb_file = sql_path.endswith(".duckdb")
+
+    if engine is None:
+        engine = "sqlite" if operation == "mean" and not is_duckdb_file else "duckdb"
+    if engine == "sqlite" and (operation == "median" or is_duckdb_file):
+        raise ValueError("SQLite can only compute mean aggregates of SQLite files")
+
+    schema = ""
+    if engine == "sqlite":
+        # as_uri percent-encodes characters such as # within the path
+        connection = sqlite3.connect(
+            Path(sql_path).resolve().as_uri() + "?mode=ro", uri=True
+        )
+        read = lambda query: pd.read_sql(query, connection)
+    else:
+        import duckdb
+
+        if is_duckdb_file:
+            connection = duckdb.connect(sql_path, read_only=True)
+        else:
+            connection = duckdb.connect()
+            connection.execute("INSTALL sqlite; LOAD sqlite;")
+            # read sqlite values as text as column types are not enforced
+            connection.execute("SET sqlite_all_varchar = true;")
+            connection.execute(
+                f"ATTACH '{sql_path}' AS source (TYPE SQLITE, READ_ONLY);"
+            )
+            schema = "source."
+        read = lambda query: connection.execute(query).df()
+
+    aggregated = None
+    for compartment in compartments:
+        columns = [
+            description[0]
+            for description in connection.execute(
+                f'SELECT * FROM {schema}"{compartment}" LIMIT 0'
+            ).description
+        ]
+        compartment_df = read(
+            aggregate_query(
+                compartment=compartment,
+                features=compartment_features(
+                    columns=columns,
+                    compartment=compartment,
+                    linking_cols=linking_cols,
+                    features=features,
+                ),
+                strata=strata,
+                merge_cols=merge_cols,
+                image_table_name=image_table_name,
+                operation=operation,
+                dialect=engine,
+                compute_object_count=compute_object_count and aggregated is None,
+                schema=schema,
+            )
+        )
+        aggregated = (
+            compartment_df
+            if aggregated is None
+            else aggregated.merge(compartment_df, on=strata, how="inner")
+        )
+
+    if fields_of_view_feature and fields_of_view_feature not in strata:
+        strata_str = ", ".join(f'"{column}"' for column in strata)
+        fields_count_df = read(
+            f'SELECT {strata_str}, count("{fields_of_view_feature}") '
+            f'AS "Metadata_Site_Count" FROM {schema}"{image_table_name}" '
+            f"GROUP BY {strata_str}"
+        )
+        aggregated = fields_count_df.merge(aggregated, on=strata, how="right")
+
+    connection.close()
+
+    return aggregated
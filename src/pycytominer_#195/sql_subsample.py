@@ -0,0 +1,236 @@
+"""
+SingleCells which subsamples object keys before loading compartments,
+so subsampled merges only fetch the sampled rows of each compartment.
+
+merge_single_cells(compute_subsample=True) loads the full first
+compartment in order to call get_subsample on it. Here only the merge
+columns and ObjectNumber are read for sampling, which selects the same
+objects as SingleCells for the same subsampling_random_state as
+sampling depends only on the rows of each stratum and their order.
+Sampled keys are written to a TEMP table and each compartment is read
+by joining to it, following linking columns from compartments which
+were already loaded (for example Cytoplasm_Parent_Cells to Cells).
+
+Example:
+sc_p = SqlSubsampleSingleCells(
+    "sqlite:///SQ00014613.sqlite",
+    strata=["Image_Metadata_Plate", "Image_Metadata_Well"],
+    image_cols=["TableNumber", "ImageNumber"],
+    fields_of_view_feature=[],
+    subsample_n=100,
+    subsampling_random_state=0,
+)
+merged_sc = sc_p.merge_single_cells(compute_subsample=True)
+"""
+from typing import Dict, Optional
+
+import pandas as pd
+from pycytominer.cyto_utils.cells import SingleCells
+
+
+class SqlSubsampleSingleCells(SingleCells):
+    """
+    SingleCells which reads only sampled rows when subsampling.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+        # compartment name to keys of rows to load, set while subsampling
+        self.sampled_keys: Optional[Dict[str, pd.DataFrame]] = None
+
+    def _temp_table_name(self, compartment: str) -> str:
+        return f"sampled_keys_{compartment.lower()}"
+
+    def write_sampled_keys(self, compartment: str, keys_df: pd.DataFrame) -> str:
+        """
+        Write distinct keys of a compartment to a TEMP table.
+
+        Parameters
+        ----------
+        compartment: str
+            compartment the keys belong to
+        keys_df: pd.DataFrame
+            key columns of the rows to load
+
+        Returns
+        -------
+        str
+            name of the TEMP table
+        """
+
+        table_name = self._temp_table_name(compartment)
+        keys_df = keys_df.drop_duplicates()
+        columns_str = ", ".join(f'"{column}"' for column in keys_df.columns)
+
+        # the DBAPI connection shares TEMP tables with self.conn
+        connection = self.conn.connection
+        connection.execute(f'DROP TABLE IF EXISTS temp."{table_name}";')
+        connection.execute(
+            f'CREATE TEMP TABLE "{table_name}" ({columns_str}, '
+            f"PRIMARY KEY ({columns_str}));"
+        )
+        connection.executemany(
+            f'INSERT INTO temp."{table_name}" VALUES '
+            f"({', '.join('?' for _ in keys_df.columns)});",
+            keys_df.astype(object).itertuples(index=False, name=None),
+        )
+
+        return table_name
+
+    def sample_keys(self, compartment: str = "cells") -> pd.DataFrame:
+        """
+        Subsample object keys of a compartment per strata.
+
+        Parameters
+        ----------
+        compartment: str
+            The compartment to sample, by default cells.
+
+        Returns
+        -------
+        pd.DataFrame
+            merge columns and ObjectNumber of sampled objects
+        """
+
+        # merge columns first, as merge_single_cells merges sampled keys back on
+        key_cols = list(self.merge_cols) + ["ObjectNumber"]
+        columns_str = ", ".join(f'"{column}"' for column in key_cols)
+        # scan the table rather than an index so rows are read in the
+        # same order as "select *", which sampling depends on
+        keys_df = pd.read_sql(
+            sql=f'SELECT {columns_str} FROM "{compartment}" NOT INDEXED',
+            con=self.conn,
+        )
+
+        self.get_subsample(df=keys_df, compartment=compartment, rename_col=False)
+
+        return self.subset_data_df[key_cols]
+
+    def load_compartment(self, compartment: str) -> pd.DataFrame:
+        """
+        Creates the compartment dataframe, reading only sampled rows
+        while subsampling.
+
+        Parameters
+        ----------
+        compartment: str
+            The compartment to process.
+
+        Returns
+        -------
+        pd.DataFrame
+            Compartment dataframe.
+        """
+
+        if self.sampled_keys is None:
+            return super().load_compartment(compartment=compartment)
+
+        if compartment in self.sampled_keys:
+            keys_df = self.sampled_keys[compartment]
+        else:
+            keys_df = self._linked_keys(compartment)
+
+        table_name = self.write_sampled_keys(compartment, keys_df)
+        join_str = " AND ".join(
+            f'c."{column}" = s."{column}"' for column in keys_df.columns
+        )
+        df = pd.read_sql(
+            sql=f'SELECT c.* FROM temp."{table_name}" AS s '
+            f'JOIN "{compartment}" AS c ON {join_str}',
+            con=self.conn,
+        )
+
+        # follow the order (and any repeats) of the sampled keys
+        df = keys_df.merge(df, how="inner", on=list(keys_df.columns))[df.columns]
+
+        # keep keys of linked compartments which are loaded later
+        linking_cols = list(self.compartment_linking_cols.get(compartment, {}).values())
+        self.sampled_keys[compartment] = df[
+            list(dict.fromkeys(list(self.merge_cols) + ["ObjectNumber"] + linking_cols))
+        ]
+
+        return df
+
+    def _linked_keys(self, compartment: str) -> pd.DataFrame:
+        """
+        Find keys of a compartment from a loaded compartment linked to it.
+
+        Parameters
+        ----------
+        compartment: str
+            The compartment to find keys for.
+
+        Returns
+        -------
+        pd.DataFrame
+            merge columns and the compartment's linking column
+        """
+
+        for loaded, keys_df in self.sampled_keys.items():
+            links = self.compartment_linking_cols.get(loaded, {})
+            if compartment not in links or links[compartment] not in keys_df:
+                continue
+            right_link_col = self.compartment_linking_cols[compartment][loaded]
+
+            return keys_df[list(self.merge_cols) + [links[compartment]]].rename(
+                {links[compartment]: right_link_col}, axis="columns"
+            )
+
+        raise ValueError(
+            f"No loaded compartment links to {compartment}, "
+            "check compartment_linking_cols"
+        )
+
+    def merge_single_cells(
+        self,
+        compute_subsample: bool = False,
+        sc_output_file: str = "none",
+        compression_options: Optional[str] = None,
+        float_format: Optional[str] = None,
+        single_cell_normalize: bool = False,
+        normalize_args: Optional[Dict] = None,
+    ) -> Optional[pd.DataFrame]:
+        """
+        Given the linking columns, merge single cell data, reading
+        only sampled rows when compute_subsample is True.
+
+        Parameters
+        ----------
+        compute_subsample: bool
+            Whether or not to compute subsample.
+        sc_output_file: str
+            The name of a file to output.
+        compression_options: str
+            Compression arguments as input to pandas.to_csv()
+        float_format: str
+            Decimal precision to use in writing output file.
+        single_cell_normalize: bool
+            Whether or not to normalize the single cell data.
+        normalize_args: dict
+            Additional arguments passed as input to pycytominer.normalize().
+
+        Returns
+        -------
+        Optional[pd.DataFrame]
+            Either a dataframe (if output_file="none") or will write to file.
+        """
+
+        if compute_subsample:
+            # merge_single_cells samples the first compartment it loads
+            first_compartment = list(self.compartment_linking_cols)[0]
+            self.sampled_keys = {
+                first_compartment: self.sample_keys(compartment=first_compartment)
+            }
+
+        try:
+            return super().merge_single_cells(
+                compute_subsample=False,
+                sc_output_file=sc_output_file,
+                compression_options=compression_options,
+                float_format=float_format,
+                single_cell_normalize=single_cell_normalize,
+                normalize_args=normalize_args,
+            )
+        finally:
+            self.sampled_keys = None
@@ -0,0 +1,370 @@
+"""
+Streaming two-pass normalization of merged single cells, in place of
+merge_single_cells(single_cell_normalize=True) which normalizes a fully
+materialized plate along with a normalized copy.
+
+The first pass accumulates per-feature statistics over merged chunks and
+the second pass normalizes and writes each chunk, so memory is bounded
+by the chunk size.
+
+- standardize: exact mean and (population) variance using Welford/Chan
+  updates merged across chunks.
+- robustize and mad_robustize: median, quantiles and MAD from a
+  fixed-size reservoir sample of rows, which is exact while the reference
+  rows fit within the reservoir and approximate beyond it.
+
+Outputs match pycytominer.normalize with the same method, features and
+samples. spherize is not supported as it needs the full covariance.
+"""
+from typing import Callable, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+from parallel_output import ParallelOutputWriter
+from pycytominer.cyto_utils import infer_cp_features
+from pycytominer.cyto_utils.cells import SingleCells
+
+# scale which makes the MAD consistent with the standard deviation,
+# matching scipy's median_absolute_deviation used by RobustMAD
+MAD_NORMAL_SCALE = 1.4826
+
+
+def iter_merged_single_cells(
+    sc: SingleCells, n_aggregation_memory_strata: int = 1
+) -> Iterator[pd.DataFrame]:
+    """
+    Yield merged single cells by chunks of strata, following
+    SingleCells.merge_single_cells for each chunk.
+
+    Each compartment is read using SingleCells._compartment_df_generator,
+    which yields the same strata in the same order for every compartment.
+
+    Parameters
+    ----------
+    sc: SingleCells
+        SingleCells (or ParquetSingleCells) to merge from
+    n_aggregation_memory_strata: int
+        Number of unique strata to read into memory at once.
+
+    Yields
+    ------
+    pd.DataFrame
+        merged single cells of a chunk of strata
+    """
+
+    # Add image data to single cell dataframe
+    if not sc.load_image_data:
+        sc.load_image()
+        sc.load_image_data = True
+
+    compartments = list(
+        dict.fromkeys(
+            compartment
+            for left_compartment in sc.compartment_linking_cols
+            for compartment in [left_compartment]
+            + list(sc.compartment_linking_cols[left_compartment])
+        )
+    )
+    generators = [
+        sc._compartment_df_generator(
+            compartment=compartment,
+            n_aggregation_memory_strata=n_aggregation_memory_strata,
+        )
+        for compartment in compartments
+    ]
+
+    for compartment_dfs in zip(*generators):
+        frames = dict(zip(compartments, compartment_dfs))
+
+        # Load the single cell dataframe by merging on the specific linking columns
+        sc_df = None
+        linking_check_cols = []
+        merge_suffix_rename = []
+        for left_compartment in sc.compartment_linking_cols:
+            for right_compartment in sc.compartment_linking_cols[left_compartment]:
+                # Make sure only one merge per combination occurs
+                linking_check = "-".join(sorted([left_compartment, right_compartment]))
+                if linking_check in linking_check_cols:
+                    continue
+
+                # Specify how to indicate merge suffixes
+                merge_suffix = [f"_{left_compartment}", f"_{right_compartment}"]
+                merge_suffix_rename += merge_suffix
+                left_link_col = sc.compartment_linking_cols[left_compartment][
+                    right_compartment
+                ]
+                right_link_col = sc.compartment_linking_cols[right_compartment][
+                    left_compartment
+                ]
+
+                sc_df = (frames[left_compartment] if sc_df is None else sc_df).merge(
+                    frames[right_compartment],
+                    left_on=sc.merge_cols + [left_link_col],
+                    right_on=sc.merge_cols + [right_link_col],
+                    suffixes=merge_suffix,
+                )
+
+                linking_check_cols.append(linking_check)
+
+        # Add metadata prefix to merged suffixes
+        full_merge_suffix_rename = {}
+        for col_name in sc.merge_cols + list(sc.linking_col_rename.keys()):
+            full_merge_suffix_rename[col_name] = f"Metadata_{col_name}"
+            for suffix in set(merge_suffix_rename):
+                full_merge_suffix_rename[
+                    f"{col_name}{suffix}"
+                ] = f"Metadata_{col_name}{suffix}"
+
+        yield (
+            sc.image_df.merge(sc_df, on=sc.merge_cols, how="right")
+            .rename(sc.linking_col_rename, axis="columns")
+            .rename(full_merge_suffix_rename, axis="columns")
+        )
+
+
+class StreamingNormalizer:
+    """
+    Fit normalization statistics over chunks and normalize chunks.
+
+    Example:
+    normalizer = StreamingNormalizer(method="mad_robustize")
+    for chunk in chunks():
+        normalizer.partial_fit(chunk)
+    for chunk in chunks():
+        write(normalizer.transform(chunk))
+    """
+
+    def __init__(
+        self,
+        method: str = "standardize",
+        features: Union[str, List[str]] = "infer",
+        meta_features: Union[str, List[str]] = "infer",
+        samples: str = "all",
+        compartments: List[str] = None,
+        mad_robustize_epsilon: float = 1e-18,
+        reservoir_size: int = 1000000,
+        random_state: int = 0,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        method: str
+            standardize, robustize or mad_robustize
+        features: Union[str, List[str]]
+            feature columns, or "infer" to use infer_cp_features
+        meta_features: Union[str, List[str]]
+            metadata columns, or "infer" for Metadata_ prefixed columns
+        samples: str
+            pd.query() of reference rows for statistics, or "all"
+        compartments: List[str]
+            compartments used to infer features, by default cells,
+            cytoplasm and nuclei.
+        mad_robustize_epsilon: float
+            mad_robustize fudge factor added to the MAD
+        reservoir_size: int
+            maximum rows sampled for robustize and mad_robustize statistics
+        random_state: int
+            seed for the reservoir sample
+        """
+
+        method = method.lower()
+        avail_methods = ["standardize", "robustize", "mad_robustize"]
+        if method not in avail_methods:
+            raise ValueError(f"method must be one of {avail_methods}")
+
+        self.method = method
+        self.features = features
+        self.meta_features = meta_features
+        self.samples = samples
+        self.compartments = (
+            compartments if compartments else ["cells", "cytoplasm", "nuclei"]
+        )
+        self.mad_robustize_epsilon = mad_robustize_epsilon
+        self.reservoir_size = reservoir_size
+        self.rng = np.random.default_rng(random_state)
+
+        # running statistics
+        self.count = None
+        self.mean = None
+        self.m2 = None
+        self.reservoir = None
+        self.seen = 0
+        self.center = None
+        self.scale = None
+
+    def _resolve_columns(self, chunk: pd.DataFrame) -> None:
+        if self.features == "infer":
+            self.features = infer_cp_features(chunk, compartments=self.compartments)
+        if self.meta_features == "infer":
+            self.meta_features = infer_cp_features(chunk, metadata=True)
+
+    def partial_fit(self, chunk: pd.DataFrame) -> "StreamingNormalizer":
+        """
+        Accumulate statistics from a chunk of profiles.
+
+        Parameters
+        ----------
+        chunk: pd.DataFrame
+            chunk of profiles
+
+        Returns
+        -------
+        StreamingNormalizer
+            self
+        """
+
+        self._resolve_columns(chunk)
+        if self.samples != "all":
+            chunk = chunk.query(self.samples)
+        values = chunk.loc[:, self.features].astype(float).to_numpy()
+        if len(values) == 0:
+            return self
+
+        if self.method == "standardize":
+            # combine chunk statistics with running statistics (Chan et al.)
+            count = np.sum(~np.isnan(values), axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.where(count > 0, np.nansum(values, axis=0) / count, 0.0)
+            m2 = np.nansum((values - mean) ** 2, axis=0)
+            if self.count is None:
+                self.count, self.mean, self.m2 = count, mean, m2
+            else:
+                total = self.count + count
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    delta = mean - self.mean
+                    self.mean = np.where(
+                        total > 0, self.mean + delta * count / total, 0.0
+                    )
+                    self.m2 = np.where(
+                        total > 0,
+                        self.m2 + m2 + delta**2 * self.count * count / total,
+                        0.0,
+                    )
+                self.count = total
+        else:
+            # reservoir sample of rows (algorithm R)
+            if self.reservoir is None:
+                self.reservoir = np.empty((0, values.shape[1]))
+            fill = min(self.reservoir_size - len(self.reservoir), len(values))
+            if fill > 0:
+                self.reservoir = np.vstack([self.reservoir, values[:fill]])
+            rest = values[fill:]
+            if len(rest):
+                positions = self.seen + fill + np.arange(len(rest))
+                slots = (self.rng.random(len(rest)) * (positions + 1)).astype(int)
+                keep = slots < self.reservoir_size
+                self.reservoir[slots[keep]] = rest[keep]
+            self.seen += len(values)
+
+        return self
+
+    def finalize(self) -> "StreamingNormalizer":
+        """
+        Compute the center and scale of each feature from the
+        accumulated statistics.
+
+        Returns
+        -------
+        StreamingNormalizer
+            self
+        """
+
+        if self.method == "standardize":
+            if self.count is None:
+                raise ValueError("No reference rows were found to fit")
+            self.center = self.mean
+            with np.errstate(invalid="ignore", divide="ignore"):
+                scale = np.sqrt(self.m2 / self.count)
+            # constant features are left unscaled, as StandardScaler does
+            self.scale = np.where((scale == 0) | np.isnan(scale), 1.0, scale)
+        else:
+            if self.reservoir is None:
+                raise ValueError("No reference rows were found to fit")
+            self.center = np.nanmedian(self.reservoir, axis=0)
+            if self.method == "robustize":
+                q25, q75 = np.nanpercentile(self.reservoir, [25, 75], axis=0)
+                scale = q75 - q25
+                # constant features are left unscaled, as RobustScaler does
+                self.scale = np.where(scale == 0, 1.0, scale)
+            else:
+                mad = (
+                    np.nanmedian(np.abs(self.reservoir - self.center), axis=0)
+                    * MAD_NORMAL_SCALE
+                )
+                self.scale = mad + self.mad_robustize_epsilon
+
+        return self
+
+    def transform(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """
+        Normalize a chunk of profiles.
+
+        Parameters
+        ----------
+        chunk: pd.DataFrame
+            chunk of profiles
+
+        Returns
+        -------
+        pd.DataFrame
+            metadata columns followed by normalized features
+        """
+
+        if self.center is None:
+            self.finalize()
+
+        feature_df = pd.DataFrame(
+            (chunk.loc[:, self.features].astype(float).to_numpy() - self.center)
+            / self.scale,
+            columns=self.features,
+            index=chunk.index,
+        )
+
+        return pd.concat([chunk.loc[:, self.meta_features], feature_df], axis=1)
+
+
+def streaming_normalize(
+    chunks: Callable[[], Iterable[pd.DataFrame]],
+    output_file: str,
+    compression_options: Optional[str] = None,
+    float_format: Optional[str] = None,
+    **normalize_args,
+) -> str:
+    """
+    Normalize chunks of profiles with two passes, writing each
+    normalized chunk to a csv, parquet or Arrow file (see parallel_output.py).
+
+    Parameters
+    ----------
+    chunks: Callable[[], Iterable[pd.DataFrame]]
+        function returning a new iterable of chunks on each call,
+        for example lambda: iter_merged_single_cells(sc).
+    output_file: str
+        filepath to write, the output type is inferred from its suffix.
+    compression_options: str
+        optional compression method, see parallel_output.COMPRESSION_METHODS
+    float_format: str
+        optional printf style format for csv floats
+    **normalize_args
+        arguments of StreamingNormalizer, for example method and samples.
+
+    Returns
+    -------
+    str
+        filepath of the output
+    """
+
+    normalizer = StreamingNormalizer(**normalize_args)
+    for chunk in chunks():
+        normalizer.partial_fit(chunk)
+    normalizer.finalize()
+
+    with ParallelOutputWriter(
+        output_file,
+        float_format=float_format,
+        compression_options=compression_options,
+    ) as writer:
+        for chunk in chunks():
+            writer.write(normalizer.transform(chunk))
+
+    return output_file
@@ -0,0 +1,21 @@
+# reference https://github.com/cytomining/pycytominer/issues/195
+from parallel_output import parallel_output
+from pycytominer.cyto_utils.cells import SingleCells
+from streaming_normalize import iter_merged_single_cells
+
+sql_path = "SQ00014613.sqlite"
+sql_url = f"sqlite:///{sql_path}"
+
+sc_p = SingleCells(
+    sql_url,
+    strata=["Image_Metadata_Plate", "Image_Metadata_Well"],
+    image_cols=["TableNumber", "ImageNumber"],
+    fields_of_view_feature=[],
+)
+
+# stream merged wells into a multi-member gzip csv written in parallel blocks
+parallel_output(
+    iter_merged_single_cells(sc_p, n_aggregation_memory_strata=1),
+    "SQ00014613.csv.gz",
+    compression_options={"method": "gzip", "mtime": 1},
+)
@@ -0,0 +1,15 @@
+# reference https://github.com/cytomining/pycytominer/issues/195
+# dataset converted from SQ00014613.sqlite using DatabaseFrame.to_parquet_dataset
+# within pycytominer_#205/databaseframe_arrow_concat_dataset.py
+from parquet_single_cells import ParquetSingleCells
+
+dataset_dir = "SQ00014613_dataset"
+
+sc_p = ParquetSingleCells(
+    dataset_dir,
+    strata=["Image_Metadata_Plate", "Image_Metadata_Well"],
+    image_cols=["TableNumber", "ImageNumber"],
+    fields_of_view_feature=[],
+)
+
+merged_sc = sc_p.merge_single_cells()
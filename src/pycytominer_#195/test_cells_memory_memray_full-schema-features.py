@@ -0,0 +1,30 @@
+# reference https://github.com/cytomining/pycytominer/issues/195
+from parquet_single_cells import ParquetSingleCells
+from schema_features import (
+    dataset_schema_catalog,
+    infer_schema_features,
+    merged_features,
+)
+from streaming_normalize import iter_merged_single_cells, streaming_normalize
+
+dataset_dir = "SQ00014613_dataset"
+
+# infer features from file schemas before any data is read
+catalog = dataset_schema_catalog(dataset_dir)
+features = infer_schema_features(catalog)
+
+# read only features, keys and linking columns of each compartment
+sc_p = ParquetSingleCells(
+    dataset_dir,
+    compartment_columns=features,
+    strata=["Image_Metadata_Plate", "Image_Metadata_Well"],
+    image_cols=["TableNumber", "ImageNumber"],
+    fields_of_view_feature=[],
+)
+
+streaming_normalize(
+    lambda: iter_merged_single_cells(sc_p, n_aggregation_memory_strata=1),
+    "SQ00014613_normalized.parquet",
+    method="standardize",
+    features=merged_features(features),
+)
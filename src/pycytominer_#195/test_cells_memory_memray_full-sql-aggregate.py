@@ -0,0 +1,18 @@
+# reference https://github.com/cytomining/pycytominer/issues/195
+from sql_aggregate_profiles import sql_aggregate_profiles
+
+sql_path = "SQ00014613.sqlite"
+sql_url = f"sqlite:///{sql_path}"
+
+# mean aggregates are computed within sqlite
+mean_df = sql_aggregate_profiles(
+    sql_url, strata=["Image_Metadata_Plate", "Image_Metadata_Well"], operation="mean"
+)
+
+# median aggregates are computed within duckdb
+# (see quick-sqlite-to-duckdb-convert.py)
+median_df = sql_aggregate_profiles(
+    "SQ00014613.duckdb",
+    strata=["Image_Metadata_Plate", "Image_Metadata_Well"],
+    operation="median",
+)
@@ -0,0 +1,17 @@
+# reference https://github.com/cytomining/pycytominer/issues/195
+from sql_subsample import SqlSubsampleSingleCells
+
+sql_path = "SQ00014613.sqlite"
+sql_url = f"sqlite:///{sql_path}"
+
+sc_p = SqlSubsampleSingleCells(
+    sql_url,
+    strata=["Image_Metadata_Plate", "Image_Metadata_Well"],
+    image_cols=["TableNumber", "ImageNumber"],
+    fields_of_view_feature=[],
+    subsample_frac=0.05,
+    subsampling_random_state=0,
+)
+
+# only keys are read for sampling, then only sampled rows of each compartment
+merged_sc = sc_p.merge_single_cells(compute_subsample=True)
@@ -0,0 +1,20 @@
+# reference https://github.com/cytomining/pycytominer/issues/195
+from pycytominer.cyto_utils.cells import SingleCells
+from streaming_normalize import iter_merged_single_cells, streaming_normalize
+
+sql_path = "SQ00014613.sqlite"
+sql_url = f"sqlite:///{sql_path}"
+
+sc_p = SingleCells(
+    sql_url,
+    strata=["Image_Metadata_Plate", "Image_Metadata_Well"],
+    image_cols=["TableNumber", "ImageNumber"],
+    fields_of_view_feature=[],
+)
+
+# normalize a well at a time rather than the whole merged plate
+streaming_normalize(
+    lambda: iter_merged_single_cells(sc_p, n_aggregation_memory_strata=1),
+    "SQ00014613_normalized.parquet",
+    method="mad_robustize",
+)
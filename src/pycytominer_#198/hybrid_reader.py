@@ -0,0 +1,311 @@
+"""
+Hybrid SQLite table reader which uses ConnectorX by default and falls
+back to a vectorised sqlite3 reader only for chunks ConnectorX fails on.
+
+ConnectorX aborts a whole read when a numeric column holds text such
+as 'nan' (see filter_query within test_connectorx_filter.py and
+remove-sqlite-nans.py). Here tables are read in rowid range chunks so
+only a failing chunk is read again through sqlite3, where rows are
+fetched with fetchmany into preallocated numpy buffers typed from the
+declared column types and values which are not numbers become NaN.
+
+Example:
+reader = HybridReader("testing_SQ00014613.sqlite", chunk_size=50000)
+cells_df = reader.read_table("Cells")
+print(reader.stats)
+"""
+import sqlite3
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import connectorx as cx
+import numpy as np
+import pandas as pd
+
+
+def column_affinity(column_type: str) -> str:
+    """
+    Determine SQLite column affinity from a declared column type.
+    reference: https://www.sqlite.org/datatype3.html#determination_of_column_affinity
+
+    Parameters
+    ----------
+    column_type: str
+        declared column type, for example FLOAT or VARCHAR(10)
+
+    Returns
+    -------
+    str
+        one of INTEGER, TEXT, BLOB, REAL or NUMERIC
+    """
+
+    column_type = str(column_type).upper()
+    if "INT" in column_type:
+        return "INTEGER"
+    if any(name in column_type for name in ["CHAR", "CLOB", "TEXT"]):
+        return "TEXT"
+    if column_type == "" or "BLOB" in column_type:
+        return "BLOB"
+    if any(name in column_type for name in ["REAL", "FLOA", "DOUB"]):
+        return "REAL"
+
+    return "NUMERIC"
+
+
+def coerce_numeric(values: tuple) -> np.ndarray:
+    """
+    Convert fetched values of a numeric column to float64, with
+    missing values and text which is not a number as NaN.
+
+    Parameters
+    ----------
+    values: tuple
+        values of one column from a batch of rows
+
+    Returns
+    -------
+    np.ndarray
+        float64 values
+    """
+
+    try:
+        # None and text such as 'nan' or '1.5' convert directly
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(
+            dtype=np.float64
+        )
+
+
+class HybridReader:
+    """
+    Read SQLite tables with ConnectorX, falling back to sqlite3
+    for chunks which ConnectorX cannot read.
+    """
+
+    def __init__(
+        self,
+        sql_path: str,
+        chunk_size: int = 100000,
+        fetch_size: int = 10000,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        sql_path: str
+            filepath of the SQLite database
+        chunk_size: int
+            number of rowids within each chunk
+        fetch_size: int
+            rows fetched at once by the sqlite3 fallback
+        """
+
+        self.sql_path = sql_path
+        self.chunk_size = chunk_size
+        self.fetch_size = fetch_size
+        self.stats: Dict[str, int] = {"chunks": 0, "fallback_chunks": 0}
+
+    def table_columns(self, table_name: str) -> List[Tuple[str, str]]:
+        """
+        Collect column names and affinities of a table.
+
+        Parameters
+        ----------
+        table_name: str
+            table to describe
+
+        Returns
+        -------
+        List[Tuple[str, str]]
+            list of (column name, affinity) in table order
+        """
+
+        with sqlite3.connect(self.sql_path) as connection:
+            return [
+                (name, column_affinity(column_type))
+                for name, column_type in connection.execute(
+                    "SELECT name, type FROM pragma_table_info(?);", [table_name]
+                ).fetchall()
+            ]
+
+    def rowid_ranges(self, table_name: str) -> List[Tuple[int, int]]:
+        """
+        Split a table into inclusive rowid ranges.
+
+        Parameters
+        ----------
+        table_name: str
+            table to split
+
+        Returns
+        -------
+        List[Tuple[int, int]]
+            list of (first rowid, last rowid)
+        """
+
+        with sqlite3.connect(self.sql_path) as connection:
+            min_rowid, max_rowid = connection.execute(
+                f'SELECT min(rowid), max(rowid) FROM "{table_name}";'
+            ).fetchone()
+
+        if min_rowid is None:
+            return []
+
+        return [
+            (start, min(start + self.chunk_size - 1, max_rowid))
+            for start in range(min_rowid, max_rowid + 1, self.chunk_size)
+        ]
+
+    def read_chunk_sqlite3(
+        self,
+        query: str,
+        columns: List[Tuple[str, str]],
+        max_rows: int,
+    ) -> pd.DataFrame:
+        """
+        Read a chunk through sqlite3 into preallocated numpy buffers.
+
+        Parameters
+        ----------
+        query: str
+            SQL query of the chunk
+        columns: List[Tuple[str, str]]
+            list of (column name, affinity) selected by the query
+        max_rows: int
+            upper bound on rows returned, used to size the buffers
+
+        Returns
+        -------
+        pd.DataFrame
+            chunk with INTEGER columns as Int64, other numeric
+            columns as float64 and others as objects
+        """
+
+        numeric = [
+            affinity in ["INTEGER", "REAL", "NUMERIC"] for _, affinity in columns
+        ]
+        buffers = [
+            np.empty(max_rows, dtype=np.float64 if is_numeric else object)
+            for is_numeric in numeric
+        ]
+
+        rows = 0
+        with sqlite3.connect(self.sql_path) as connection:
+            cursor = connection.execute(query)
+            while True:
+                batch = cursor.fetchmany(self.fetch_size)
+                if not batch:
+                    break
+                for buffer, is_numeric, values in zip(buffers, numeric, zip(*batch)):
+                    buffer[rows : rows + len(batch)] = (
+                        coerce_numeric(values) if is_numeric else values
+                    )
+                rows += len(batch)
+
+        # match the dtypes ConnectorX returns for the same columns
+        data = {}
+        for (name, affinity), buffer in zip(columns, buffers):
+            values = buffer[:rows]
+            if affinity == "INTEGER":
+                # integers are exact within float64 up to 2**53
+                missing = np.isnan(values)
+                data[name] = pd.arrays.IntegerArray(
+                    np.where(missing, 0, values).astype(np.int64), missing
+                )
+            elif affinity in ["REAL", "NUMERIC"]:
+                data[name] = values
+            else:
+                data[name] = pd.Series(values, dtype=object)
+
+        return pd.DataFrame(data)
+
+    def read_chunks(
+        self, table_name: str, column_names: Optional[List[str]] = None
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Read a table in rowid range chunks.
+
+        Parameters
+        ----------
+        table_name: str
+            table to read
+        column_names: List[str]
+            optional columns to read, by default all columns
+
+        Returns
+        -------
+        Iterator[pd.DataFrame]
+            chunks of the table in rowid order
+        """
+
+        columns = [
+            column
+            for column in self.table_columns(table_name)
+            if column_names is None or column[0] in column_names
+        ]
+        columns_str = ", ".join(f'"{name}"' for name, _ in columns)
+        # ConnectorX types NUMERIC columns from their first value (Int64
+        # or float64), so every chunk reads them as float64 as the
+        # sqlite3 fallback does, keeping one dtype across chunks
+        numeric_dtypes = {
+            name: np.float64 for name, affinity in columns if affinity == "NUMERIC"
+        }
+
+        for start, end in self.rowid_ranges(table_name):
+            query = (
+                f'SELECT {columns_str} FROM "{table_name}" '
+                f"WHERE rowid BETWEEN {start} AND {end}"
+            )
+            self.stats["chunks"] += 1
+            try:
+                chunk = cx.read_sql(
+                    conn=f"sqlite://{self.sql_path}", query=query, return_type="pandas"
+                ).astype(numeric_dtypes)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except BaseException:
+                # ConnectorX raises a PanicException (a BaseException)
+                # when a value does not match the column's type
+                self.stats["fallback_chunks"] += 1
+                chunk = self.read_chunk_sqlite3(
+                    query=query, columns=columns, max_rows=end - start + 1
+                )
+
+            yield chunk
+
+    def read_table(
+        self, table_name: str, column_names: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        """
+        Read a whole table.
+
+        Parameters
+        ----------
+        table_name: str
+            table to read
+        column_names: List[str]
+            optional columns to read, by default all columns
+
+        Returns
+        -------
+        pd.DataFrame
+            the table
+        """
+
+        chunks = list(self.read_chunks(table_name, column_names=column_names))
+        if not chunks:
+            return pd.DataFrame(
+                columns=[
+                    name
+                    for name, _ in self.table_columns(table_name)
+                    if column_names is None or name in column_names
+                ]
+            )
+
+        return pd.concat(chunks, ignore_index=True)
+
+
+if __name__ == "__main__":
+    reader = HybridReader("testing_SQ00014613.sqlite", chunk_size=50000)
+    for compartment in ["Image", "Cells", "Cytoplasm", "Nuclei"]:
+        print(compartment, reader.read_table(compartment).shape)
+    print(reader.stats)
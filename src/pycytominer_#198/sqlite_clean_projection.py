@@ -0,0 +1,339 @@
+"""
+Coerce dirty values while reading instead of mutating the source SQLite.
+
+remove-sqlite-nans.py and connectorx-sqlite-compatability.py UPDATE and
+rebuild tables to remove 'nan' text from numeric columns, which takes
+hours, doubles disk usage during rebuilds and modifies archival data.
+Here a linter scans each table once to flag numeric columns holding
+text or blob values, and a per-table projection replaces those values
+with NULL (CASE WHEN typeof(col) IN ('text', 'blob') THEN NULL ...)
+for flagged columns only. Projections are read through ConnectorX or
+as TEMP VIEWs on a read-only connection, so the source stays unchanged.
+
+Example:
+python sqlite_clean_projection.py testing_SQ00014613.sqlite --output lint.json
+"""
+import argparse
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import connectorx as cx
+import pandas as pd
+from hybrid_reader import HybridReader, column_affinity
+
+# affinities of columns which should only hold numbers
+NUMERIC_AFFINITIES = ["INTEGER", "REAL", "NUMERIC"]
+
+# columns checked within one query, below SQLite's default
+# limit of 2000 result columns (SQLITE_MAX_COLUMN)
+LINT_COLUMNS_PER_QUERY = 1000
+
+
+def connect_read_only(sql_path: str) -> sqlite3.Connection:
+    """
+    Open a read-only connection, where TEMP VIEWs may still be created
+    as they are kept within the separate temp database.
+
+    Parameters
+    ----------
+    sql_path: str
+        filepath of the SQLite database
+
+    Returns
+    -------
+    sqlite3.Connection
+        read-only connection
+    """
+
+    # as_uri percent-encodes characters such as # and ? which SQLite
+    # would otherwise read as the start of a fragment or query
+    return sqlite3.connect(Path(sql_path).resolve().as_uri() + "?mode=ro", uri=True)
+
+
+def table_columns(connection: sqlite3.Connection, table_name: str) -> List[tuple]:
+    """
+    Collect column names and affinities of a table.
+
+    Parameters
+    ----------
+    connection: sqlite3.Connection
+        connection to the database
+    table_name: str
+        table to describe
+
+    Returns
+    -------
+    List[tuple]
+        list of (column name, affinity) in table order
+    """
+
+    return [
+        (name, column_affinity(column_type))
+        for name, column_type in connection.execute(
+            "SELECT name, type FROM pragma_table_info(?);", [table_name]
+        ).fetchall()
+    ]
+
+
+def lint_table(sql_path: str, table_name: str) -> Dict[str, int]:
+    """
+    Count text and blob values within numeric columns of a table,
+    checking all columns during a single scan of the table.
+
+    Parameters
+    ----------
+    sql_path: str
+        filepath of the SQLite database
+    table_name: str
+        table to lint
+
+    Returns
+    -------
+    Dict[str, int]
+        flagged column name to number of dirty values
+    """
+
+    connection = connect_read_only(sql_path)
+    numeric_columns = [
+        name
+        for name, affinity in table_columns(connection, table_name)
+        if affinity in NUMERIC_AFFINITIES
+    ]
+
+    flagged = {}
+    for start in range(0, len(numeric_columns), LINT_COLUMNS_PER_QUERY):
+        columns = numeric_columns[start : start + LINT_COLUMNS_PER_QUERY]
+        counts = connection.execute(
+            "SELECT "
+            + ", ".join(
+                f"""total(typeof("{name}") IN ('text', 'blob'))""" for name in columns
+            )
+            + f' FROM "{table_name}";'
+        ).fetchone()
+        flagged.update(
+            {name: int(count) for name, count in zip(columns, counts) if count}
+        )
+    connection.close()
+
+    return flagged
+
+
+def lint_database(
+    sql_path: str, workers: Optional[int] = None
+) -> Dict[str, Dict[str, int]]:
+    """
+    Lint all tables of a database in parallel.
+
+    Parameters
+    ----------
+    sql_path: str
+        filepath of the SQLite database
+    workers: int
+        number of tables linted at once, by default
+        ThreadPoolExecutor's default.
+
+    Returns
+    -------
+    Dict[str, Dict[str, int]]
+        table name to flagged columns, see lint_table
+    """
+
+    connection = connect_read_only(sql_path)
+    table_names = [
+        name
+        for (name,) in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name NOT LIKE 'sqlite_%' ORDER BY name;"
+        ).fetchall()
+    ]
+    connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(
+            zip(
+                table_names,
+                executor.map(lambda name: lint_table(sql_path, name), table_names),
+            )
+        )
+
+
+def clean_projection(
+    sql_path: str,
+    table_name: str,
+    flagged: Dict[str, int],
+    columns: Optional[List[str]] = None,
+    mode: str = "null",
+) -> str:
+    """
+    Create a SELECT statement which reads a table with dirty values
+    of flagged columns replaced while reading.
+
+    Parameters
+    ----------
+    sql_path: str
+        filepath of the SQLite database
+    table_name: str
+        table to select from
+    flagged: Dict[str, int]
+        flagged columns of the table, see lint_table
+    columns: List[str]
+        optional columns to select, by default all columns
+    mode: str
+        "null" replaces text and blob values with NULL. "cast" uses
+        CAST(col AS REAL), which keeps numeric text such as '1.5'
+        though other text (including 'nan') becomes 0.0.
+
+    Returns
+    -------
+    str
+        SQL SELECT statement
+    """
+
+    if mode not in ["null", "cast"]:
+        raise ValueError(f"Unknown mode {mode}, select one of null or cast")
+
+    connection = connect_read_only(sql_path)
+    names = [
+        name
+        for name, _ in table_columns(connection, table_name)
+        if columns is None or name in columns
+    ]
+    connection.close()
+
+    selects = []
+    for name in names:
+        if name not in flagged:
+            selects.append(f'"{name}"')
+        elif mode == "null":
+            selects.append(
+                f"""CASE WHEN typeof("{name}") IN ('text', 'blob') """
+                f'THEN NULL ELSE "{name}" END AS "{name}"'
+            )
+        else:
+            selects.append(f'CAST("{name}" AS REAL) AS "{name}"')
+
+    return f"SELECT {', '.join(selects)} FROM \"{table_name}\""
+
+
+def create_clean_views(
+    connection: sqlite3.Connection,
+    sql_path: str,
+    lint: Dict[str, Dict[str, int]],
+    prefix: str = "clean_",
+) -> List[str]:
+    """
+    Create a TEMP VIEW of the clean projection of each table, for
+    example on a connection from connect_read_only.
+
+    Parameters
+    ----------
+    connection: sqlite3.Connection
+        connection to create the views on
+    sql_path: str
+        filepath of the SQLite database
+    lint: Dict[str, Dict[str, int]]
+        flagged columns by table, see lint_database
+    prefix: str
+        prefix of the view names
+
+    Returns
+    -------
+    List[str]
+        names of the created views
+    """
+
+    views = []
+    for table_name, flagged in lint.items():
+        view_name = f"{prefix}{table_name}"
+        connection.execute(f'DROP VIEW IF EXISTS temp."{view_name}";')
+        connection.execute(
+            f'CREATE TEMP VIEW "{view_name}" AS '
+            f"{clean_projection(sql_path, table_name, flagged)};"
+        )
+        views.append(view_name)
+
+    return views
+
+
+def read_clean_table(
+    sql_path: str,
+    table_name: str,
+    flagged: Dict[str, int],
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """
+    Read a table through ConnectorX using its clean projection.
+
+    ConnectorX infers the types of projected (CASE) columns from their
+    first row and fails when it is null, for example when the first
+    value of a flagged column is dirty. The projection is then read
+    through sqlite3 using HybridReader.read_chunk_sqlite3 instead.
+
+    Parameters
+    ----------
+    sql_path: str
+        filepath of the SQLite database
+    table_name: str
+        table to read
+    flagged: Dict[str, int]
+        flagged columns of the table, see lint_table
+    columns: List[str]
+        optional columns to read, by default all columns
+
+    Returns
+    -------
+    pd.DataFrame
+        the table with dirty values as nulls
+    """
+
+    query = clean_projection(sql_path, table_name, flagged, columns=columns)
+    try:
+        return cx.read_sql(
+            conn=f"sqlite://{sql_path}", query=query, return_type="pandas"
+        )
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except BaseException:
+        # ConnectorX raises a RuntimeError (or a PanicException,
+        # a BaseException) when it cannot type a column
+        pass
+
+    connection = connect_read_only(sql_path)
+    selected_columns = [
+        column
+        for column in table_columns(connection, table_name)
+        if columns is None or column[0] in columns
+    ]
+    (max_rows,) = connection.execute(f'SELECT count(*) FROM "{table_name}";').fetchone()
+    connection.close()
+
+    return HybridReader(sql_path).read_chunk_sqlite3(
+        query=query, columns=selected_columns, max_rows=max_rows
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Lint numeric columns of a SQLite database for dirty values."
+    )
+    parser.add_argument("sql_path")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default=None, help="filepath of JSON results")
+    args = parser.parse_args()
+
+    lint = lint_database(args.sql_path, workers=args.workers)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(lint, output_file, indent=2)
+
+    for table_name, flagged in lint.items():
+        print(
+            f"{table_name}: {len(flagged)} flagged columns, "
+            f"{sum(flagged.values())} dirty values"
+        )
+        for name, count in flagged.items():
+            print(f"  {name}: {count}")
@@ -0,0 +1,49 @@
+import types
+
+from hybrid_reader import HybridReader
+from pycytominer.cyto_utils.cells import SingleCells
+
+# reference https://github.com/cytomining/pycytominer/issues/195
+# shrunk file for quicker testing as per work within shrink-demo-file.ipynb
+# (uncleaned, so chunks with 'nan' text fall back to sqlite3)
+sql_path = "testing_SQ00014613.sqlite"
+sql_url = "sqlite:///testing_SQ00014613.sqlite"
+
+reader = HybridReader(sql_path, chunk_size=50000)
+
+
+def new_load_compartment(self, compartment):
+    """Creates the compartment dataframe.
+
+    Parameters
+    ----------
+    compartment : str
+        The compartment to process.
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+        Compartment dataframe.
+    """
+
+    return reader.read_table(compartment)
+
+
+def mem_profile_func():
+    """
+    wrapper function for memory profiling
+    """
+
+    sc_p = SingleCells(
+        sql_url,
+        strata=["Image_Metadata_Plate", "Image_Metadata_Well"],
+        image_cols=["TableNumber", "ImageNumber"],
+        fields_of_view_feature=[],
+    )
+    # load new_load_compartment as ap's load_compartment function for profiling
+    sc_p.load_compartment = types.MethodType(new_load_compartment, sc_p)
+    return sc_p.merge_single_cells()
+
+
+print(mem_profile_func().info())
+print(reader.stats)
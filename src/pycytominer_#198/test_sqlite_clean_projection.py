@@ -0,0 +1,36 @@
+"""
+Check reading clean projections through sqlite_clean_projection.py,
+including a table whose flagged column has a dirty first row which
+ConnectorX cannot infer a type from, and a database within a directory
+whose name holds a #.
+"""
+import math
+import os
+import sqlite3
+import tempfile
+
+from sqlite_clean_projection import lint_database, read_clean_table
+
+sql_dir = os.path.join(tempfile.mkdtemp(), "pycytominer_#198")
+os.makedirs(sql_dir)
+sql_path = os.path.join(sql_dir, "dirty_first_row.sqlite")
+with sqlite3.connect(sql_path) as connection:
+    connection.execute(
+        "CREATE TABLE Cells (ImageNumber INTEGER, ObjectNumber INTEGER, "
+        "Cells_Feature REAL, Cells_Label TEXT);"
+    )
+    connection.executemany(
+        "INSERT INTO Cells VALUES (?, ?, ?, ?);",
+        [(1, 1, "nan", "a"), (1, 2, 2.5, "b"), (2, 1, None, None)],
+    )
+
+lint = lint_database(sql_path)
+print(lint)
+assert lint == {"Cells": {"Cells_Feature": 1}}
+
+cells_df = read_clean_table(sql_path, "Cells", lint["Cells"])
+print(cells_df)
+assert cells_df.shape == (3, 4)
+assert math.isnan(cells_df["Cells_Feature"][0])
+assert cells_df["Cells_Feature"][1] == 2.5
+assert list(cells_df["Cells_Label"][:2]) == ["a", "b"]
@@ -0,0 +1,392 @@
+"""
+Convert many SQLite plates to parquet using a process pool which is
+scheduled by a global memory budget and each plate's estimated cost.
+
+Plates are found by glob patterns or a manifest (one filepath per
+line) and estimated with sqlite_estimate.py before reading data.
+Plates are started largest first (LPT scheduling) to shorten the
+overall runtime, and smaller plates fill remaining capacity while
+their estimated peak memory fits within the budget (checked against
+both reservations and the measured RSS of running workers). Each plate
+is exported in rowid range chunks sized to its share of the budget
+(see databaseframe_arrow_concat_rowid_chunks.py). Plates which share a
+filename are written to outputs suffixed by a hash of their filepath.
+Results and failures of every plate are collected into one JSON report.
+
+Example:
+python batch_convert.py "plates/SQ000*.sqlite" --output-dir ./data \
+    --memory-budget 64GB --processes 8 --report batch_report.json
+"""
+import argparse
+import collections
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+from sqlite_estimate import (
+    CHUNK_PEAK_FACTOR,
+    estimate,
+    format_bytes,
+    memory_budget_default,
+    parse_bytes,
+)
+
+# bounds on rowids per chunk when sizing chunks from a memory share
+MIN_CHUNK_ROWS = 1000
+MAX_CHUNK_ROWS = 1000000
+
+
+def find_plates(
+    patterns: Optional[List[str]] = None, manifest: Optional[str] = None
+) -> List[str]:
+    """
+    Find plate filepaths from glob patterns and an optional manifest.
+
+    Parameters
+    ----------
+    patterns: List[str]
+        glob patterns such as plates/SQ000*.sqlite
+    manifest: str
+        optional text file of one filepath per line, where blank
+        lines and lines starting with # are skipped.
+
+    Returns
+    -------
+    List[str]
+        distinct plate filepaths
+    """
+
+    sql_paths = []
+    for pattern in patterns or []:
+        sql_paths += sorted(glob.glob(pattern))
+
+    if manifest:
+        with open(manifest, "r") as manifest_file:
+            sql_paths += [
+                line.strip()
+                for line in manifest_file
+                if line.strip() and not line.strip().startswith("#")
+            ]
+
+    return list(dict.fromkeys(sql_paths))
+
+
+def plan_plate(sql_path: str, output_dir: str, plate_budget: int, threads: int) -> Dict:
+    """
+    Estimate a plate's cost and size its chunks to a memory share.
+
+    Parameters
+    ----------
+    sql_path: str
+        filepath of the SQLite plate
+    output_dir: str
+        directory to write the plate's parquet file into
+    plate_budget: int
+        bytes of memory a single plate may use
+    threads: int
+        parallel chunk readers within the plate
+
+    Returns
+    -------
+    Dict
+        plan with the plate's cost, reserved bytes and chunk size
+    """
+
+    plate_estimate = estimate(
+        sql_path=sql_path, memory_budget=plate_budget, cpu_count=threads
+    )
+    row_bytes = plate_estimate["in_memory_bytes"]["arrow_concat"] / max(
+        plate_estimate["concat_rows"], 1
+    )
+    # readers keep up to two chunks each in flight
+    chunk_rows = int(
+        plate_budget // max(threads * 2 * row_bytes * CHUNK_PEAK_FACTOR, 1)
+    )
+
+    return {
+        "sql_path": sql_path,
+        "output_path": os.path.join(
+            output_dir,
+            f"{os.path.splitext(os.path.basename(sql_path))[0]}.parquet",
+        ),
+        # estimated work, used for largest first ordering
+        "cost": plate_estimate["in_memory_bytes"]["arrow_concat"],
+        # estimated peak memory, small plates reserve less than their share
+        "reserved_bytes": int(
+            min(
+                plate_budget,
+                plate_estimate["in_memory_bytes"]["arrow_concat"] * CHUNK_PEAK_FACTOR,
+            )
+        ),
+        "chunk_size": max(MIN_CHUNK_ROWS, min(MAX_CHUNK_ROWS, chunk_rows)),
+        "threads": threads,
+    }
+
+
+def distinct_output_paths(plans: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Rename outputs of plates which share a filename (for example
+    p1/A.sqlite and p2/A.sqlite) so one does not overwrite the other.
+
+    Parameters
+    ----------
+    plans: List[Dict]
+        plans of the plates, see plan_plate
+
+    Returns
+    -------
+    Tuple[List[Dict], List[Dict]]
+        plans with distinct output paths, where colliding outputs are
+        suffixed by a hash of the plate's filepath, and failed results
+        of plates which are the same file as an earlier plate.
+    """
+
+    counts = collections.Counter(plan["output_path"] for plan in plans)
+    distinct = {}
+    duplicates = []
+    for plan in plans:
+        output_path = plan["output_path"]
+        if counts[output_path] > 1:
+            stem, extension = os.path.splitext(output_path)
+            digest = hashlib.sha1(
+                os.path.realpath(plan["sql_path"]).encode()
+            ).hexdigest()[:8]
+            output_path = f"{stem}-{digest}{extension}"
+
+        if output_path in distinct:
+            duplicates.append(
+                {
+                    "sql_path": plan["sql_path"],
+                    "status": "failed",
+                    "error": (
+                        f"Same plate as {distinct[output_path]['sql_path']}, "
+                        f"both writing {output_path}"
+                    ),
+                }
+            )
+            continue
+        distinct[output_path] = {**plan, "output_path": output_path}
+
+    return list(distinct.values()), duplicates
+
+
+def convert_plate(plan: Dict) -> Dict:
+    """
+    Convert one plate within a worker process.
+
+    Parameters
+    ----------
+    plan: Dict
+        plan of the plate, see plan_plate
+
+    Returns
+    -------
+    Dict
+        plan along with seconds, peak_rss and output_bytes
+    """
+
+    # imported within workers so the scheduler stays light
+    from databaseframe_arrow_concat_rowid_chunks import DatabaseFrame
+    from stage_metrics import peak_rss, reset_peak_rss
+
+    reset_peak_rss()
+    start = time.perf_counter()
+    DatabaseFrame(engine=f"sqlite:///{plan['sql_path']}").to_parquet(
+        filename=plan["output_path"],
+        chunk_size=plan["chunk_size"],
+        workers=plan["threads"],
+    )
+
+    return {
+        **plan,
+        "status": "ok",
+        "seconds": time.perf_counter() - start,
+        "peak_rss": peak_rss(),
+        "output_bytes": os.path.getsize(plan["output_path"]),
+    }
+
+
+def workers_rss() -> int:
+    """
+    Measured resident set size of this process's child processes.
+
+    Returns
+    -------
+    int
+        summed resident set size in bytes
+    """
+
+    total = 0
+    for process in multiprocessing.active_children():
+        try:
+            with open(f"/proc/{process.pid}/statm", "r") as statm:
+                total += int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            continue
+
+    return total
+
+
+def batch_convert(
+    sql_paths: List[str],
+    output_dir: str,
+    memory_budget: Optional[int] = None,
+    processes: Optional[int] = None,
+    report_path: Optional[str] = None,
+) -> Dict:
+    """
+    Convert plates to parquet using a memory aware process pool.
+
+    Parameters
+    ----------
+    sql_paths: List[str]
+        filepaths of the SQLite plates
+    output_dir: str
+        directory to write one parquet file per plate into
+    memory_budget: int
+        global memory budget in bytes, by default half of physical memory.
+    processes: int
+        maximum plates converted at once, by default os.cpu_count().
+    report_path: str
+        optional filepath to write the JSON report to
+
+    Returns
+    -------
+    Dict
+        report with results of each plate and overall totals
+    """
+
+    if memory_budget is None:
+        memory_budget = memory_budget_default()
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+
+    plate_budget = memory_budget // processes
+    threads = max(1, (os.cpu_count() or 1) // processes)
+    results = []
+    pending = []
+    for sql_path in sql_paths:
+        try:
+            pending.append(plan_plate(sql_path, output_dir, plate_budget, threads))
+        except Exception as error:
+            results.append(
+                {"sql_path": sql_path, "status": "failed", "error": repr(error)}
+            )
+
+    pending, duplicates = distinct_output_paths(pending)
+    results += duplicates
+
+    # largest first (LPT)
+    pending.sort(key=lambda plan: plan["cost"], reverse=True)
+
+    executor_options = {"max_workers": processes}
+    if sys.version_info >= (3, 11):
+        # fresh workers per plate so peak_rss and memory are per plate
+        executor_options["max_tasks_per_child"] = 1
+
+    running: Dict[Future, Dict] = {}
+    with ProcessPoolExecutor(**executor_options) as executor:
+        while pending or running:
+            reserved = sum(plan["reserved_bytes"] for plan in running.values())
+            measured = workers_rss()
+            for plan in list(pending):
+                if len(running) >= processes:
+                    break
+                fits = max(reserved, measured) + plan["reserved_bytes"] <= memory_budget
+                # always run something so a plate over budget cannot stall the batch
+                if fits or not running:
+                    running[executor.submit(convert_plate, plan)] = plan
+                    pending.remove(plan)
+                    reserved += plan["reserved_bytes"]
+                    measured += plan["reserved_bytes"]
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                plan = running.pop(future)
+                try:
+                    results.append(future.result())
+                except Exception as error:
+                    results.append(
+                        {
+                            **plan,
+                            "status": "failed",
+                            "error": repr(error),
+                            "traceback": "".join(
+                                traceback.format_exception(
+                                    type(error), error, error.__traceback__
+                                )
+                            ),
+                        }
+                    )
+
+    report = {
+        "memory_budget": memory_budget,
+        "processes": processes,
+        "seconds": time.perf_counter() - start,
+        "plates": len(sql_paths),
+        "succeeded": sum(result["status"] == "ok" for result in results),
+        "failed": sum(result["status"] == "failed" for result in results),
+        "max_peak_rss": max(
+            (result.get("peak_rss", 0) for result in results), default=0
+        ),
+        "results": results,
+    }
+
+    if report_path:
+        with open(report_path, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert many SQLite plates to parquet."
+    )
+    parser.add_argument(
+        "patterns", nargs="*", help="glob patterns of plates such as SQ000*.sqlite"
+    )
+    parser.add_argument("--manifest", default=None, help="file of plate filepaths")
+    parser.add_argument("--output-dir", default="./data")
+    parser.add_argument(
+        "--memory-budget",
+        type=parse_bytes,
+        default=None,
+        help="memory budget such as 64GB, by default half of physical memory",
+    )
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--report", default="batch_report.json")
+    args = parser.parse_args()
+
+    report = batch_convert(
+        sql_paths=find_plates(patterns=args.patterns, manifest=args.manifest),
+        output_dir=args.output_dir,
+        memory_budget=args.memory_budget,
+        processes=args.processes,
+        report_path=args.report,
+    )
+
+    for result in report["results"]:
+        print(
+            f"{result['status']}: {result['sql_path']} "
+            + (
+                f"{result['seconds']:.2f}s peak {format_bytes(result['peak_rss'])}"
+                if result["status"] == "ok"
+                else result["error"]
+            )
+        )
+    print(
+        f"{report['succeeded']} of {report['plates']} plates converted "
+        f"in {report['seconds']:.2f}s ({report['failed']} failed)"
+    )
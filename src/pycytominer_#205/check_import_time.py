@@ -0,0 +1,181 @@
+"""
+Check import times of modules against a budget using python -X importtime.
+
+Each module is imported within a fresh interpreter so nothing is
+already cached, several times with the fastest import kept so that
+scheduling noise does not fail the check. A module fails when its
+cumulative import time is over the budget or when it imports a backend
+from engines.HEAVY_BACKENDS which it does not need (engine modules may
+import their own backends).
+
+Example:
+python check_import_time.py engines task_cache stage_metrics --budget-ms 100
+python check_import_time.py --engines
+"""
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+from engines import ENGINES, HEAVY_BACKENDS
+
+# default import time budgets in milliseconds. Light modules measured
+# 16-60ms (fastest of 5 imports) on a single cpu, so the budget leaves
+# over half again the slowest of them.
+LIGHT_BUDGET_MS = 100
+ENGINE_BUDGET_MS = 3000
+
+# imports of each module, of which the fastest is checked
+REPEAT_DEFAULT = 5
+
+# modules which should import without any heavy backends. batch_convert
+# is left out as it imports process pools (concurrent.futures.process
+# and multiprocessing) by design.
+LIGHT_MODULES = [
+    "engines",
+    "task_cache",
+    "stage_metrics",
+    "chunk_pipeline",
+    "chunk_executor",
+    "sqlite_estimate",
+]
+
+
+def import_times(module: str, python: str = sys.executable) -> Dict[str, int]:
+    """
+    Import a module within a fresh interpreter and collect the
+    cumulative import time of each imported package.
+
+    Parameters
+    ----------
+    module: str
+        module to import
+    python: str
+        python executable, by default the current one
+
+    Returns
+    -------
+    Dict[str, int]
+        imported package name to cumulative import time in microseconds
+    """
+
+    completed = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    times = {}
+    # lines are similar to: import time:       123 |        456 |   package
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, package = line[len("import time:") :].split("|")
+        times[package.strip()] = int(cumulative)
+
+    return times
+
+
+def check_import_time(
+    module: str,
+    budget_ms: float,
+    allowed_backends: Optional[List[str]] = None,
+    repeat: int = REPEAT_DEFAULT,
+) -> Dict:
+    """
+    Check a module's import time and imported backends.
+
+    Parameters
+    ----------
+    module: str
+        module to import
+    budget_ms: float
+        maximum cumulative import time in milliseconds
+    allowed_backends: List[str]
+        backends the module may import, by default none
+    repeat: int
+        number of imports, of which the fastest is checked
+
+    Returns
+    -------
+    Dict
+        result with module, import_ms, heavy_backends and passed keys
+    """
+
+    runs = [import_times(module) for _ in range(max(repeat, 1))]
+    times = min(runs, key=lambda run: run[module])
+    import_ms = times[module] / 1000
+    heavy_backends = sorted(
+        {package.split(".")[0] for package in times}
+        & (set(HEAVY_BACKENDS) - set(allowed_backends or []))
+    )
+
+    return {
+        "module": module,
+        "import_ms": import_ms,
+        "heavy_backends": heavy_backends,
+        "passed": import_ms <= budget_ms and not heavy_backends,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check module import times against a budget."
+    )
+    parser.add_argument("modules", nargs="*", default=LIGHT_MODULES)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=None,
+        help="import time budget of each module in milliseconds, by default "
+        f"{LIGHT_BUDGET_MS} or {ENGINE_BUDGET_MS} with --engines",
+    )
+    parser.add_argument(
+        "--engines",
+        action="store_true",
+        help="check engine modules whose backends are installed instead, "
+        "allowing only their own backends",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=REPEAT_DEFAULT,
+        help="imports of each module, of which the fastest is checked",
+    )
+    args = parser.parse_args()
+
+    budget_ms = args.budget_ms
+    if budget_ms is None:
+        budget_ms = ENGINE_BUDGET_MS if args.engines else LIGHT_BUDGET_MS
+
+    if args.engines:
+        checks = [
+            (engine["module"], engine["backends"])
+            for engine in ENGINES.values()
+            if all(importlib.util.find_spec(backend) for backend in engine["backends"])
+        ]
+    else:
+        checks = [(module, []) for module in args.modules]
+
+    results = [
+        check_import_time(
+            module, budget_ms=budget_ms, allowed_backends=allowed, repeat=args.repeat
+        )
+        for module, allowed in checks
+    ]
+    for result in results:
+        print(
+            f"{'ok' if result['passed'] else 'FAILED'}: {result['module']} "
+            f"{result['import_ms']:.1f}ms"
+            + (
+                f" imports {', '.join(result['heavy_backends'])}"
+                if result["heavy_backends"]
+                else ""
+            )
+        )
+
+    sys.exit(0 if all(result["passed"] for result in results) else 1)
@@ -0,0 +1,436 @@
+"""
+Chunk executor with worker process recycling and Arrow memory pool
+selection, for long chunk loops whose RSS creeps upward through
+allocator fragmentation even though each chunk is discarded.
+
+Each worker process selects an Arrow memory pool backend (jemalloc,
+mimalloc or system) and releases unused pool memory back to the
+operating system after every chunk. Workers exit and are replaced by
+fresh processes after a number of chunks or once their RSS passes a
+limit, returning all of their memory at once. Per-chunk RSS and pool
+statistics along with recycling counts are kept for the run report.
+
+Chunks are assigned to workers through a queue per worker, so chunks
+held by a worker which dies (for example killed for running out of
+memory) are known. They are assigned again to a replacement worker, and
+the chunk which was running fails once it has been retried
+max_chunk_retries times.
+
+Example:
+executor = ChunkExecutor(
+    task=export_chunk, processes=2, max_chunks_per_worker=20,
+    max_rss_bytes=4 * 1024**3, arrow_pool="jemalloc",
+)
+results = executor.run(chunks)
+executor.to_json("chunk_report.json")
+"""
+import collections
+import json
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from stage_metrics import current_rss, peak_rss
+
+# arrow memory pool backends in order of preference
+ARROW_POOLS = ["jemalloc", "mimalloc", "system"]
+
+
+def set_arrow_pool(arrow_pool: Optional[str] = None) -> Optional[str]:
+    """
+    Select the default Arrow memory pool of this process.
+
+    Parameters
+    ----------
+    arrow_pool: str
+        jemalloc, mimalloc or system. The first available backend
+        from ARROW_POOLS is used when the requested backend was not
+        built into pyarrow. None leaves the default pool.
+
+    Returns
+    -------
+    Optional[str]
+        backend name of the default memory pool
+    """
+
+    import pyarrow as pa
+
+    if arrow_pool is not None:
+        for backend in [arrow_pool] + ARROW_POOLS:
+            try:
+                pa.set_memory_pool(getattr(pa, f"{backend}_memory_pool")())
+                break
+            except (NotImplementedError, AttributeError):
+                continue
+
+    return pa.default_memory_pool().backend_name
+
+
+def release_memory() -> None:
+    """
+    Return unused memory of the Arrow pool (and glibc's heap
+    where available) to the operating system.
+    """
+
+    import pyarrow as pa
+
+    pa.default_memory_pool().release_unused()
+
+    try:
+        import ctypes
+
+        # returns freed glibc heap pages, used by pandas and numpy
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def _worker(
+    task: Callable[[Any], Any],
+    arrow_pool: Optional[str],
+    release_between_chunks: bool,
+    max_chunks_per_worker: Optional[int],
+    max_rss_bytes: Optional[int],
+    tasks: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+) -> None:
+    """
+    Worker process loop which runs chunks from its own tasks queue
+    until told to stop or until it should be recycled.
+    """
+
+    backend = set_arrow_pool(arrow_pool)
+
+    import pyarrow as pa
+
+    completed = 0
+    while True:
+        item = tasks.get()
+        if item is None:
+            break
+        index, chunk = item
+
+        start = time.perf_counter()
+        error = None
+        result = None
+        try:
+            result = task(chunk)
+        except Exception as exception:
+            error = "".join(
+                traceback.format_exception(
+                    type(exception), exception, exception.__traceback__
+                )
+            )
+
+        pool = pa.default_memory_pool()
+        pool_bytes = pool.bytes_allocated()
+        if release_between_chunks:
+            release_memory()
+        completed += 1
+        rss = current_rss()
+
+        recycle = None
+        if max_chunks_per_worker and completed >= max_chunks_per_worker:
+            recycle = "chunks"
+        elif max_rss_bytes and rss >= max_rss_bytes:
+            recycle = "rss"
+
+        results.put(
+            (
+                index,
+                result,
+                error,
+                {
+                    "chunk": index,
+                    "pid": os.getpid(),
+                    "seconds": time.perf_counter() - start,
+                    "rss": rss,
+                    "peak_rss": peak_rss(),
+                    "arrow_backend": backend,
+                    "arrow_pool_bytes": pool_bytes,
+                    "arrow_pool_max": pool.max_memory(),
+                    "recycle": recycle,
+                },
+            )
+        )
+        if recycle:
+            break
+
+
+class ChunkExecutor:
+    """
+    Run a task over chunks within recycled worker processes,
+    returning results in chunk order.
+    """
+
+    def __init__(
+        self,
+        task: Callable[[Any], Any],
+        processes: int = 1,
+        max_chunks_per_worker: Optional[int] = None,
+        max_rss_bytes: Optional[int] = None,
+        arrow_pool: Optional[str] = None,
+        release_between_chunks: bool = True,
+        start_method: Optional[str] = None,
+        max_chunk_retries: int = 1,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        task: Callable[[Any], Any]
+            picklable (module-level) function called with each chunk
+        processes: int
+            number of worker processes
+        max_chunks_per_worker: int
+            optional number of chunks after which a worker is replaced
+        max_rss_bytes: int
+            optional RSS in bytes after which a worker is replaced
+        arrow_pool: str
+            optional Arrow memory pool backend, see set_arrow_pool
+        release_between_chunks: bool
+            whether workers release unused memory after each chunk
+        start_method: str
+            optional multiprocessing start method, for example spawn
+        max_chunk_retries: int
+            number of times a chunk is run again after its worker
+            exited while running it, before the chunk fails
+        """
+
+        self.task = task
+        self.processes = processes
+        self.max_chunks_per_worker = max_chunks_per_worker
+        self.max_rss_bytes = max_rss_bytes
+        self.arrow_pool = arrow_pool
+        self.release_between_chunks = release_between_chunks
+        self.context = multiprocessing.get_context(start_method)
+        self.max_chunk_retries = max_chunk_retries
+
+        self.chunk_stats: List[Dict] = []
+        self.workers_started = 0
+        self.workers_lost = 0
+        self.wall_time = None
+
+    def _start_worker(self, results: multiprocessing.Queue) -> Dict:
+        tasks = self.context.Queue()
+        process = self.context.Process(
+            target=_worker,
+            args=(
+                self.task,
+                self.arrow_pool,
+                self.release_between_chunks,
+                self.max_chunks_per_worker,
+                self.max_rss_bytes,
+                tasks,
+                results,
+            ),
+            daemon=True,
+        )
+        process.start()
+        self.workers_started += 1
+
+        # indices of chunks sent to the worker, the first is running
+        return {"process": process, "tasks": tasks, "assigned": []}
+
+    def run(self, chunks: Iterable[Any]) -> List[Any]:
+        """
+        Run the task over all chunks.
+
+        Parameters
+        ----------
+        chunks: Iterable[Any]
+            picklable chunks, for example lists of basis dictionaries
+
+        Returns
+        -------
+        List[Any]
+            task results in chunk order. The first task error (including
+            chunks whose worker exited too many times) is raised once all
+            chunks have completed.
+        """
+
+        # the report covers the last run only
+        self.chunk_stats = []
+        self.workers_started = 0
+        self.workers_lost = 0
+
+        start = time.perf_counter()
+        results = self.context.Queue()
+        workers = {}
+        for _ in range(self.processes):
+            worker = self._start_worker(results)
+            workers[worker["process"].pid] = worker
+
+        chunk_iter = enumerate(chunks)
+        # chunks sent to workers which have not completed, by index
+        in_flight = {}
+        # chunks to send again after their worker exited
+        pending: Deque[Tuple[int, Any]] = collections.deque()
+        retries = collections.Counter()
+        outputs = {}
+        errors = {}
+        sent = 0
+        exhausted = False
+
+        def remaining() -> bool:
+            return bool(in_flight or pending or not exhausted)
+
+        def send() -> None:
+            nonlocal sent, exhausted
+            # keep at most two chunks queued for each worker
+            for worker in workers.values():
+                while len(worker["assigned"]) < 2:
+                    if pending:
+                        index, chunk = pending.popleft()
+                    elif not exhausted:
+                        try:
+                            index, chunk = next(chunk_iter)
+                            sent += 1
+                        except StopIteration:
+                            exhausted = True
+                            return
+                    else:
+                        return
+                    in_flight[index] = chunk
+                    worker["tasks"].put((index, chunk))
+                    worker["assigned"].append(index)
+
+        def reassign(worker: Dict) -> None:
+            # the exited worker's queue is never read again, so do not
+            # wait on flushing chunks left within it
+            worker["tasks"].cancel_join_thread()
+            # chunks which the worker had not completed, kept in order
+            pending.extendleft(
+                reversed([(index, in_flight[index]) for index in worker["assigned"]])
+            )
+            if remaining():
+                replacement = self._start_worker(results)
+                workers[replacement["process"].pid] = replacement
+
+        def complete(message: Tuple) -> None:
+            index, result, error, stats = message
+            worker = workers.get(stats["pid"])
+            if worker is not None and index in worker["assigned"]:
+                worker["assigned"].remove(index)
+            in_flight.pop(index, None)
+            outputs[index] = result
+            if error is not None:
+                errors[index] = error
+            self.chunk_stats.append(stats)
+
+            if stats["recycle"] and worker is not None:
+                # the worker exits, replace it with a fresh process
+                workers.pop(stats["pid"])
+                reassign(worker)
+
+        send()
+        while remaining():
+            try:
+                complete(results.get(timeout=1))
+            except queue.Empty:
+                dead = [
+                    pid
+                    for pid, worker in workers.items()
+                    if not worker["process"].is_alive()
+                ]
+                if not dead:
+                    continue
+
+                # results put before a worker exited are already readable
+                while True:
+                    try:
+                        complete(results.get_nowait())
+                    except queue.Empty:
+                        break
+
+                for pid in dead:
+                    worker = workers.pop(pid, None)
+                    if worker is None:
+                        continue
+                    self.workers_lost += 1
+                    if worker["assigned"]:
+                        index = worker["assigned"].pop(0)
+                        retries[index] += 1
+                        if retries[index] > self.max_chunk_retries:
+                            in_flight.pop(index)
+                            outputs[index] = None
+                            errors[index] = (
+                                f"Worker {pid} exited with code "
+                                f"{worker['process'].exitcode} while running the "
+                                "chunk (for example killed for running out of "
+                                "memory)"
+                            )
+                        else:
+                            worker["assigned"].insert(0, index)
+                    reassign(worker)
+
+            send()
+
+        for worker in workers.values():
+            worker["tasks"].put(None)
+        for worker in workers.values():
+            worker["process"].join()
+
+        self.wall_time = time.perf_counter() - start
+
+        if errors:
+            raise RuntimeError(f"Chunk {min(errors)} failed:\n{errors[min(errors)]}")
+
+        return [outputs[index] for index in range(sent)]
+
+    def report(self) -> Dict:
+        """
+        Report of recycling and memory statistics of the last run.
+
+        Returns
+        -------
+        Dict
+            dictionary with totals and per-chunk statistics
+        """
+
+        return {
+            "wall_time": self.wall_time,
+            "chunks": len(self.chunk_stats),
+            "processes": self.processes,
+            "workers_started": self.workers_started,
+            "workers_lost": self.workers_lost,
+            "recycled_by_chunks": sum(
+                stats["recycle"] == "chunks" for stats in self.chunk_stats
+            ),
+            "recycled_by_rss": sum(
+                stats["recycle"] == "rss" for stats in self.chunk_stats
+            ),
+            "arrow_backends": sorted(
+                {stats["arrow_backend"] for stats in self.chunk_stats}
+            ),
+            "max_rss": max((stats["rss"] for stats in self.chunk_stats), default=None),
+            "max_peak_rss": max(
+                (stats["peak_rss"] for stats in self.chunk_stats), default=None
+            ),
+            "max_arrow_pool": max(
+                (stats["arrow_pool_max"] for stats in self.chunk_stats), default=None
+            ),
+            "chunk_stats": sorted(self.chunk_stats, key=lambda stats: stats["chunk"]),
+        }
+
+    def to_json(self, filepath: str) -> str:
+        """
+        Write the report to a JSON file.
+
+        Parameters
+        ----------
+        filepath: str
+            filepath to write the report to
+
+        Returns
+        -------
+        str
+            filepath of the report
+        """
+
+        with open(filepath, "w") as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+        return filepath
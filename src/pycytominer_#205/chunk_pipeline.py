@@ -0,0 +1,325 @@
+"""
+Overlapped read, transform and write pipeline for chunked exports.
+
+A pool of reader threads, transform threads and a single writer thread
+are joined by queues. At most max_in_flight chunks exist between the
+start of a read and the end of its write, so memory stays capped while
+SQLite I/O, transforms and parquet writes overlap.
+
+ConnectorX, Arrow, polars and parquet writers release the GIL for their
+heavy work, so threads are enough to keep each stage busy.
+"""
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from stage_metrics import StageMetrics
+
+# sentinel which marks the end of a stage's input
+_DONE = object()
+
+
+class StageTimes:
+    """
+    Busy and waiting time of the workers of one pipeline stage.
+    """
+
+    def __init__(self, name: str, workers: int) -> None:
+        self.name = name
+        self.workers = workers
+        self.count = 0
+        self.busy = 0.0
+        self.wait_input = 0.0
+        self.wait_output = 0.0
+        self._lock = threading.Lock()
+
+    def add(
+        self, busy: float = 0.0, wait_input: float = 0.0, wait_output: float = 0.0
+    ) -> None:
+        """
+        Add measured seconds from one worker.
+
+        Parameters
+        ----------
+        busy: float
+            seconds spent in the stage function
+        wait_input: float
+            seconds spent waiting on an earlier stage (starvation)
+        wait_output: float
+            seconds spent waiting on a later stage or the
+            in-flight limit (backpressure)
+        """
+
+        with self._lock:
+            self.count += 1 if busy else 0
+            self.busy += busy
+            self.wait_input += wait_input
+            self.wait_output += wait_output
+
+    def to_dict(self, wall_time: float) -> dict:
+        """
+        Stage times as a json-compatible dictionary.
+
+        Parameters
+        ----------
+        wall_time: float
+            wall time of the whole pipeline run in seconds
+
+        Returns
+        -------
+        dict
+            dictionary of stage times with utilisation, the fraction
+            of available worker time spent in the stage function.
+        """
+
+        return {
+            "workers": self.workers,
+            "chunks": self.count,
+            "busy": self.busy,
+            "wait_input": self.wait_input,
+            "wait_output": self.wait_output,
+            "utilisation": self.busy / (wall_time * self.workers)
+            if wall_time
+            else None,
+        }
+
+
+class ChunkPipeline:
+    """
+    Run read, transform and write functions over chunks with
+    overlapping stages and bounded memory.
+
+    Example:
+    pipeline = ChunkPipeline(read=read_chunk, transform=fill_chunk,
+                             write=write_chunk, readers=4, max_in_flight=6)
+    results = pipeline.run(chunks)
+    print(pipeline.report())
+    """
+
+    def __init__(
+        self,
+        read: Optional[Callable[[Any], Any]] = None,
+        transform: Optional[Callable[[Any], Any]] = None,
+        write: Optional[Callable[[Any], Any]] = None,
+        readers: int = 2,
+        transformers: int = 1,
+        max_in_flight: int = 4,
+        metrics: Optional[StageMetrics] = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        read: Callable[[Any], Any]
+            function which reads a chunk from its description,
+            it may instead be set before calling run().
+        transform: Callable[[Any], Any]
+            optional function which transforms a read chunk
+        write: Callable[[Any], Any]
+            optional function which writes a transformed chunk,
+            its return values are collected by run().
+        readers: int
+            number of reader threads
+        transformers: int
+            number of transform threads
+        max_in_flight: int
+            maximum number of chunks read but not yet written
+        metrics: StageMetrics
+            optional metrics which record each read, transform and write
+        """
+
+        self.read = read
+        self.transform = transform if transform is not None else (lambda data: data)
+        self.write = write if write is not None else (lambda data: data)
+        self.readers = readers
+        self.transformers = transformers
+        self.max_in_flight = max(max_in_flight, 1)
+        self.metrics = metrics
+        self.wall_time = None
+        self.times = {}
+
+    def _call(self, name: str, func: Callable, index: int, data: Any) -> Any:
+        # record the call with stage metrics when they are provided
+        if self.metrics is None:
+            return func(data)
+        with self.metrics.stage(name, chunk=index):
+            return func(data)
+
+    def _get(self, source: queue.Queue) -> Any:
+        # wait for input while watching for failures elsewhere
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, error: BaseException) -> None:
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+
+    def _reader(self, chunks: queue.Queue) -> None:
+        times = self.times["read"]
+        try:
+            while not self._stop.is_set():
+                # backpressure: wait for a chunk to be written before reading more
+                start = time.perf_counter()
+                while not self._in_flight.acquire(timeout=0.1):
+                    if self._stop.is_set():
+                        return
+                waited = time.perf_counter() - start
+                try:
+                    index, chunk = chunks.get_nowait()
+                except queue.Empty:
+                    self._in_flight.release()
+                    times.add(wait_output=waited)
+                    return
+                start = time.perf_counter()
+                data = self._call("read", self.read, index, chunk)
+                busy = time.perf_counter() - start
+                start = time.perf_counter()
+                self._read_queue.put((index, data))
+                times.add(busy=busy, wait_output=waited + time.perf_counter() - start)
+        except BaseException as error:
+            self._fail(error)
+        finally:
+            with self._lock:
+                self._readers_left -= 1
+                if self._readers_left == 0:
+                    for _ in range(self.transformers):
+                        self._read_queue.put(_DONE)
+
+    def _transformer(self) -> None:
+        times = self.times["transform"]
+        try:
+            while True:
+                start = time.perf_counter()
+                item = self._get(self._read_queue)
+                waited = time.perf_counter() - start
+                if item is _DONE:
+                    times.add(wait_input=waited)
+                    return
+                index, data = item
+                start = time.perf_counter()
+                data = self._call("transform", self.transform, index, data)
+                busy = time.perf_counter() - start
+                start = time.perf_counter()
+                self._transform_queue.put((index, data))
+                times.add(
+                    busy=busy,
+                    wait_input=waited,
+                    wait_output=time.perf_counter() - start,
+                )
+        except BaseException as error:
+            self._fail(error)
+        finally:
+            with self._lock:
+                self._transformers_left -= 1
+                if self._transformers_left == 0:
+                    self._transform_queue.put(_DONE)
+
+    def _writer(self) -> None:
+        times = self.times["write"]
+        try:
+            while True:
+                start = time.perf_counter()
+                item = self._get(self._transform_queue)
+                waited = time.perf_counter() - start
+                if item is _DONE:
+                    times.add(wait_input=waited)
+                    return
+                index, data = item
+                start = time.perf_counter()
+                self._results[index] = self._call("write", self.write, index, data)
+                # release references before allowing another read
+                del data, item
+                self._in_flight.release()
+                times.add(busy=time.perf_counter() - start, wait_input=waited)
+        except BaseException as error:
+            self._fail(error)
+
+    def run(self, chunks: Iterable[Any]) -> List[Any]:
+        """
+        Run the pipeline over chunk descriptions, for example
+        lists of join key dictionaries.
+
+        Parameters
+        ----------
+        chunks: Iterable[Any]
+            chunk descriptions passed to the read function
+
+        Returns
+        -------
+        List[Any]
+            results of the write function in chunk order
+        """
+
+        chunk_queue = queue.Queue()
+        for index, chunk in enumerate(chunks):
+            chunk_queue.put((index, chunk))
+        chunk_count = chunk_queue.qsize()
+
+        # queues are unbounded as the in-flight semaphore caps their contents
+        self._read_queue = queue.Queue()
+        self._transform_queue = queue.Queue()
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._error = None
+        self._results = [None] * chunk_count
+        self._readers_left = self.readers
+        self._transformers_left = self.transformers
+        self.times = {
+            "read": StageTimes("read", self.readers),
+            "transform": StageTimes("transform", self.transformers),
+            "write": StageTimes("write", 1),
+        }
+
+        threads = (
+            [
+                threading.Thread(
+                    target=self._reader, args=(chunk_queue,), name=f"read-{i}"
+                )
+                for i in range(self.readers)
+            ]
+            + [
+                threading.Thread(target=self._transformer, name=f"transform-{i}")
+                for i in range(self.transformers)
+            ]
+            + [threading.Thread(target=self._writer, name="write")]
+        )
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.wall_time = time.perf_counter() - start
+
+        if self._error is not None:
+            raise self._error
+
+        return self._results
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Per-stage utilisation of the last run. A stage near 1.0 with
+        others waiting on input is the bottleneck; add workers there
+        or raise max_in_flight if readers mostly wait on output.
+
+        Returns
+        -------
+        Dict[str, Any]
+            dictionary with wall_time, max_in_flight and stages keys
+        """
+
+        return {
+            "wall_time": self.wall_time,
+            "max_in_flight": self.max_in_flight,
+            "stages": {
+                name: stage_times.to_dict(self.wall_time)
+                for name, stage_times in self.times.items()
+            },
+        }
@@ -0,0 +1,583 @@
+"""
+Long-running local conversion daemon which stays warm between jobs,
+for streams of small plates where import and cluster startup
+(ray.init(), DaskClient(), a Prefect DaskExecutor per run) takes
+longer than the conversion itself.
+
+The daemon imports pyarrow, ConnectorX and the rowid DatabaseFrame
+once (see databaseframe_arrow_concat_rowid_chunks.py) and keeps
+DatabaseFrames (engines) and unified schemas cached by the plate's
+sqlite_fingerprint, so unchanged plates skip schema collection on
+later jobs. Jobs are accepted over a Unix socket as JSON lines into
+a local queue and run concurrently. Each job runs within a process
+forked from the warm daemon, so it starts without import cost while
+its limits on memory (address space), time and reader threads only
+apply to that job, and a job which is killed does not affect others.
+
+Example:
+python conversion_daemon.py serve --socket /tmp/conversion.sock --processes 4
+python conversion_daemon.py submit SQ00014613.sqlite \
+    --output SQ00014613.parquet --memory-limit 8GB --wait
+python conversion_daemon.py status
+python conversion_daemon.py shutdown
+"""
+import argparse
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import socket
+import socketserver
+import threading
+import time
+import traceback
+from multiprocessing.connection import Connection
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from databaseframe_arrow_concat_rowid_chunks import DatabaseFrame
+from sqlite_estimate import format_bytes, parse_bytes
+from stage_metrics import peak_rss, reset_peak_rss
+from task_cache import sqlite_fingerprint
+
+# default location of the daemon's socket
+SOCKET_PATH_DEFAULT = "/tmp/pycytominer_conversion.sock"
+
+# plates kept within the DatabaseFrame and schema cache
+MAX_CACHED_PLATES = 32
+
+
+def virtual_memory_size() -> int:
+    """
+    Current virtual memory (address space) size of this process in bytes.
+
+    Returns
+    -------
+    int
+        virtual memory size in bytes
+    """
+
+    with open("/proc/self/statm", "r") as statm:
+        return int(statm.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def run_job(
+    job: Dict, dbf: DatabaseFrame, schema: pa.Schema, connection: Connection
+) -> None:
+    """
+    Convert one plate to parquet within a process forked for the job,
+    sending the result or error through a connection.
+
+    Parameters
+    ----------
+    job: Dict
+        job with output_path, chunk_size, join_keys, threads
+        and memory_limit keys
+    dbf: DatabaseFrame
+        DatabaseFrame of the plate
+    schema: pa.Schema
+        unified schema of the plate
+    connection: Connection
+        pipe connection to send the result through
+    """
+
+    if job.get("memory_limit"):
+        # the limit is headroom above the address space inherited from the daemon
+        _, hard_limit = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(
+            resource.RLIMIT_AS,
+            (virtual_memory_size() + job["memory_limit"], hard_limit),
+        )
+
+    try:
+        reset_peak_rss()
+        start = time.perf_counter()
+        join_keys = job.get("join_keys") or ["TableNumber", "ImageNumber"]
+
+        with pq.ParquetWriter(job["output_path"], schema) as writer:
+            for table in dbf.read_rowid_ranges(
+                join_keys=join_keys,
+                chunk_size=job["chunk_size"],
+                workers=job["threads"],
+            ):
+                writer.write_table(dbf.conform_to_schema(table=table, schema=schema))
+
+        connection.send(
+            {
+                "status": "ok",
+                "seconds": time.perf_counter() - start,
+                "peak_rss": peak_rss(),
+                "output_bytes": os.path.getsize(job["output_path"]),
+            }
+        )
+    except BaseException as error:
+        connection.send(
+            {
+                "status": "failed",
+                "error": repr(error),
+                "traceback": "".join(
+                    traceback.format_exception(type(error), error, error.__traceback__)
+                ),
+            }
+        )
+    finally:
+        connection.close()
+
+
+class ConversionDaemon:
+    """
+    Queue of conversion jobs run concurrently within processes
+    forked from this warm process.
+    """
+
+    def __init__(
+        self,
+        processes: Optional[int] = None,
+        memory_limit: Optional[int] = None,
+        time_limit: Optional[float] = None,
+        threads: int = 1,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        processes: int
+            number of concurrent jobs, by default os.cpu_count().
+        memory_limit: int
+            optional default address space in bytes each job may add
+            above the warm daemon's own.
+        time_limit: float
+            optional default seconds after which a job is killed
+        threads: int
+            default reader threads per job
+        """
+
+        self.processes = processes if processes else os.cpu_count() or 1
+        self.memory_limit = memory_limit
+        self.time_limit = time_limit
+        self.threads = threads
+        # fork so jobs inherit imports and cached engines and schemas
+        self.context = multiprocessing.get_context("fork")
+
+        self.jobs: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        self.finished = threading.Condition(self.lock)
+        self.queue: queue.Queue = queue.Queue()
+        self.job_ids = itertools.count(1)
+        self.started = time.time()
+
+        # sqlite filepath to (fingerprint, DatabaseFrame, {join keys: schema})
+        self.plates: collections.OrderedDict = collections.OrderedDict()
+        self.plates_lock = threading.Lock()
+
+        self.dispatchers = [
+            threading.Thread(target=self._dispatch, daemon=True)
+            for _ in range(self.processes)
+        ]
+        for dispatcher in self.dispatchers:
+            dispatcher.start()
+
+    def cached_plate(self, sql_path: str, join_keys: List[str]) -> tuple:
+        """
+        Find a DatabaseFrame and unified schema for a plate within the
+        cache, rebuilding them when the plate has changed.
+
+        Parameters
+        ----------
+        sql_path: str
+            filepath of the SQLite plate
+        join_keys: List[str]
+            list of keys shared by all tables
+
+        Returns
+        -------
+        tuple
+            DatabaseFrame, unified schema and whether the cache was hit
+        """
+
+        fingerprint = sqlite_fingerprint(sql_path)
+
+        with self.plates_lock:
+            cached = self.plates.get(sql_path)
+            if cached is None or cached[0] != fingerprint:
+                cached = (
+                    fingerprint,
+                    DatabaseFrame(engine=f"sqlite:///{sql_path}"),
+                    {},
+                )
+                self.plates[sql_path] = cached
+            self.plates.move_to_end(sql_path)
+            while len(self.plates) > MAX_CACHED_PLATES:
+                self.plates.popitem(last=False)
+
+            _, dbf, schemas = cached
+            hit = tuple(join_keys) in schemas
+            if not hit:
+                schemas[tuple(join_keys)] = dbf.unified_schema(join_keys=join_keys)
+
+            return dbf, schemas[tuple(join_keys)], hit
+
+    def submit(
+        self,
+        sql_path: str,
+        output_path: Optional[str] = None,
+        chunk_size: int = 100000,
+        join_keys: Optional[List[str]] = None,
+        threads: Optional[int] = None,
+        memory_limit: Optional[int] = None,
+        time_limit: Optional[float] = None,
+    ) -> Dict:
+        """
+        Add a conversion job to the queue.
+
+        Parameters
+        ----------
+        sql_path: str
+            filepath of the SQLite plate
+        output_path: str
+            parquet filepath to write, by default the plate's
+            filepath with a .parquet extension.
+        chunk_size: int
+            number of rowids within each range
+        join_keys: List[str]
+            list of keys shared by all tables.
+            By default TableNumber and ImageNumber.
+        threads: int
+            reader threads for the job, by default the daemon's threads
+        memory_limit: int
+            address space in bytes the job may add,
+            by default the daemon's memory_limit.
+        time_limit: float
+            seconds after which the job is killed,
+            by default the daemon's time_limit.
+
+        Returns
+        -------
+        Dict
+            the queued job
+        """
+
+        job = {
+            "job_id": str(next(self.job_ids)),
+            "status": "queued",
+            "sql_path": os.path.abspath(sql_path),
+            "output_path": os.path.abspath(
+                output_path
+                if output_path
+                else f"{os.path.splitext(sql_path)[0]}.parquet"
+            ),
+            "chunk_size": chunk_size,
+            "join_keys": join_keys,
+            "threads": threads if threads else self.threads,
+            "memory_limit": memory_limit if memory_limit else self.memory_limit,
+            "time_limit": time_limit if time_limit else self.time_limit,
+            "submitted": time.time(),
+        }
+        with self.lock:
+            self.jobs[job["job_id"]] = job
+        self.queue.put(job["job_id"])
+
+        return dict(job)
+
+    def _run(self, job: Dict) -> Dict:
+        # schemas are read and cached here so forked jobs inherit them
+        dbf, schema, hit = self.cached_plate(
+            job["sql_path"], job["join_keys"] or ["TableNumber", "ImageNumber"]
+        )
+
+        receiver, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(
+            target=run_job, args=(job, dbf, schema, sender), daemon=True
+        )
+        process.start()
+        sender.close()
+        with self.lock:
+            job["pid"] = process.pid
+
+        # poll also returns when the job exits without a result
+        if receiver.poll(job["time_limit"]):
+            try:
+                result = receiver.recv()
+            except EOFError:
+                result = None
+        else:
+            process.kill()
+            result = {
+                "status": "failed",
+                "error": f"Killed after time limit of {job['time_limit']}s",
+            }
+        process.join()
+        receiver.close()
+
+        if result is None:
+            result = {
+                "status": "failed",
+                "error": f"Job process exited with code {process.exitcode} "
+                "(for example killed for running out of memory)",
+            }
+
+        return {**result, "cache_hit": hit}
+
+    def _dispatch(self) -> None:
+        # each dispatcher runs one job at a time
+        while True:
+            job_id = self.queue.get()
+            if job_id is None:
+                break
+            with self.lock:
+                job = self.jobs[job_id]
+                job["status"] = "running"
+                job["started"] = time.time()
+            try:
+                update = self._run(dict(job))
+            except Exception as error:
+                update = {"status": "failed", "error": repr(error)}
+            with self.finished:
+                job.update(update, finished=time.time())
+                self.finished.notify_all()
+
+    def status(self, job_id: Optional[str] = None) -> Dict:
+        """
+        Status of a job, or of the daemon and all jobs.
+
+        Parameters
+        ----------
+        job_id: str
+            optional job to report on
+
+        Returns
+        -------
+        Dict
+            the job, or daemon totals along with all jobs
+        """
+
+        with self.lock:
+            if job_id is not None:
+                return dict(self.jobs[job_id])
+
+            counts = collections.Counter(job["status"] for job in self.jobs.values())
+            return {
+                "processes": self.processes,
+                "cached_plates": len(self.plates),
+                "uptime": time.time() - self.started,
+                "queued": counts["queued"],
+                "running": counts["running"],
+                "succeeded": counts["ok"],
+                "failed": counts["failed"],
+                "jobs": [dict(job) for job in self.jobs.values()],
+            }
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Dict:
+        """
+        Wait for a job to finish.
+
+        Parameters
+        ----------
+        job_id: str
+            job to wait for
+        timeout: float
+            optional seconds to wait before returning the job as it is
+
+        Returns
+        -------
+        Dict
+            the job
+        """
+
+        with self.finished:
+            self.finished.wait_for(
+                lambda: self.jobs[job_id]["status"] in ["ok", "failed"],
+                timeout=timeout,
+            )
+            return dict(self.jobs[job_id])
+
+    def shutdown(self) -> None:
+        """
+        Finish queued jobs and stop the dispatchers.
+        """
+
+        for _ in self.dispatchers:
+            self.queue.put(None)
+        for dispatcher in self.dispatchers:
+            dispatcher.join()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handle JSON line requests with an "action" key, responding
+    with one JSON line for each request.
+    """
+
+    def handle(self) -> None:
+        daemon = self.server.conversion_daemon
+        for line in self.rfile:
+            shutdown = False
+            try:
+                request = json.loads(line)
+                action = request.pop("action")
+                if action == "submit":
+                    response = daemon.submit(**request)
+                elif action == "status":
+                    response = daemon.status(job_id=request.get("job_id"))
+                elif action == "wait":
+                    response = daemon.wait(**request)
+                elif action == "shutdown":
+                    response = {"status": "shutting down"}
+                    shutdown = True
+                else:
+                    raise ValueError(f"Unknown action {action}")
+            except Exception as error:
+                response = {"error": repr(error)}
+            self.wfile.write(f"{json.dumps(response, default=str)}\n".encode())
+            self.wfile.flush()
+            if shutdown:
+                # respond before shutting down as the process may exit
+                # first, shutdown blocks until serve_forever returns
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+
+def serve(
+    socket_path: str = SOCKET_PATH_DEFAULT,
+    processes: Optional[int] = None,
+    memory_limit: Optional[int] = None,
+    time_limit: Optional[float] = None,
+    threads: int = 1,
+) -> None:
+    """
+    Run the daemon on a Unix socket until a shutdown request.
+
+    Parameters
+    ----------
+    socket_path: str
+        filepath of the Unix socket
+    processes: int
+        number of concurrent jobs, by default os.cpu_count().
+    memory_limit: int
+        optional default address space in bytes each job may add
+    time_limit: float
+        optional default seconds after which a job is killed
+    threads: int
+        default reader threads per job
+    """
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    daemon = ConversionDaemon(
+        processes=processes,
+        memory_limit=memory_limit,
+        time_limit=time_limit,
+        threads=threads,
+    )
+    with socketserver.ThreadingUnixStreamServer(socket_path, _RequestHandler) as server:
+        server.daemon_threads = True
+        server.conversion_daemon = daemon
+        try:
+            server.serve_forever()
+        finally:
+            daemon.shutdown()
+            os.remove(socket_path)
+
+
+def request(socket_path: str = SOCKET_PATH_DEFAULT, **message) -> Dict:
+    """
+    Send a request to a running daemon.
+
+    Parameters
+    ----------
+    socket_path: str
+        filepath of the daemon's Unix socket
+    **message
+        request with an "action" key (submit, status, wait or
+        shutdown) and the action's arguments.
+
+    Returns
+    -------
+    Dict
+        the daemon's response, or an error when the daemon closed
+        the connection without responding.
+    """
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(f"{json.dumps(message)}\n".encode())
+        with client.makefile("rb") as response:
+            line = response.readline()
+
+    if not line.strip():
+        return {"error": f"No response from the daemon at {socket_path}"}
+
+    return json.loads(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm plate conversion daemon.")
+    parser.add_argument("--socket", default=SOCKET_PATH_DEFAULT)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument("--processes", type=int, default=None)
+    serve_parser.add_argument("--memory-limit", type=parse_bytes, default=None)
+    serve_parser.add_argument("--time-limit", type=float, default=None)
+    serve_parser.add_argument("--threads", type=int, default=1)
+
+    submit_parser = subparsers.add_parser("submit")
+    submit_parser.add_argument("sql_paths", nargs="+")
+    submit_parser.add_argument("--output", default=None)
+    submit_parser.add_argument("--chunk-size", type=int, default=100000)
+    submit_parser.add_argument("--threads", type=int, default=None)
+    submit_parser.add_argument("--memory-limit", type=parse_bytes, default=None)
+    submit_parser.add_argument("--time-limit", type=float, default=None)
+    submit_parser.add_argument("--wait", action="store_true")
+
+    status_parser = subparsers.add_parser("status")
+    status_parser.add_argument("job_id", nargs="?", default=None)
+
+    subparsers.add_parser("shutdown")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(
+            socket_path=args.socket,
+            processes=args.processes,
+            memory_limit=args.memory_limit,
+            time_limit=args.time_limit,
+            threads=args.threads,
+        )
+    elif args.command == "submit":
+        jobs = [
+            request(
+                args.socket,
+                action="submit",
+                sql_path=sql_path,
+                output_path=args.output if len(args.sql_paths) == 1 else None,
+                chunk_size=args.chunk_size,
+                threads=args.threads,
+                memory_limit=args.memory_limit,
+                time_limit=args.time_limit,
+            )
+            for sql_path in args.sql_paths
+        ]
+        for job in jobs:
+            if args.wait:
+                job = request(args.socket, action="wait", job_id=job["job_id"])
+            print(
+                f"{job['job_id']} {job['status']}: {job['sql_path']} "
+                + (
+                    f"{job['seconds']:.2f}s peak {format_bytes(job['peak_rss'])}"
+                    if job["status"] == "ok"
+                    else job.get("error", "")
+                )
+            )
+    elif args.command == "status":
+        print(
+            json.dumps(
+                request(args.socket, action="status", job_id=args.job_id), indent=2
+            )
+        )
+    else:
+        print(request(args.socket, action="shutdown")["status"])
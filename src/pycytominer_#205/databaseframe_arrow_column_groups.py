@@ -0,0 +1,770 @@
+"""
+DatabaseFrame class for extracting very wide tables as column groups,
+where each group file holds a table's key columns and up to
+group_size other columns, so memory used while reading depends on the
+group width rather than the full width of thousands of features.
+
+Groups are read (optionally in rowid range chunks) and written
+independently, in parallel when workers > 1, into one directory per
+table along with a manifest. Every group is read in rowid order and
+written with the same chunking, so the reader stitches groups back
+together by position after verifying their key columns match.
+Only groups holding requested columns are read.
+"""
+import itertools
+import json
+import os
+import pathlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import connectorx as cx
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine
+from sqlalchemy.engine.base import Engine
+from sqlite_estimate import AFFINITY_TO_ARROW_TYPES, column_affinity
+
+# arrow types by name from sqlite_estimate's affinity mapping
+ARROW_TYPES = {
+    "int64": pa.int64(),
+    "double": pa.float64(),
+    "string": pa.string(),
+    "large_binary": pa.large_binary(),
+}
+
+# filename of the manifest within each table's directory
+MANIFEST_FILENAME = "column_groups.json"
+
+
+def database_engine_for_testing() -> Engine:
+    """
+    A database engine for testing as a fixture to be passed
+    to other tests within this file.
+    """
+
+    # get temporary directory
+    tmpdir = tempfile.gettempdir()
+
+    # remove db if it exists
+    if os.path.exists(f"{tmpdir}/test_sqlite.sqlite"):
+        os.remove(f"{tmpdir}/test_sqlite.sqlite")
+
+    # create a temporary sqlite connection
+    sql_path = f"sqlite:///{tmpdir}/test_sqlite.sqlite"
+
+    engine = create_engine(sql_path)
+
+    # statements for creating database with simple structure
+    create_stmts = [
+        "drop table if exists Image;",
+        """
+        create table Image (
+        TableNumber INTEGER
+        ,ImageNumber INTEGER
+        ,ImageData INTEGER
+        ,RandomDate DATETIME
+        );
+        """,
+        "drop table if exists Cells;",
+        """
+        create table Cells (
+        TableNumber INTEGER
+        ,ImageNumber INTEGER
+        ,ObjectNumber INTEGER
+        ,CellsData INTEGER
+        );
+        """,
+        "drop table if exists Nuclei;",
+        """
+        create table Nuclei (
+        TableNumber INTEGER
+        ,ImageNumber INTEGER
+        ,ObjectNumber INTEGER
+        ,NucleiData INTEGER
+        );
+        """,
+        "drop table if exists Cytoplasm;",
+        """
+        create table Cytoplasm (
+        TableNumber INTEGER
+        ,ImageNumber INTEGER
+        ,ObjectNumber INTEGER
+        ,Cytoplasm_Parent_Cells INTEGER
+        ,Cytoplasm_Parent_Nuclei INTEGER
+        ,CytoplasmData INTEGER
+        );
+        """,
+    ]
+
+    with engine.begin() as connection:
+        for stmt in create_stmts:
+            connection.execute(stmt)
+
+        # images
+        connection.execute(
+            "INSERT INTO Image VALUES (?, ?, ?, ?);",
+            [1, 1, 1, "123-123"],
+        )
+        connection.execute(
+            "INSERT INTO Image VALUES (?, ?, ?, ?);",
+            [2, 2, 2, "123-123"],
+        )
+
+        # cells
+        connection.execute(
+            "INSERT INTO Cells VALUES (?, ?, ?, ?);",
+            [1, 1, 2, 1],
+        )
+        connection.execute(
+            "INSERT INTO Cells VALUES (?, ?, ?, ?);",
+            [2, 2, 3, 1],
+        )
+
+        # Nuclei
+        connection.execute(
+            "INSERT INTO Nuclei VALUES (?, ?, ?, ?);",
+            [1, 1, 4, 1],
+        )
+        connection.execute(
+            "INSERT INTO Nuclei VALUES (?, ?, ?, ?);",
+            [2, 2, 5, 1],
+        )
+
+        # cytoplasm
+        connection.execute(
+            "INSERT INTO Cytoplasm VALUES (?, ?, ?, ?, ?, ?);",
+            [1, 1, 6, 2, 4, 1],
+        )
+        connection.execute(
+            "INSERT INTO Cytoplasm VALUES (?, ?, ?, ?, ?, ?);",
+            [2, 2, 7, 3, 5, 1],
+        )
+
+    return engine
+
+
+class DatabaseFrame:
+    """
+    Create a scalable column-grouped dataset from
+    all tables within provided database.
+    """
+
+    def __init__(
+        self,
+        engine: str,
+    ) -> None:
+        self.sql_url = engine
+        self.engine = self.engine_from_str(sql_engine=engine)
+
+    @staticmethod
+    def engine_from_str(sql_engine: str) -> Engine:
+        """
+        Helper function to create engine from a string.
+
+        Parameters
+        ----------
+        sql_engine: str
+            filename of the SQLite database
+
+        Returns
+        -------
+        sqlalchemy.engine.base.Engine
+            A SQLAlchemy engine
+        """
+
+        # if we don't already have the sqlite filestring, add it
+        if "sqlite:///" not in sql_engine:
+            sql_engine = f"sqlite:///{sql_engine}"
+        engine = create_engine(sql_engine)
+
+        return engine
+
+    def collect_sql_tables(
+        self,
+        table_name: Optional[str] = None,
+    ) -> list:
+        """
+        Collect a list of tables from the given engine's
+        database using optional table specification.
+
+        Parameters
+        ----------
+        table_name: str
+            optional specific table name to check within database, by default None
+
+        Returns
+        -------
+        list
+            Returns list, and if populated, contains tuples with values
+            similar to the following. These may also be accessed by name
+            similar to dictionaries, as they are SQLAlchemy Row objects.
+            [('table_name'),...]
+        """
+
+        # create column list for return result
+        table_list = []
+
+        with self.engine.connect() as connection:
+            if table_name is None:
+                # if no table name is provided, we assume all tables must be scanned
+                # leaving out sqlite internal tables such as sqlite_stat1
+                table_list = connection.execute(
+                    "SELECT name as table_name FROM sqlite_master WHERE type = 'table' "
+                    "AND name NOT LIKE 'sqlite_%';"
+                ).fetchall()
+            else:
+                # otherwise we will focus on just the table name provided
+                table_list = [{"table_name": table_name}]
+
+        return table_list
+
+    def collect_sql_columns(
+        self,
+        table_name: Optional[str] = None,
+        column_name: Optional[str] = None,
+    ) -> list:
+        """
+        Collect a list of columns from the given engine's
+        database using optional table or column level
+        specification.
+
+        Parameters
+        ----------
+        table_name: str
+            optional specific table name to check within database, by default None
+        column_name: str
+            optional specific column name to check within database, by default None
+
+        Returns
+        -------
+        list
+            Returns list, and if populated, contains tuples with values
+            similar to the following. These may also be accessed by name
+            similar to dictionaries, as they are SQLAlchemy Row objects.
+            [('table_name', 'column_name', 'column_type', 'notnull'),...]
+        """
+
+        # create column list for return result
+        column_list = []
+
+        tables_list = self.collect_sql_tables(table_name=table_name)
+
+        with self.engine.connect() as connection:
+            for table in tables_list:
+
+                # if no column name is specified we will focus on all columns within the table
+                sql_stmt = """
+                SELECT :table_name as table_name,
+                        name as column_name,
+                        type as column_type,
+                        [notnull]
+                FROM pragma_table_info(:table_name)
+                """
+
+                if column_name is not None:
+                    # otherwise we will focus on only the column name provided
+                    sql_stmt = f"{sql_stmt} WHERE name = :col_name;"
+
+                # append to column list the results
+                column_list += connection.execute(
+                    sql_stmt,
+                    {
+                        "table_name": str(table["table_name"]),
+                        "col_name": str(column_name),
+                    },
+                ).fetchall()
+
+        return column_list
+
+    def sql_rowid_ranges(
+        self, table_name: str, chunk_size: Optional[int]
+    ) -> List[Optional[Tuple[int, int]]]:
+        """
+        Split a table into inclusive rowid ranges.
+
+        Parameters
+        ----------
+        table_name: str
+            specific table name to split
+        chunk_size: int
+            number of rowids within each range, or None to read whole groups
+
+        Returns
+        -------
+        List[Optional[Tuple[int, int]]]
+            list of (start, end) rowid ranges, or [None] for a single
+            read of the whole table.
+        """
+
+        if chunk_size is None:
+            return [None]
+
+        with self.engine.connect() as connection:
+            min_rowid, max_rowid = connection.execute(
+                f"SELECT min(rowid), max(rowid) FROM {table_name};"
+            ).fetchone()
+
+        if min_rowid is None:
+            return [None]
+
+        return [
+            (start, min(start + chunk_size - 1, max_rowid))
+            for start in range(min_rowid, max_rowid + 1, chunk_size)
+        ]
+
+    def column_groups(
+        self,
+        table_name: str,
+        group_size: int,
+        key_columns: List[str],
+    ) -> Tuple[pa.Schema, List[List[str]]]:
+        """
+        Split a table's columns into groups using declared column types.
+
+        Parameters
+        ----------
+        table_name: str
+            specific table name to split
+        group_size: int
+            maximum number of non-key columns within each group
+        key_columns: List[str]
+            columns which are included in every group and not prepended.
+
+        Returns
+        -------
+        Tuple[pa.Schema, List[List[str]]]
+            schema of the table with table names prepended to non-key
+            columns, and lists of non-key column names for each group.
+        """
+
+        fields = [
+            pa.field(
+                coldata["column_name"]
+                if coldata["column_name"] in key_columns
+                else f"{table_name}_{coldata['column_name']}",
+                # datetimes are read as text
+                pa.string()
+                if coldata["column_type"] == "DATETIME"
+                else ARROW_TYPES[
+                    AFFINITY_TO_ARROW_TYPES[column_affinity(coldata["column_type"])]
+                ],
+            )
+            for coldata in self.collect_sql_columns(table_name=table_name)
+        ]
+        others = [field.name for field in fields if field.name not in key_columns]
+
+        return pa.schema(fields), [
+            others[i : i + group_size] for i in range(0, len(others), group_size)
+        ]
+
+    def sql_select_group(
+        self,
+        table_name: str,
+        columns: List[str],
+        key_columns: List[str],
+        rowid_range: Optional[Tuple[int, int]],
+    ) -> str:
+        """
+        Create a select statement for a column group of a table
+        in rowid order.
+
+        Parameters
+        ----------
+        table_name: str
+            specific table name to select from
+        columns: List[str]
+            key columns and prepended column names of the group
+        key_columns: List[str]
+            columns which are not prepended
+        rowid_range: Optional[Tuple[int, int]]
+            inclusive (start, end) rowid range, or None for the whole table
+
+        Returns
+        -------
+        str
+            SQL select statement
+        """
+
+        # datetimes are read as text
+        datetimes = [
+            coldata["column_name"]
+            for coldata in self.collect_sql_columns(table_name=table_name)
+            if coldata["column_type"] == "DATETIME"
+        ]
+
+        selects = []
+        for column in columns:
+            source = column if column in key_columns else column[len(table_name) + 1 :]
+            if source in datetimes:
+                source = f"CAST({source} AS TEXT)"
+            selects.append(f"{source} as '{column}'")
+
+        sql_stmt = f"select {','.join(selects)} from {table_name}"
+
+        if rowid_range is not None:
+            sql_stmt += f" where rowid between {rowid_range[0]} and {rowid_range[1]}"
+
+        return f"{sql_stmt} order by rowid"
+
+    def write_column_group(
+        self,
+        table_name: str,
+        schema: pa.Schema,
+        key_columns: List[str],
+        filepath: str,
+        rowid_ranges: List[Optional[Tuple[int, int]]],
+    ) -> int:
+        """
+        Read and write one column group of a table.
+
+        Parameters
+        ----------
+        table_name: str
+            specific table name to read
+        schema: pa.Schema
+            schema of the group's columns
+        key_columns: List[str]
+            columns which are not prepended
+        filepath: str
+            parquet filepath to write
+        rowid_ranges: List[Optional[Tuple[int, int]]]
+            rowid ranges to read the group in
+
+        Returns
+        -------
+        int
+            number of rows written
+        """
+
+        rows = 0
+        with pq.ParquetWriter(filepath, schema) as writer:
+            for rowid_range in rowid_ranges:
+                table = cx.read_sql(
+                    str(self.engine.url).replace("///", "//"),
+                    self.sql_select_group(
+                        table_name=table_name,
+                        columns=schema.names,
+                        key_columns=key_columns,
+                        rowid_range=rowid_range,
+                    ),
+                    return_type="arrow",
+                )
+                # one row group per range, the same for every group
+                writer.write_table(
+                    pa.Table.from_arrays(
+                        [
+                            table.column(field.name).cast(field.type, safe=False)
+                            for field in schema
+                        ],
+                        schema=schema,
+                    ),
+                    row_group_size=max(table.num_rows, 1),
+                )
+                rows += table.num_rows
+
+        return rows
+
+    def to_parquet_column_groups(
+        self,
+        dirpath: str,
+        group_size: int = 500,
+        join_keys: List[str] = None,
+        chunk_size: Optional[int] = None,
+        workers: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Export each table as column group files within a directory
+        per table, along with a manifest of the groups.
+
+        Parameters
+        ----------
+        dirpath: str
+            directory to write the dataset into.
+        group_size: int
+            maximum number of non-key columns within each group
+        join_keys: List[str]
+            list of keys included in every group which are not prepended,
+            along with ObjectNumber where tables have it.
+            By default TableNumber and ImageNumber.
+        chunk_size: int
+            optional number of rowids read at once within each group,
+            by default each group is read whole.
+        workers: int
+            number of groups read and written at once, by default 1.
+
+        Returns
+        -------
+        List[str]
+            filepaths of the manifests written, one per table.
+        """
+
+        # set default join_key
+        if not join_keys:
+            join_keys = ["TableNumber", "ImageNumber"]
+
+        tasks = []
+        manifests = {}
+        for table in self.collect_sql_tables():
+            table_name = table["table_name"]
+            key_columns = [
+                coldata["column_name"]
+                for coldata in self.collect_sql_columns(table_name=table_name)
+                if coldata["column_name"] in join_keys + ["ObjectNumber"]
+            ]
+            schema, groups = self.column_groups(
+                table_name=table_name, group_size=group_size, key_columns=key_columns
+            )
+            # tables with only key columns are written as one group
+            groups = groups if groups else [[]]
+
+            table_dir = pathlib.Path(dirpath) / table_name
+            table_dir.mkdir(parents=True, exist_ok=True)
+            rowid_ranges = self.sql_rowid_ranges(
+                table_name=table_name, chunk_size=chunk_size
+            )
+            manifests[table_name] = {
+                "table_name": table_name,
+                "key_columns": key_columns,
+                "groups": [],
+            }
+            for number, group in enumerate(groups):
+                filename = f"group_{number:04d}.parquet"
+                manifests[table_name]["groups"].append(
+                    {"filename": filename, "columns": group}
+                )
+                tasks.append(
+                    (
+                        table_name,
+                        pa.schema([schema.field(name) for name in key_columns + group]),
+                        key_columns,
+                        str(table_dir / filename),
+                        rowid_ranges,
+                    )
+                )
+
+        with ThreadPoolExecutor(max_workers=workers if workers else 1) as executor:
+            rows = list(
+                executor.map(lambda task: self.write_column_group(*task), tasks)
+            )
+
+        filepaths = []
+        for table_name, manifest in manifests.items():
+            manifest["rows"] = rows[[task[0] for task in tasks].index(table_name)]
+            filepath = str(pathlib.Path(dirpath) / table_name / MANIFEST_FILENAME)
+            with open(filepath, "w") as manifest_file:
+                json.dump(manifest, manifest_file, indent=2)
+            filepaths.append(filepath)
+
+        return filepaths
+
+
+def read_manifest(dirpath: str, table_name: str) -> Dict:
+    """
+    Read the column group manifest of a table.
+
+    Parameters
+    ----------
+    dirpath: str
+        directory of a dataset written by DatabaseFrame.to_parquet_column_groups
+    table_name: str
+        table to read the manifest of
+
+    Returns
+    -------
+    Dict
+        manifest with table_name, key_columns, groups and rows keys
+    """
+
+    with open(pathlib.Path(dirpath) / table_name / MANIFEST_FILENAME, "r") as file:
+        return json.load(file)
+
+
+def _stitched_groups(manifest: Dict, columns: Optional[List[str]]) -> List[Dict]:
+    # only groups holding requested columns are read
+    groups = [
+        group
+        for group in manifest["groups"]
+        if columns is None or set(group["columns"]) & set(columns)
+    ]
+    if not groups:
+        # only key columns were requested
+        groups = manifest["groups"][:1]
+
+    return groups
+
+
+def stitched_schema(
+    dirpath: str,
+    table_name: str,
+    columns: List[str] = None,
+) -> pa.Schema:
+    """
+    Schema of the record batches stitched by iter_stitched_batches,
+    read from the group files' metadata.
+
+    Parameters
+    ----------
+    dirpath: str
+        directory of a dataset written by DatabaseFrame.to_parquet_column_groups
+    table_name: str
+        table to read
+    columns: List[str]
+        optional non-key columns to return along with the key columns,
+        by default all columns.
+
+    Returns
+    -------
+    pa.Schema
+        schema with key columns first
+    """
+
+    manifest = read_manifest(dirpath=dirpath, table_name=table_name)
+    key_columns = manifest["key_columns"]
+    schemas = [
+        pq.read_schema(pathlib.Path(dirpath) / table_name / group["filename"])
+        for group in _stitched_groups(manifest=manifest, columns=columns)
+    ]
+
+    return pa.schema(
+        [schemas[0].field(name) for name in key_columns]
+        + [
+            schema.field(name)
+            for schema in schemas
+            for name in schema.names
+            if name not in key_columns and (columns is None or name in columns)
+        ]
+    )
+
+
+def iter_stitched_batches(
+    dirpath: str,
+    table_name: str,
+    columns: List[str] = None,
+    batch_size: int = 65536,
+    verify_keys: bool = True,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Stitch column groups of a table back together while reading,
+    reading only the groups which hold requested columns.
+
+    Parameters
+    ----------
+    dirpath: str
+        directory of a dataset written by DatabaseFrame.to_parquet_column_groups
+    table_name: str
+        table to read
+    columns: List[str]
+        optional non-key columns to return along with the key columns,
+        by default all columns.
+    batch_size: int
+        maximum number of rows per record batch.
+    verify_keys: bool
+        whether to check that key columns of each group match
+
+    Yields
+    ------
+    pa.RecordBatch
+        record batches with key columns first
+    """
+
+    manifest = read_manifest(dirpath=dirpath, table_name=table_name)
+    key_columns = manifest["key_columns"]
+    groups = _stitched_groups(manifest=manifest, columns=columns)
+
+    readers = [
+        pq.ParquetFile(
+            pathlib.Path(dirpath) / table_name / group["filename"]
+        ).iter_batches(
+            batch_size=batch_size,
+            columns=key_columns
+            + [
+                column
+                for column in group["columns"]
+                if columns is None or column in columns
+            ],
+        )
+        for group in groups
+    ]
+
+    for batches in itertools.zip_longest(*readers):
+        # zip would stop at the shortest group without notice
+        if any(batch is None for batch in batches) or (
+            len({batch.num_rows for batch in batches}) > 1
+        ):
+            raise ValueError(
+                f"Column groups of {table_name} hold different numbers of rows"
+            )
+        keys = batches[0].select(key_columns)
+        if verify_keys:
+            for group, batch in zip(groups[1:], batches[1:]):
+                if not batch.select(key_columns).equals(keys):
+                    raise ValueError(
+                        f"Key columns of {group['filename']} within {table_name} "
+                        "do not match the first group"
+                    )
+
+        arrays = list(keys.columns)
+        names = list(key_columns)
+        for batch in batches:
+            for name in batch.schema.names:
+                if name not in key_columns:
+                    arrays.append(batch.column(name))
+                    names.append(name)
+
+        yield pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+def read_stitched_table(
+    dirpath: str,
+    table_name: str,
+    columns: List[str] = None,
+    verify_keys: bool = True,
+) -> pa.Table:
+    """
+    Read a table from its column groups as a single table.
+
+    Parameters
+    ----------
+    dirpath: str
+        directory of a dataset written by DatabaseFrame.to_parquet_column_groups
+    table_name: str
+        table to read
+    columns: List[str]
+        optional non-key columns to return along with the key columns,
+        by default all columns.
+    verify_keys: bool
+        whether to check that key columns of each group match
+
+    Returns
+    -------
+    pa.Table
+        the table with key columns first
+    """
+
+    batches = list(
+        iter_stitched_batches(
+            dirpath=dirpath,
+            table_name=table_name,
+            columns=columns,
+            verify_keys=verify_keys,
+        )
+    )
+
+    # an empty table has no batches to take the schema from
+    return pa.Table.from_batches(
+        batches,
+        schema=stitched_schema(dirpath=dirpath, table_name=table_name, columns=columns),
+    )
+
+
+if __name__ == "__main__":
+    dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
+    print("\nFinal result\n")
+    print(
+        dbf.to_parquet_column_groups(
+            dirpath="./data/example_column_groups", group_size=1, chunk_size=1
+        )
+    )
+    print(read_stitched_table("./data/example_column_groups", "Cytoplasm").to_pandas())
@@ -0,0 +1,631 @@
+"""
+DatabaseFrame class for extracting data as a Parquet dataset of
+per-compartment files which share key columns, providing the
+sketch.md concat layout without materialising null-padded columns.
+Tables are read in rowid ranges which are streamed into each file.
+"""
+import os
+import pathlib
+import tempfile
+from typing import Iterator, List, Optional, Tuple
+
+import connectorx as cx
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine
+from sqlalchemy.engine.base import Engine
+from sqlite_estimate import AFFINITY_TO_ARROW_TYPES, column_affinity
+
+# arrow types by name from sqlite_estimate's affinity mapping
+ARROW_TYPES = {
+    "int64": pa.int64(),
+    "double": pa.float64(),
+    "string": pa.string(),
+    "large_binary": pa.large_binary(),
+}
+
+
+def database_engine_for_testing() -> Engine:
+    """
+    A database engine for testing as a fixture to be passed
+    to other tests within this file.
+    """
+
+    # get temporary directory
+    tmpdir = tempfile.gettempdir()
+
+    # remove db if it exists
+    if os.path.exists(f"{tmpdir}/test_sqlite.sqlite"):
+        os.remove(f"{tmpdir}/test_sqlite.sqlite")
+
+    # create a temporary sqlite connection
+    sql_path = f"sqlite:///{tmpdir}/test_sqlite.sqlite"
+
+    engine = create_engine(sql_path)
+
+    # statements for creating database with simple structure
+    create_stmts = [
+        "drop table if exists Image;",
+        """
+        create table Image (
+        TableNumber INTEGER
+        ,ImageNumber INTEGER
+        ,ImageData INTEGER
+        ,RandomDate DATETIME
+        );
+        """,
+        "drop table if exists Cells;",
+        """
+        create table Cells (
+        TableNumber INTEGER
+        ,ImageNumber INTEGER
+        ,ObjectNumber INTEGER
+        ,CellsData INTEGER
+        );
+        """,
+        "drop table if exists Nuclei;",
+        """
+        create table Nuclei (
+        TableNumber INTEGER
+        ,ImageNumber INTEGER
+        ,ObjectNumber INTEGER
+        ,NucleiData INTEGER
+        );
+        """,
+        "drop table if exists Cytoplasm;",
+        """
+        create table Cytoplasm (
+        TableNumber INTEGER
+        ,ImageNumber INTEGER
+        ,ObjectNumber INTEGER
+        ,Cytoplasm_Parent_Cells INTEGER
+        ,Cytoplasm_Parent_Nuclei INTEGER
+        ,CytoplasmData INTEGER
+        );
+        """,
+    ]
+
+    with engine.begin() as connection:
+        for stmt in create_stmts:
+            connection.execute(stmt)
+
+        # images
+        connection.execute(
+            "INSERT INTO Image VALUES (?, ?, ?, ?);",
+            [1, 1, 1, "123-123"],
+        )
+        connection.execute(
+            "INSERT INTO Image VALUES (?, ?, ?, ?);",
+            [2, 2, 2, "123-123"],
+        )
+
+        # cells
+        connection.execute(
+            "INSERT INTO Cells VALUES (?, ?, ?, ?);",
+            [1, 1, 2, 1],
+        )
+        connection.execute(
+            "INSERT INTO Cells VALUES (?, ?, ?, ?);",
+            [2, 2, 3, 1],
+        )
+
+        # Nuclei
+        connection.execute(
+            "INSERT INTO Nuclei VALUES (?, ?, ?, ?);",
+            [1, 1, 4, 1],
+        )
+        connection.execute(
+            "INSERT INTO Nuclei VALUES (?, ?, ?, ?);",
+            [2, 2, 5, 1],
+        )
+
+        # cytoplasm
+        connection.execute(
+            "INSERT INTO Cytoplasm VALUES (?, ?, ?, ?, ?, ?);",
+            [1, 1, 6, 2, 4, 1],
+        )
+        connection.execute(
+            "INSERT INTO Cytoplasm VALUES (?, ?, ?, ?, ?, ?);",
+            [2, 2, 7, 3, 5, 1],
+        )
+
+    return engine
+
+
+class DatabaseFrame:
+    """
+    Create a scalable per-compartment dataset from
+    all tables within provided database.
+    """
+
+    def __init__(
+        self,
+        engine: str,
+    ) -> None:
+        self.sql_url = engine
+        self.engine = self.engine_from_str(sql_engine=engine)
+
+    @staticmethod
+    def engine_from_str(sql_engine: str) -> Engine:
+        """
+        Helper function to create engine from a string.
+
+        Parameters
+        ----------
+        sql_engine: str
+            filename of the SQLite database
+
+        Returns
+        -------
+        sqlalchemy.engine.base.Engine
+            A SQLAlchemy engine
+        """
+
+        # if we don't already have the sqlite filestring, add it
+        if "sqlite:///" not in sql_engine:
+            sql_engine = f"sqlite:///{sql_engine}"
+        engine = create_engine(sql_engine)
+
+        return engine
+
+    def collect_sql_tables(
+        self,
+        table_name: Optional[str] = None,
+    ) -> list:
+        """
+        Collect a list of tables from the given engine's
+        database using optional table specification.
+
+        Parameters
+        ----------
+        table_name: str
+            optional specific table name to check within database, by default None
+
+        Returns
+        -------
+        list
+            Returns list, and if populated, contains tuples with values
+            similar to the following. These may also be accessed by name
+            similar to dictionaries, as they are SQLAlchemy Row objects.
+            [('table_name'),...]
+        """
+
+        # create column list for return result
+        table_list = []
+
+        with self.engine.connect() as connection:
+            if table_name is None:
+                # if no table name is provided, we assume all tables must be scanned
+                # leaving out sqlite internal tables such as sqlite_stat1
+                table_list = connection.execute(
+                    "SELECT name as table_name FROM sqlite_master WHERE type = 'table' "
+                    "AND name NOT LIKE 'sqlite_%';"
+                ).fetchall()
+            else:
+                # otherwise we will focus on just the table name provided
+                table_list = [{"table_name": table_name}]
+
+        return table_list
+
+    def collect_sql_columns(
+        self,
+        table_name: Optional[str] = None,
+        column_name: Optional[str] = None,
+    ) -> list:
+        """
+        Collect a list of columns from the given engine's
+        database using optional table or column level
+        specification.
+
+        Parameters
+        ----------
+        table_name: str
+            optional specific table name to check within database, by default None
+        column_name: str
+            optional specific column name to check within database, by default None
+
+        Returns
+        -------
+        list
+            Returns list, and if populated, contains tuples with values
+            similar to the following. These may also be accessed by name
+            similar to dictionaries, as they are SQLAlchemy Row objects.
+            [('table_name', 'column_name', 'column_type', 'notnull'),...]
+        """
+
+        # create column list for return result
+        column_list = []
+
+        tables_list = self.collect_sql_tables(table_name=table_name)
+
+        with self.engine.connect() as connection:
+            for table in tables_list:
+
+                # if no column name is specified we will focus on all columns within the table
+                sql_stmt = """
+                SELECT :table_name as table_name,
+                        name as column_name,
+                        type as column_type,
+                        [notnull]
+                FROM pragma_table_info(:table_name)
+                """
+
+                if column_name is not None:
+                    # otherwise we will focus on only the column name provided
+                    sql_stmt = f"{sql_stmt} WHERE name = :col_name;"
+
+                # append to column list the results
+                column_list += connection.execute(
+                    sql_stmt,
+                    {
+                        "table_name": str(table["table_name"]),
+                        "col_name": str(column_name),
+                    },
+                ).fetchall()
+
+        return column_list
+
+    def sql_table_to_arrow_table(
+        self,
+        table_name: str,
+        prepend_tablename_to_cols: bool = True,
+        avoid_prepend_for=List[str],
+        rowid_range: Optional[Tuple[int, int]] = None,
+    ) -> pa.Table:
+        """
+        Read provided table as PyArrow Table
+
+        Parameters
+        ----------
+        table_name: str
+            specific table name to read from the database
+        prepend_tablename_to_cols: bool
+            Whether prepend table name to column names, by default true
+        avoid_prepend_for: List[str]
+            list of strings of column names to avoid prepending the table name to.
+        rowid_range: Optional[Tuple[int, int]]
+            optional inclusive (start, end) rowid range to read in rowid order,
+            by default the whole table.
+
+        Returns
+        -------
+        pyarrow.Table
+            PyArrow Table of the SQL table
+        """
+
+        if prepend_tablename_to_cols:
+            colstring = ",".join(
+                [
+                    # cast datetimes as text and alias using the original column name
+                    "{} as '{}'".format(
+                        coldata["column_name"]
+                        if coldata["column_type"] != "DATETIME"
+                        else "CAST({} AS TEXT)".format(coldata["column_name"]),
+                        f"{table_name}_{coldata['column_name']}"
+                        if coldata["column_name"] not in avoid_prepend_for
+                        else coldata["column_name"],
+                    )
+                    for coldata in self.collect_sql_columns(table_name=table_name)
+                ]
+            )
+            sql_stmt = f"select {colstring} from {table_name}"
+        else:
+            sql_stmt = f"select * from {table_name}"
+
+        if rowid_range is not None:
+            sql_stmt += (
+                f" where rowid between {rowid_range[0]} and {rowid_range[1]}"
+                " order by rowid"
+            )
+
+        return cx.read_sql(
+            str(self.engine.url).replace("///", "//"),
+            sql_stmt,
+            return_type="arrow",
+        )
+
+    def sql_rowid_ranges(
+        self, table_name: str, chunk_size: int
+    ) -> List[Optional[Tuple[int, int]]]:
+        """
+        Split a table into inclusive rowid ranges.
+
+        Parameters
+        ----------
+        table_name: str
+            specific table name to split
+        chunk_size: int
+            number of rowids within each range
+
+        Returns
+        -------
+        List[Optional[Tuple[int, int]]]
+            list of (start, end) rowid ranges, or [None] for tables
+            without a rowid which are read whole.
+        """
+
+        with self.engine.connect() as connection:
+            try:
+                min_rowid, max_rowid = connection.execute(
+                    f"SELECT min(rowid), max(rowid) FROM {table_name};"
+                ).fetchone()
+            except Exception:
+                # WITHOUT ROWID tables
+                return [None]
+
+        if min_rowid is None:
+            return []
+
+        return [
+            (start, min(start + chunk_size - 1, max_rowid))
+            for start in range(min_rowid, max_rowid + 1, chunk_size)
+        ]
+
+    def table_schema(self, table_name: str, join_keys: List[str]) -> pa.Schema:
+        """
+        Arrow schema of a table from its declared column types, so
+        every rowid range of the table is written with the same types.
+
+        Parameters
+        ----------
+        table_name: str
+            specific table name to describe
+        join_keys: List[str]
+            list of keys which are not prepended
+
+        Returns
+        -------
+        pa.Schema
+            schema with table names prepended to non-key columns
+        """
+
+        return pa.schema(
+            [
+                pa.field(
+                    coldata["column_name"]
+                    if coldata["column_name"] in join_keys
+                    else f"{table_name}_{coldata['column_name']}",
+                    # datetimes are read as text
+                    pa.string()
+                    if coldata["column_type"] == "DATETIME"
+                    else ARROW_TYPES[
+                        AFFINITY_TO_ARROW_TYPES[column_affinity(coldata["column_type"])]
+                    ],
+                )
+                for coldata in self.collect_sql_columns(table_name=table_name)
+            ]
+        )
+
+    def to_parquet_dataset(
+        self,
+        dirpath: str,
+        join_keys: List[str] = None,
+        row_group_size: Optional[int] = None,
+        chunk_size: int = 100000,
+    ) -> List[str]:
+        """
+        Export each table within the database as its own parquet file
+        inside a dataset directory. Every file carries the shared join
+        keys and only the columns of its own compartment, so no
+        null-padded columns from other compartments are stored.
+
+        Parameters
+        ----------
+        dirpath: str
+            directory to write the dataset into.
+        join_keys: List[str]
+            list of keys shared by all compartment files.
+            By default TableNumber and ImageNumber.
+        row_group_size: int
+            optional maximum number of rows per parquet row group.
+        chunk_size: int
+            number of rowids read at once from each table
+
+        Returns
+        -------
+        List[str]
+            filepaths of the parquet files written, one per table.
+        """
+
+        # set default join_key
+        if not join_keys:
+            join_keys = ["TableNumber", "ImageNumber"]
+
+        pathlib.Path(dirpath).mkdir(parents=True, exist_ok=True)
+
+        filepaths = []
+        for table in self.collect_sql_tables():
+            filepath = f"{dirpath}/{table['table_name']}.parquet"
+            schema = self.table_schema(
+                table_name=table["table_name"], join_keys=join_keys
+            )
+            with pq.ParquetWriter(filepath, schema) as writer:
+                for rowid_range in self.sql_rowid_ranges(
+                    table_name=table["table_name"], chunk_size=chunk_size
+                ):
+                    chunk = self.sql_table_to_arrow_table(
+                        table_name=table["table_name"],
+                        prepend_tablename_to_cols=True,
+                        avoid_prepend_for=join_keys,
+                        rowid_range=rowid_range,
+                    )
+                    writer.write_table(
+                        pa.Table.from_arrays(
+                            [
+                                chunk.column(field.name).cast(field.type, safe=False)
+                                for field in schema
+                            ],
+                            schema=schema,
+                        ),
+                        row_group_size=row_group_size,
+                    )
+            filepaths.append(filepath)
+
+        return filepaths
+
+
+def dataset_filepaths(dirpath: str, basis: str = "Image") -> List[pathlib.Path]:
+    """
+    List the compartment files of a per-compartment dataset,
+    placing the basis table first as in the sketch.md layout.
+
+    Parameters
+    ----------
+    dirpath: str
+        directory of a dataset written by DatabaseFrame.to_parquet_dataset
+    basis: str
+        basis table name which is ordered first, by default Image.
+
+    Returns
+    -------
+    List[pathlib.Path]
+        ordered parquet filepaths within the dataset.
+    """
+
+    return sorted(
+        pathlib.Path(dirpath).glob("*.parquet"),
+        key=lambda filepath: (filepath.stem.lower() != basis.lower(), filepath.stem),
+    )
+
+
+def collect_wide_schema(
+    dirpath: str,
+    join_keys: List[str] = None,
+) -> pa.Schema:
+    """
+    Build the wide concat schema of a per-compartment dataset
+    using only the parquet footers of each file.
+
+    Parameters
+    ----------
+    dirpath: str
+        directory of a dataset written by DatabaseFrame.to_parquet_dataset
+    join_keys: List[str]
+        list of keys shared by all compartment files, placed first.
+        By default TableNumber and ImageNumber.
+
+    Returns
+    -------
+    pa.Schema
+        Unified schema with join keys first followed by all
+        compartment columns in file order.
+    """
+
+    # set default join_key
+    if not join_keys:
+        join_keys = ["TableNumber", "ImageNumber"]
+
+    schema = pa.unify_schemas(
+        [pq.read_schema(filepath) for filepath in dataset_filepaths(dirpath=dirpath)]
+    )
+
+    # place join keys first for a layout matching sketch.md
+    names = [name for name in join_keys if name in schema.names] + [
+        name for name in schema.names if name not in join_keys
+    ]
+
+    return pa.schema([schema.field(name) for name in names])
+
+
+def iter_wide_batches(
+    dirpath: str,
+    columns: List[str] = None,
+    join_keys: List[str] = None,
+    batch_size: int = 65536,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Lazily reconstruct the wide concat view of a per-compartment
+    dataset. Null columns for other compartments are only created
+    per record batch while reading, never stored on disk.
+
+    Parameters
+    ----------
+    dirpath: str
+        directory of a dataset written by DatabaseFrame.to_parquet_dataset
+    columns: List[str]
+        optional projection of wide columns to return, by default all.
+    join_keys: List[str]
+        list of keys shared by all compartment files.
+        By default TableNumber and ImageNumber.
+    batch_size: int
+        maximum number of rows per record batch.
+
+    Yields
+    ------
+    pa.RecordBatch
+        Record batches which all share the same wide schema.
+    """
+
+    wide_schema = collect_wide_schema(dirpath=dirpath, join_keys=join_keys)
+    if columns is not None:
+        wide_schema = pa.schema([wide_schema.field(name) for name in columns])
+
+    for filepath in dataset_filepaths(dirpath=dirpath):
+        parquet_file = pq.ParquetFile(filepath)
+
+        # only read columns from this file which were requested
+        file_columns = [
+            name
+            for name in wide_schema.names
+            if name in parquet_file.schema_arrow.names
+        ]
+        if len(file_columns) == 0:
+            continue
+
+        for batch in parquet_file.iter_batches(
+            batch_size=batch_size, columns=file_columns
+        ):
+            yield pa.RecordBatch.from_arrays(
+                [
+                    batch.column(field.name)
+                    if field.name in file_columns
+                    else pa.nulls(batch.num_rows, type=field.type)
+                    for field in wide_schema
+                ],
+                schema=wide_schema,
+            )
+
+
+def read_wide_table(
+    dirpath: str,
+    columns: List[str] = None,
+    join_keys: List[str] = None,
+) -> pa.Table:
+    """
+    Read the wide concat view of a per-compartment dataset
+    as a single table.
+
+    Parameters
+    ----------
+    dirpath: str
+        directory of a dataset written by DatabaseFrame.to_parquet_dataset
+    columns: List[str]
+        optional projection of wide columns to return, by default all.
+    join_keys: List[str]
+        list of keys shared by all compartment files.
+        By default TableNumber and ImageNumber.
+
+    Returns
+    -------
+    pa.Table
+        Wide table matching the sketch.md concat layout.
+    """
+
+    wide_schema = collect_wide_schema(dirpath=dirpath, join_keys=join_keys)
+    if columns is not None:
+        wide_schema = pa.schema([wide_schema.field(name) for name in columns])
+
+    return pa.Table.from_batches(
+        batches=list(
+            iter_wide_batches(dirpath=dirpath, columns=columns, join_keys=join_keys)
+        ),
+        schema=wide_schema,
+    )
+
+
+if __name__ == "__main__":
+    dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
+    print("\nFinal result\n")
+    print(dbf.to_parquet_dataset(dirpath="./data/example_dataset"))
+    print(collect_wide_schema(dirpath="./data/example_dataset"))
+    print(read_wide_table(dirpath="./data/example_dataset").to_pandas())
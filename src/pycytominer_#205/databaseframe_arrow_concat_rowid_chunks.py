@@ -0,0 +1,535 @@
+"""
+DatabaseFrame class for exporting all tables stacked (concat mode)
+into a single parquet file with a unified schema by reading SQLite
+rowid ranges in parallel, needing no join key alignment.
+"""
+import collections
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import connectorx as cx
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine
+from sqlalchemy.engine.base import Engine
+from sqlite_estimate import AFFINITY_TO_ARROW_TYPES, column_affinity
+
+# arrow types by name from sqlite_estimate's affinity mapping
+ARROW_TYPES = {
+    "int64": pa.int64(),
+    "double": pa.float64(),
+    "string": pa.string(),
+    "large_binary": pa.large_binary(),
+}
+
+
+def database_engine_for_testing() -> Engine:
+    """
+    A database engine for testing as a fixture to be passed
+    to other tests within this file.
+    """
+
+    # get temporary directory
+    tmpdir = tempfile.gettempdir()
+
+    # remove db if it exists
+    if os.path.exists(f"{tmpdir}/test_sqlite.sqlite"):
+        os.remove(f"{tmpdir}/test_sqlite.sqlite")
+
+    # create a temporary sqlite connection
+    sql_path = f"sqlite:///{tmpdir}/test_sqlite.sqlite"
+
+    engine = create_engine(sql_path)
+
+    # statements for creating database with simple structure
+    create_stmts = [
+        "drop table if exists Image;",
+        """
+        create table Image (
+        TableNumber INTEGER
+        ,ImageNumber INTEGER
+        ,ImageData INTEGER
+        ,RandomDate DATETIME
+        );
+        """,
+        "drop table if exists Cells;",
+        """
+        create table Cells (
+        TableNumber INTEGER
+        ,ImageNumber INTEGER
+        ,ObjectNumber INTEGER
+        ,CellsData INTEGER
+        );
+        """,
+        "drop table if exists Nuclei;",
+        """
+        create table Nuclei (
+        TableNumber INTEGER
+        ,ImageNumber INTEGER
+        ,ObjectNumber INTEGER
+        ,NucleiData INTEGER
+        );
+        """,
+        "drop table if exists Cytoplasm;",
+        """
+        create table Cytoplasm (
+        TableNumber INTEGER
+        ,ImageNumber INTEGER
+        ,ObjectNumber INTEGER
+        ,Cytoplasm_Parent_Cells INTEGER
+        ,Cytoplasm_Parent_Nuclei INTEGER
+        ,CytoplasmData INTEGER
+        );
+        """,
+    ]
+
+    with engine.begin() as connection:
+        for stmt in create_stmts:
+            connection.execute(stmt)
+
+        # images
+        connection.execute(
+            "INSERT INTO Image VALUES (?, ?, ?, ?);",
+            [1, 1, 1, "123-123"],
+        )
+        connection.execute(
+            "INSERT INTO Image VALUES (?, ?, ?, ?);",
+            [2, 2, 2, "123-123"],
+        )
+
+        # cells
+        connection.execute(
+            "INSERT INTO Cells VALUES (?, ?, ?, ?);",
+            [1, 1, 2, 1],
+        )
+        connection.execute(
+            "INSERT INTO Cells VALUES (?, ?, ?, ?);",
+            [2, 2, 3, 1],
+        )
+
+        # Nuclei
+        connection.execute(
+            "INSERT INTO Nuclei VALUES (?, ?, ?, ?);",
+            [1, 1, 4, 1],
+        )
+        connection.execute(
+            "INSERT INTO Nuclei VALUES (?, ?, ?, ?);",
+            [2, 2, 5, 1],
+        )
+
+        # cytoplasm
+        connection.execute(
+            "INSERT INTO Cytoplasm VALUES (?, ?, ?, ?, ?, ?);",
+            [1, 1, 6, 2, 4, 1],
+        )
+        connection.execute(
+            "INSERT INTO Cytoplasm VALUES (?, ?, ?, ?, ?, ?);",
+            [2, 2, 7, 3, 5, 1],
+        )
+
+    return engine
+
+
+class DatabaseFrame:
+    """
+    Create a scalable concat-mode export from
+    all tables within provided database.
+    """
+
+    def __init__(
+        self,
+        engine: str,
+    ) -> None:
+        self.sql_url = engine
+        self.engine = self.engine_from_str(sql_engine=engine)
+
+    @staticmethod
+    def engine_from_str(sql_engine: str) -> Engine:
+        """
+        Helper function to create engine from a string.
+
+        Parameters
+        ----------
+        sql_engine: str
+            filename of the SQLite database
+
+        Returns
+        -------
+        sqlalchemy.engine.base.Engine
+            A SQLAlchemy engine
+        """
+
+        # if we don't already have the sqlite filestring, add it
+        if "sqlite:///" not in sql_engine:
+            sql_engine = f"sqlite:///{sql_engine}"
+        engine = create_engine(sql_engine)
+
+        return engine
+
+    def collect_sql_tables(
+        self,
+        table_name: Optional[str] = None,
+    ) -> list:
+        """
+        Collect a list of tables from the given engine's
+        database using optional table specification.
+
+        Parameters
+        ----------
+        table_name: str
+            optional specific table name to check within database, by default None
+
+        Returns
+        -------
+        list
+            Returns list, and if populated, contains tuples with values
+            similar to the following. These may also be accessed by name
+            similar to dictionaries, as they are SQLAlchemy Row objects.
+            [('table_name'),...]
+        """
+
+        # create column list for return result
+        table_list = []
+
+        with self.engine.connect() as connection:
+            if table_name is None:
+                # if no table name is provided, we assume all tables must be scanned
+                # leaving out sqlite internal tables such as sqlite_stat1
+                table_list = connection.execute(
+                    "SELECT name as table_name FROM sqlite_master WHERE type = 'table' "
+                    "AND name NOT LIKE 'sqlite_%';"
+                ).fetchall()
+            else:
+                # otherwise we will focus on just the table name provided
+                table_list = [{"table_name": table_name}]
+
+        return table_list
+
+    def collect_sql_columns(
+        self,
+        table_name: Optional[str] = None,
+        column_name: Optional[str] = None,
+    ) -> list:
+        """
+        Collect a list of columns from the given engine's
+        database using optional table or column level
+        specification.
+
+        Parameters
+        ----------
+        table_name: str
+            optional specific table name to check within database, by default None
+        column_name: str
+            optional specific column name to check within database, by default None
+
+        Returns
+        -------
+        list
+            Returns list, and if populated, contains tuples with values
+            similar to the following. These may also be accessed by name
+            similar to dictionaries, as they are SQLAlchemy Row objects.
+            [('table_name', 'column_name', 'column_type', 'notnull'),...]
+        """
+
+        # create column list for return result
+        column_list = []
+
+        tables_list = self.collect_sql_tables(table_name=table_name)
+
+        with self.engine.connect() as connection:
+            for table in tables_list:
+
+                # if no column name is specified we will focus on all columns within the table
+                sql_stmt = """
+                SELECT :table_name as table_name,
+                        name as column_name,
+                        type as column_type,
+                        [notnull]
+                FROM pragma_table_info(:table_name)
+                """
+
+                if column_name is not None:
+                    # otherwise we will focus on only the column name provided
+                    sql_stmt = f"{sql_stmt} WHERE name = :col_name;"
+
+                # append to column list the results
+                column_list += connection.execute(
+                    sql_stmt,
+                    {
+                        "table_name": str(table["table_name"]),
+                        "col_name": str(column_name),
+                    },
+                ).fetchall()
+
+        return column_list
+
+    def unified_schema(
+        self,
+        join_keys: List[str] = None,
+    ) -> pa.Schema:
+        """
+        Build a unified arrow schema for all tables using only
+        declared column types, with table names prepended to all
+        columns other than the join keys.
+
+        Parameters
+        ----------
+        join_keys: List[str]
+            list of keys shared by all tables which are not prepended.
+            By default TableNumber and ImageNumber.
+
+        Returns
+        -------
+        pa.Schema
+            Unified schema with join keys first.
+        """
+
+        # set default join_key
+        if not join_keys:
+            join_keys = ["TableNumber", "ImageNumber"]
+
+        fields = {}
+        for coldata in self.collect_sql_columns():
+            name = (
+                coldata["column_name"]
+                if coldata["column_name"] in join_keys
+                else f"{coldata['table_name']}_{coldata['column_name']}"
+            )
+            # the first declared type of a shared join key is kept
+            if name not in fields:
+                fields[name] = pa.field(
+                    name,
+                    ARROW_TYPES[
+                        AFFINITY_TO_ARROW_TYPES[column_affinity(coldata["column_type"])]
+                    ],
+                )
+
+        return pa.schema(
+            [fields[name] for name in join_keys if name in fields]
+            + [field for name, field in fields.items() if name not in join_keys]
+        )
+
+    def sql_rowid_ranges(
+        self, table_name: str, chunk_size: int
+    ) -> List[Optional[Tuple[int, int]]]:
+        """
+        Split a table into inclusive rowid ranges. The rowid is the
+        table b-tree key, so each range is one seek and a sequential scan.
+
+        Parameters
+        ----------
+        table_name: str
+            specific table name to split
+        chunk_size: int
+            number of rowids within each range
+
+        Returns
+        -------
+        List[Optional[Tuple[int, int]]]
+            list of (start, end) rowid ranges, or [None] for tables
+            without a rowid which are read whole.
+        """
+
+        with self.engine.connect() as connection:
+            try:
+                min_rowid, max_rowid = connection.execute(
+                    f"SELECT min(rowid), max(rowid) FROM {table_name};"
+                ).fetchone()
+            except Exception:
+                # WITHOUT ROWID tables
+                return [None]
+
+        if min_rowid is None:
+            return []
+
+        return [
+            (start, min(start + chunk_size - 1, max_rowid))
+            for start in range(min_rowid, max_rowid + 1, chunk_size)
+        ]
+
+    def sql_select_rowid_range(
+        self,
+        table_name: str,
+        rowid_range: Optional[Tuple[int, int]],
+        avoid_prepend_for: List[str],
+    ) -> str:
+        """
+        Create a select statement for a rowid range of a table with
+        the table name prepended to column names.
+
+        Parameters
+        ----------
+        table_name: str
+            specific table name to select from
+        rowid_range: Optional[Tuple[int, int]]
+            inclusive (start, end) rowid range, or None for the whole table
+        avoid_prepend_for: List[str]
+            list of strings of column names to avoid prepending the table name to.
+
+        Returns
+        -------
+        str
+            SQL select statement
+        """
+
+        colstring = ",".join(
+            [
+                # cast datetimes as text and alias using the original column name
+                "{} as '{}'".format(
+                    coldata["column_name"]
+                    if coldata["column_type"] != "DATETIME"
+                    else "CAST({} AS TEXT)".format(coldata["column_name"]),
+                    f"{table_name}_{coldata['column_name']}"
+                    if coldata["column_name"] not in avoid_prepend_for
+                    else coldata["column_name"],
+                )
+                for coldata in self.collect_sql_columns(table_name=table_name)
+            ]
+        )
+        sql_stmt = f"select {colstring} from {table_name}"
+
+        if rowid_range is not None:
+            sql_stmt += f" where rowid between {rowid_range[0]} and {rowid_range[1]}"
+
+        return sql_stmt
+
+    @staticmethod
+    def conform_to_schema(table: pa.Table, schema: pa.Schema) -> pa.Table:
+        """
+        Conform a table read from one SQLite table to the unified
+        schema, creating null columns only for this chunk.
+
+        Parameters
+        ----------
+        table: pa.Table
+            table read from a rowid range
+        schema: pa.Schema
+            unified schema for all tables
+
+        Returns
+        -------
+        pa.Table
+            table with all unified schema columns in order
+        """
+
+        return pa.Table.from_arrays(
+            [
+                table.column(field.name).cast(field.type, safe=False)
+                if field.name in table.column_names
+                else pa.nulls(table.num_rows, type=field.type)
+                for field in schema
+            ],
+            schema=schema,
+        )
+
+    def read_rowid_ranges(
+        self,
+        join_keys: List[str] = None,
+        chunk_size: int = 100000,
+        workers: Optional[int] = None,
+    ) -> Iterator[pa.Table]:
+        """
+        Read all tables by rowid ranges using parallel workers,
+        yielding tables in order with at most two ranges per
+        worker in flight.
+
+        Parameters
+        ----------
+        join_keys: List[str]
+            list of keys shared by all tables which are not prepended.
+            By default TableNumber and ImageNumber.
+        chunk_size: int
+            number of rowids within each range
+        workers: int
+            number of parallel readers, by default os.cpu_count().
+
+        Yields
+        ------
+        pa.Table
+            table of a single rowid range
+        """
+
+        # set default join_key
+        if not join_keys:
+            join_keys = ["TableNumber", "ImageNumber"]
+
+        if not workers:
+            workers = os.cpu_count() or 1
+
+        queries = [
+            self.sql_select_rowid_range(
+                table_name=table["table_name"],
+                rowid_range=rowid_range,
+                avoid_prepend_for=join_keys,
+            )
+            for table in self.collect_sql_tables()
+            for rowid_range in self.sql_rowid_ranges(
+                table_name=table["table_name"], chunk_size=chunk_size
+            )
+        ]
+
+        # connectorx releases the gil while reading, so threads read in parallel
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            in_flight = collections.deque()
+            for sql_stmt in queries:
+                in_flight.append(
+                    executor.submit(
+                        cx.read_sql,
+                        str(self.engine.url).replace("///", "//"),
+                        sql_stmt,
+                        return_type="arrow",
+                    )
+                )
+                if len(in_flight) >= workers * 2:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+
+    def to_parquet(
+        self,
+        filename: str,
+        join_keys: List[str] = None,
+        chunk_size: int = 100000,
+        workers: Optional[int] = None,
+    ) -> str:
+        """
+        Export all tables stacked into a single parquet file with
+        a unified schema, reading by rowid ranges.
+
+        Parameters
+        ----------
+        filename: str
+            filepath of the parquet file to write.
+        join_keys: List[str]
+            list of keys shared by all tables which are not prepended.
+            By default TableNumber and ImageNumber.
+        chunk_size: int
+            number of rowids within each range
+        workers: int
+            number of parallel readers, by default os.cpu_count().
+
+        Returns
+        -------
+        str
+            filepath of the parquet file
+        """
+
+        schema = self.unified_schema(join_keys=join_keys)
+
+        with pq.ParquetWriter(filename, schema) as writer:
+            for table in self.read_rowid_ranges(
+                join_keys=join_keys, chunk_size=chunk_size, workers=workers
+            ):
+                writer.write_table(self.conform_to_schema(table=table, schema=schema))
+
+        return filename
+
+
+if __name__ == "__main__":
+    dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
+    print("\nFinal result\n")
+    print(dbf.unified_schema())
+    print(dbf.to_parquet(filename="./example.parquet", chunk_size=1))
+    print(pq.read_table("./example.parquet").to_pandas())
@@ -476,10 +476,11 @@ class DatabaseFrame:
         return filepath
 
 
-dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
-print("\nFinal result\n")
-print(dbf)
-print(dbf.tables_merged)
-print(dbf.to_parquet(filepath="exmaple.parquet"))
-print(pq.read_table("exmaple.parquet"))
-print(pq.read_table("exmaple.parquet").to_pandas())
+if __name__ == "__main__":
+    dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
+    print("\nFinal result\n")
+    print(dbf)
+    print(dbf.tables_merged)
+    print(dbf.to_parquet(filepath="exmaple.parquet"))
+    print(pq.read_table("exmaple.parquet"))
+    print(pq.read_table("exmaple.parquet").to_pandas())
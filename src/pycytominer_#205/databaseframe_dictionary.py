@@ -12,8 +12,6 @@ import ray
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
 
-ray.init()
-
 
 def database_engine_for_testing() -> Engine:
     """
@@ -324,14 +322,17 @@ class DatabaseFrame:
         return self.parquet_data
 
 
-dbf = DatabaseFrame.remote(engine=str(database_engine_for_testing().url))
-arrow_tables = ray.get(dbf.collect_arrow_tables.remote())
-print(arrow_tables)
-print(arrow_tables["tbl_a"])
-print(arrow_tables["tbl_b"])
-ray_datasets = ray.get(dbf.collect_ray_datasets.remote())
-print(ray_datasets)
-print(ray_datasets["tbl_a"].show())
-print(ray_datasets["tbl_b"].show())
-parquet_datasets = ray.get(dbf.to_parquet.remote())
-print(parquet_datasets)
+if __name__ == "__main__":
+    ray.init()
+
+    dbf = DatabaseFrame.remote(engine=str(database_engine_for_testing().url))
+    arrow_tables = ray.get(dbf.collect_arrow_tables.remote())
+    print(arrow_tables)
+    print(arrow_tables["tbl_a"])
+    print(arrow_tables["tbl_b"])
+    ray_datasets = ray.get(dbf.collect_ray_datasets.remote())
+    print(ray_datasets)
+    print(ray_datasets["tbl_a"].show())
+    print(ray_datasets["tbl_b"].show())
+    parquet_datasets = ray.get(dbf.to_parquet.remote())
+    print(parquet_datasets)
@@ -13,11 +13,8 @@ import ray
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
 
-
 modin.config.Engine.put("Ray")
 
-ray.init()
-
 
 def database_engine_for_testing() -> Engine:
     """
@@ -519,10 +516,13 @@ class DatabaseFrame:
         return filepath
 
 
-dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
-print("\nFinal result\n")
-print(dbf)
-print(dbf.dataframes_merged)
-working_dir = os.getcwd()
-print(dbf.to_parquet(filepath=f"./"))
-# print(pd.read_parquet("example.parquet"))
+if __name__ == "__main__":
+    ray.init()
+
+    dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
+    print("\nFinal result\n")
+    print(dbf)
+    print(dbf.dataframes_merged)
+    working_dir = os.getcwd()
+    print(dbf.to_parquet(filepath=f"./"))
+    # print(pd.read_parquet("example.parquet"))
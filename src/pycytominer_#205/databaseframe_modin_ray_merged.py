@@ -8,15 +8,14 @@ from typing import List, Optional
 
 import modin
 import modin.pandas as pd
-import pandas as _pd
 import numpy as np
+import pandas as _pd
 import pyarrow.parquet as pq
 import ray
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
 
 modin.config.Engine.put("Ray")
-ray.init()
 
 
 def database_engine_for_testing() -> Engine:
@@ -520,9 +519,12 @@ class DatabaseFrame:
         return filepath
 
 
-dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
-print("\nFinal result\n")
-print(dbf)
-print(dbf.dataframes_merged)
-print(dbf.to_parquet(filepath="./example.parquet"))
-print(pd.read_parquet("example.parquet"))
+if __name__ == "__main__":
+    ray.init()
+
+    dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
+    print("\nFinal result\n")
+    print(dbf)
+    print(dbf.dataframes_merged)
+    print(dbf.to_parquet(filepath="./example.parquet"))
+    print(pd.read_parquet("example.parquet"))
@@ -2,13 +2,14 @@
 DatabaseFrame class for extracting data as similar
 collection of in-memory data
 """
-from ntpath import join
 import os
 import tempfile
+from ntpath import join
 from typing import List, Optional
 
-import pandas as pd
 import numpy as np
+import pandas as pd
+from chunk_executor import ChunkExecutor
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
 
@@ -418,6 +419,7 @@ class DatabaseFrame:
         join_keys: List[str] = None,
         chunk_size: int = 50,
         filename: str = None,
+        executor: Optional[ChunkExecutor] = None,
     ) -> pd.DataFrame:
         """
         Create merged dataset for cytomining efforts.
@@ -435,6 +437,9 @@ class DatabaseFrame:
         join_keys: List[str]
             list of keys which will be used for join
             By default TableNumber and ImageNumber.
+        executor: ChunkExecutor
+            optional executor created with task=export_chunk which
+            runs chunks within recycled worker processes.
 
         Returns
         -------
@@ -467,34 +472,88 @@ class DatabaseFrame:
             for i in range(0, len(basis_dicts), chunk_size)
         ]
 
+        if executor is not None:
+            # run chunks within recycled worker processes
+            executor.run(
+                {
+                    "sql_url": self.sql_url,
+                    "basis_list_dicts": basis_list_dicts,
+                    "filename": f"{filename}_{count}.parquet",
+                }
+                for count, basis_list_dicts in enumerate(basis_list_dicts_chunks)
+            )
+            return len(basis_list_dicts_chunks)
+
         count = 0
         for basis_list_dicts in basis_list_dicts_chunks:
-            concatted = pd.DataFrame()
-            for table in self.collect_sql_tables():
-                to_concat = self.sql_table_to_pl_dataframe(
-                    table_name=table["table_name"],
-                    prepend_tablename_to_cols=True,
-                    avoid_prepend_for=["TableNumber", "ImageNumber"],
-                    basis_list_dicts=basis_list_dicts,
-                )
-                if len(concatted) == 0:
-                    concatted = to_concat
-                else:
-                    concatted = self.nan_data_fill(
-                        fill_into=concatted, fill_from=to_concat
-                    )
-                    to_concat = self.nan_data_fill(
-                        fill_into=to_concat, fill_from=concatted
-                    )
-                    concatted = pd.concat([concatted, to_concat])
-
-            concatted.to_parquet(f"{filename}_{count}.parquet")
+            self.chunk_to_parquet(
+                basis_list_dicts=basis_list_dicts,
+                filename=f"{filename}_{count}.parquet",
+            )
             count += 1
 
         return count
 
+    def chunk_to_parquet(self, basis_list_dicts: list, filename: str) -> str:
+        """
+        Concat all tables for a chunk of basis rows and write
+        them to a parquet file.
+
+        Parameters
+        ----------
+        basis_list_dicts: list
+            list of basis dictionaries (join key values) within the chunk
+        filename: str
+            parquet filepath to write
+
+        Returns
+        -------
+        str
+            parquet filepath
+        """
+
+        concatted = pd.DataFrame()
+        for table in self.collect_sql_tables():
+            to_concat = self.sql_table_to_pl_dataframe(
+                table_name=table["table_name"],
+                prepend_tablename_to_cols=True,
+                avoid_prepend_for=["TableNumber", "ImageNumber"],
+                basis_list_dicts=basis_list_dicts,
+            )
+            if len(concatted) == 0:
+                concatted = to_concat
+            else:
+                concatted = self.nan_data_fill(fill_into=concatted, fill_from=to_concat)
+                to_concat = self.nan_data_fill(fill_into=to_concat, fill_from=concatted)
+                concatted = pd.concat([concatted, to_concat])
+
+        concatted.to_parquet(filename)
+
+        return filename
+
+
+def export_chunk(chunk: dict) -> str:
+    """
+    Export a chunk within a ChunkExecutor worker process.
+
+    Parameters
+    ----------
+    chunk: dict
+        dictionary with sql_url, basis_list_dicts and filename keys
+
+    Returns
+    -------
+    str
+        parquet filepath
+    """
+
+    return DatabaseFrame(engine=chunk["sql_url"]).chunk_to_parquet(
+        basis_list_dicts=chunk["basis_list_dicts"], filename=chunk["filename"]
+    )
+
 
-dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
-print("\nFinal result\n")
-print(dbf.to_parquet(filename="./data/example"))
-print(pd.read_parquet("./data"))
+if __name__ == "__main__":
+    dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
+    print("\nFinal result\n")
+    print(dbf.to_parquet(filename="./data/example"))
+    print(pd.read_parquet("./data"))
@@ -6,8 +6,8 @@ import os
 import tempfile
 from typing import List, Optional
 
-import pandas as pd
 import numpy as np
+import pandas as pd
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
 
@@ -470,9 +470,10 @@ class DatabaseFrame:
         return filepath
 
 
-dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
-print("\nFinal result\n")
-print(dbf)
-print(dbf.dataframes_merged)
-print(dbf.to_parquet(filepath="example.parquet"))
-print(pd.read_parquet("example.parquet"))
+if __name__ == "__main__":
+    dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
+    print("\nFinal result\n")
+    print(dbf)
+    print(dbf.dataframes_merged)
+    print(dbf.to_parquet(filepath="example.parquet"))
+    print(pd.read_parquet("example.parquet"))
@@ -442,9 +442,10 @@ class DatabaseFrame:
         return filepath
 
 
-dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
-print("\nFinal result\n")
-print(dbf)
-print(dbf.dataframes_merged)
-print(dbf.to_parquet(filepath="./example.parquet"))
-print(pl.read_parquet("example.parquet"))
+if __name__ == "__main__":
+    dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
+    print("\nFinal result\n")
+    print(dbf)
+    print(dbf.dataframes_merged)
+    print(dbf.to_parquet(filepath="./example.parquet"))
+    print(pl.read_parquet("example.parquet"))
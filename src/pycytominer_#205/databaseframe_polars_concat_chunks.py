@@ -2,15 +2,18 @@
 DatabaseFrame class for extracting data as similar
 collection of in-memory data
 """
-from ntpath import join
 import os
 import tempfile
-from typing import List, Optional
+from contextlib import contextmanager
+from ntpath import join
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import connectorx as cx
 import polars as pl
+from chunk_pipeline import ChunkPipeline
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
+from stage_metrics import Stage, StageMetrics
 
 
 def database_engine_for_testing() -> Engine:
@@ -406,6 +409,8 @@ class DatabaseFrame:
         join_keys: List[str] = None,
         chunk_size: int = 50,
         filename: str = None,
+        metrics: Optional[StageMetrics] = None,
+        pipeline: ChunkPipeline = None,
     ) -> pl.DataFrame:
         """
         Create merged dataset for cytomining efforts.
@@ -423,6 +428,12 @@ class DatabaseFrame:
         join_keys: List[str]
             list of keys which will be used for join
             By default TableNumber and ImageNumber.
+        metrics: StageMetrics
+            optional per-stage metrics for read, fill, join and write.
+        pipeline: ChunkPipeline
+            optional pipeline which overlaps reading, filling and
+            writing of chunks. Its read, transform and write functions
+            are set here, so only pool sizes need to be provided.
 
         Returns
         -------
@@ -430,6 +441,16 @@ class DatabaseFrame:
             Single merged dataset from compartments provided.
         """
 
+        @contextmanager
+        def measure(name: str, **labels) -> Iterator[Stage]:
+            # stages are only measured (resetting the process's peak rss)
+            # when metrics are provided
+            if metrics is None:
+                yield Stage(name, **labels)
+                return
+            with metrics.stage(name, **labels) as measured:
+                yield measured
+
         if not basis:
             basis = "image"
 
@@ -455,34 +476,85 @@ class DatabaseFrame:
             for i in range(0, len(basis_dicts), chunk_size)
         ]
 
-        count = 0
-        for basis_list_dicts in basis_list_dicts_chunks:
-            concatted = pl.DataFrame()
+        def read_chunk(
+            chunk: Tuple[int, List[Dict]]
+        ) -> Tuple[int, List[Tuple[str, pl.DataFrame]]]:
+            count, basis_list_dicts = chunk
+            frames = []
             for table in self.collect_sql_tables():
-                to_concat = self.sql_table_to_pl_dataframe(
-                    table_name=table["table_name"],
-                    prepend_tablename_to_cols=True,
-                    avoid_prepend_for=["TableNumber", "ImageNumber"],
-                    basis_list_dicts=basis_list_dicts,
-                )
+                # note: column renames take place within the read's select
+                with measure("read", table=table["table_name"], chunk=count) as stage:
+                    to_concat = self.sql_table_to_pl_dataframe(
+                        table_name=table["table_name"],
+                        prepend_tablename_to_cols=True,
+                        avoid_prepend_for=["TableNumber", "ImageNumber"],
+                        basis_list_dicts=basis_list_dicts,
+                    )
+                    stage.add(rows=len(to_concat), bytes=to_concat.estimated_size())
+                frames.append((table["table_name"], to_concat))
+            return count, frames
+
+        def transform_chunk(
+            chunk: Tuple[int, List[Tuple[str, pl.DataFrame]]]
+        ) -> Tuple[int, pl.DataFrame]:
+            count, frames = chunk
+            concatted = pl.DataFrame()
+            for table_name, to_concat in frames:
                 if len(concatted) == 0:
                     concatted = to_concat
                 else:
-                    concatted = self.nan_data_fill(
-                        fill_into=concatted, fill_from=to_concat
-                    )
-                    to_concat = self.nan_data_fill(
-                        fill_into=to_concat, fill_from=concatted
-                    )
-                    concatted = pl.concat([concatted, to_concat])
+                    with measure("fill", table=table_name, chunk=count) as stage:
+                        concatted = self.nan_data_fill(
+                            fill_into=concatted, fill_from=to_concat
+                        )
+                        to_concat = self.nan_data_fill(
+                            fill_into=to_concat, fill_from=concatted
+                        )
+                        stage.add(
+                            rows=len(concatted) + len(to_concat),
+                            bytes=concatted.estimated_size()
+                            + to_concat.estimated_size(),
+                        )
+                    with measure("join", table=table_name, chunk=count) as stage:
+                        concatted = pl.concat([concatted, to_concat])
+                        stage.add(rows=len(concatted), bytes=concatted.estimated_size())
+            return count, concatted
+
+        def write_chunk(chunk: Tuple[int, pl.DataFrame]) -> str:
+            count, concatted = chunk
+            with measure("write", chunk=count) as stage:
+                concatted.write_parquet(f"{filename}_{count}.parquet")
+                stage.add(
+                    rows=len(concatted),
+                    bytes=os.path.getsize(f"{filename}_{count}.parquet"),
+                )
+            return f"{filename}_{count}.parquet"
+
+        chunks = list(enumerate(basis_list_dicts_chunks))
+
+        if pipeline:
+            # overlap reads, fills and writes with bounded chunks in flight
+            pipeline.read = read_chunk
+            pipeline.transform = transform_chunk
+            pipeline.write = write_chunk
+            pipeline.run(chunks)
+        else:
+            for chunk in chunks:
+                write_chunk(transform_chunk(read_chunk(chunk)))
 
-            concatted.write_parquet(f"{filename}_{count}.parquet")
-            count += 1
+        count = len(chunks)
 
         return count
 
 
-dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
-print("\nFinal result\n")
-print(dbf.to_parquet(filename="./example"))
-print(pl.read_parquet("example*.parquet"))
+if __name__ == "__main__":
+    dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
+    print("\nFinal result\n")
+    metrics = StageMetrics()
+    print(dbf.to_parquet(filename="./example", metrics=metrics))
+    print(metrics.summary())
+    print(metrics.to_json("./example_metrics.json"))
+    pipeline = ChunkPipeline(readers=2, max_in_flight=4)
+    print(dbf.to_parquet(filename="./example_pipelined", pipeline=pipeline))
+    print(pipeline.report())
+    print(pl.read_parquet("example*.parquet"))
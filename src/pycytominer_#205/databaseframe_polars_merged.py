@@ -7,8 +7,8 @@ import tempfile
 from typing import List, Optional
 
 import connectorx as cx
-import polars as pl
 import numpy as np
+import polars as pl
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
 
@@ -483,9 +483,10 @@ class DatabaseFrame:
         return filepath
 
 
-dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
-print("\nFinal result\n")
-print(dbf)
-print(dbf.dataframes_merged)
-print(dbf.to_parquet(filepath="example.parquet"))
-print(pl.read_parquet("example.parquet"))
+if __name__ == "__main__":
+    dbf = DatabaseFrame(engine=str(database_engine_for_testing().url))
+    print("\nFinal result\n")
+    print(dbf)
+    print(dbf.dataframes_merged)
+    print(dbf.to_parquet(filepath="example.parquet"))
+    print(pl.read_parquet("example.parquet"))
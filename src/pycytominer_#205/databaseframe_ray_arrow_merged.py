@@ -13,8 +13,6 @@ import ray
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
 
-ray.init()
-
 
 def database_engine_for_testing() -> Engine:
     """
@@ -536,8 +534,11 @@ class DatabaseFrame:
         return self.parquet_data
 
 
-dbf = DatabaseFrame.remote(engine=str(database_engine_for_testing().url))
-print(ray.get((dbf.to_cytomining_merged.remote())))
-print(ray.get(dbf.to_parquet.remote(filepath="example.parquet")))
-print(pq.read_table("example.parquet"))
-print(pq.read_table("example.parquet").to_pandas())
+if __name__ == "__main__":
+    ray.init()
+
+    dbf = DatabaseFrame.remote(engine=str(database_engine_for_testing().url))
+    print(ray.get((dbf.to_cytomining_merged.remote())))
+    print(ray.get(dbf.to_parquet.remote(filepath="example.parquet")))
+    print(pq.read_table("example.parquet"))
+    print(pq.read_table("example.parquet").to_pandas())
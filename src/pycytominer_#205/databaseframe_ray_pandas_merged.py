@@ -6,14 +6,12 @@ import os
 import tempfile
 from typing import List, Optional
 
-import pandas as pd
 import numpy as np
+import pandas as pd
 import ray
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
 
-ray.init()
-
 
 def database_engine_for_testing() -> Engine:
     """
@@ -474,7 +472,10 @@ class DatabaseFrame:
         return filepath
 
 
-dbf = DatabaseFrame.remote(engine=str(database_engine_for_testing().url))
-print(ray.get((dbf.to_cytomining_merged.remote())))
-print(ray.get(dbf.to_parquet.remote(filepath="example.parquet")))
-print(pd.read_parquet("example.parquet"))
+if __name__ == "__main__":
+    ray.init()
+
+    dbf = DatabaseFrame.remote(engine=str(database_engine_for_testing().url))
+    print(ray.get((dbf.to_cytomining_merged.remote())))
+    print(ray.get(dbf.to_parquet.remote(filepath="example.parquet")))
+    print(pd.read_parquet("example.parquet"))
@@ -0,0 +1,140 @@
+"""
+Registry of DatabaseFrame engines which imports an engine's module,
+and so its backends (ray, modin, dask, prefect, polars, connectorx,
+pyarrow...), only when the engine is selected.
+
+Importing this module imports no backends, and none of the engine
+modules start clusters or run conversions when imported (demos run
+under __main__ only), so CLIs and Dask or Ray worker processes which
+need one engine only load that engine's backends.
+See check_import_time.py for the import time budget.
+
+Example:
+DatabaseFrame = load_engine("arrow_concat_rowid_chunks")
+DatabaseFrame(engine="sqlite:///SQ00014613.sqlite").to_parquet("SQ00014613.parquet")
+"""
+import importlib
+from typing import Dict, List
+
+# backends which are too heavy to import unless their engine is selected
+HEAVY_BACKENDS = [
+    "ray",
+    "modin",
+    "dask",
+    "distributed",
+    "prefect",
+    "polars",
+    "connectorx",
+    "pyarrow",
+    "pandas",
+]
+
+# engine name to the module providing its DatabaseFrame and the backends
+# it imports (pandas and modin write parquet through pyarrow)
+ENGINES: Dict[str, Dict] = {
+    "arrow_concat_dataset": {
+        "module": "databaseframe_arrow_concat_dataset",
+        "backends": ["connectorx", "pyarrow"],
+    },
+    "arrow_column_groups": {
+        "module": "databaseframe_arrow_column_groups",
+        "backends": ["connectorx", "pyarrow"],
+    },
+    "arrow_concat_rowid_chunks": {
+        "module": "databaseframe_arrow_concat_rowid_chunks",
+        "backends": ["connectorx", "pyarrow"],
+    },
+    "arrow_merged": {
+        "module": "databaseframe_arrow_merged",
+        "backends": ["connectorx", "pyarrow"],
+    },
+    "dictionary": {
+        "module": "databaseframe_dictionary",
+        "backends": ["connectorx", "pyarrow", "ray"],
+    },
+    "modin_dask_concat": {
+        "module": "databaseframe_modin_dask_concat",
+        "backends": ["modin", "pandas", "pyarrow", "dask", "distributed"],
+    },
+    "modin_dask_merged": {
+        "module": "databaseframe_modin_dask_merged",
+        "backends": ["modin", "pandas", "pyarrow", "dask", "distributed"],
+    },
+    "modin_ray_concat": {
+        "module": "databaseframe_modin_ray_concat",
+        "backends": ["modin", "pandas", "pyarrow", "ray"],
+    },
+    "modin_ray_merged": {
+        "module": "databaseframe_modin_ray_merged",
+        "backends": ["modin", "pandas", "pyarrow", "ray"],
+    },
+    "pandas_concat": {
+        "module": "databaseframe_pandas_concat",
+        "backends": ["pandas", "pyarrow"],
+    },
+    "pandas_concat_chunks": {
+        "module": "databaseframe_pandas_concat_chunks",
+        "backends": ["pandas", "pyarrow"],
+    },
+    "pandas_merged": {
+        "module": "databaseframe_pandas_merged",
+        "backends": ["pandas", "pyarrow"],
+    },
+    "polars_concat": {
+        "module": "databaseframe_polars_concat",
+        "backends": ["connectorx", "polars"],
+    },
+    "polars_concat_chunks": {
+        "module": "databaseframe_polars_concat_chunks",
+        "backends": ["connectorx", "polars"],
+    },
+    "polars_merged": {
+        "module": "databaseframe_polars_merged",
+        "backends": ["connectorx", "polars"],
+    },
+    "ray_arrow_merged": {
+        "module": "databaseframe_ray_arrow_merged",
+        "backends": ["connectorx", "pyarrow", "ray"],
+    },
+    "ray_pandas_merged": {
+        "module": "databaseframe_ray_pandas_merged",
+        "backends": ["pandas", "pyarrow", "ray"],
+    },
+}
+
+
+def available_engines() -> List[str]:
+    """
+    Names of registered engines.
+
+    Returns
+    -------
+    List[str]
+        engine names
+    """
+
+    return sorted(ENGINES)
+
+
+def load_engine(name: str) -> type:
+    """
+    Import an engine's module and return its DatabaseFrame class.
+
+    Parameters
+    ----------
+    name: str
+        engine name, see available_engines
+
+    Returns
+    -------
+    type
+        the engine's DatabaseFrame class (a Ray actor class for
+        dictionary, ray_arrow_merged and ray_pandas_merged)
+    """
+
+    if name not in ENGINES:
+        raise ValueError(
+            f"Unknown engine {name}, select one of {', '.join(available_engines())}"
+        )
+
+    return importlib.import_module(ENGINES[name]["module"]).DatabaseFrame
@@ -0,0 +1,284 @@
+"""
+On-disk cache of merged single-cell results as Arrow IPC (Feather v2)
+files which are memory-mapped when reopened.
+
+Entries are keyed by the SQLite source fingerprint (see task_cache.py),
+compartments, join keys, column projection and dtype policy, and are
+evicted least recently used first under a disk budget. Uncompressed
+entries are read without copying, so reopening a merged plate takes
+milliseconds and uses the page cache instead of private heap memory.
+lz4 entries are smaller on disk but are decompressed into memory.
+
+Example:
+cache = MergedArrowCache(cache_dir="./cache/merged", max_bytes=50 * 1024**3)
+key = cache.key(sql_url, compartments=["Cells", "Cytoplasm", "Nuclei"])
+merged = cache.get_or_create(
+    key, lambda: DatabaseFrame(engine=sql_url).to_cytomining_merged()
+)
+"""
+import os
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from task_cache import cache_key, evict_cache
+
+# dtype policies which may be applied to merged results before caching
+DTYPE_POLICIES = {
+    None: {},
+    "float32": {pa.float64(): pa.float32()},
+}
+
+
+def apply_dtype_policy(table: pa.Table, dtype_policy: Optional[str]) -> pa.Table:
+    """
+    Cast columns of a table according to a dtype policy.
+
+    Parameters
+    ----------
+    table: pa.Table
+        table to cast
+    dtype_policy: str
+        key of DTYPE_POLICIES, None leaves types as they are.
+
+    Returns
+    -------
+    pa.Table
+        table with casted columns
+    """
+
+    casts = DTYPE_POLICIES[dtype_policy]
+    if not casts:
+        return table
+
+    return pa.Table.from_arrays(
+        [
+            pc.cast(column, casts[column.type]) if column.type in casts else column
+            for column in table.columns
+        ],
+        names=table.column_names,
+    )
+
+
+class MergedArrowCache:
+    """
+    Cache merged results as memory-mapped Arrow IPC files.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = "./cache/merged",
+        max_bytes: Optional[int] = None,
+        compression: Optional[str] = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        cache_dir: str
+            directory of cached results, by default ./cache/merged
+        max_bytes: int
+            optional disk budget in bytes for cached results
+        compression: str
+            None (memory-mapped without copies) or lz4
+        """
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.compression = compression
+        # projection and dtype policy of each key, applied on misses
+        self.specs: Dict[str, Dict] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(
+        self,
+        sql_url: str,
+        compartments: List[str] = None,
+        join_keys: List[str] = None,
+        columns: Optional[List[str]] = None,
+        dtype_policy: Optional[str] = None,
+    ) -> str:
+        """
+        Create a cache key for a merged result, remembering the
+        projection and dtype policy which get_or_create applies.
+
+        Parameters
+        ----------
+        sql_url: str
+            url or filepath of the SQLite source
+        compartments: List[str]
+            list of compartments which are merged.
+            By default Cells, Cytoplasm, Nuclei.
+        join_keys: List[str]
+            list of keys which are used for joins
+            By default TableNumber and ImageNumber.
+        columns: List[str]
+            optional projection of merged columns
+        dtype_policy: str
+            optional key of DTYPE_POLICIES
+
+        Returns
+        -------
+        str
+            cache key
+        """
+
+        # set default join_key
+        if not join_keys:
+            join_keys = ["TableNumber", "ImageNumber"]
+
+        # set default compartments
+        if not compartments:
+            compartments = ["Cells", "Cytoplasm", "Nuclei"]
+
+        key = cache_key(
+            "merged",
+            sql_url,
+            compartments=compartments,
+            join_keys=join_keys,
+            columns=columns,
+            dtype_policy=dtype_policy,
+        )
+        self.specs[key] = {"columns": columns, "dtype_policy": dtype_policy}
+
+        return key
+
+    def filepath(self, key: str) -> str:
+        """
+        Filepath of a cache entry.
+
+        Parameters
+        ----------
+        key: str
+            cache key
+
+        Returns
+        -------
+        str
+            filepath of the Arrow IPC file
+        """
+
+        return os.path.join(self.cache_dir, f"{key}.arrow")
+
+    def get(self, key: str) -> Optional[pa.Table]:
+        """
+        Open a cached result by memory-mapping its file.
+
+        Parameters
+        ----------
+        key: str
+            cache key
+
+        Returns
+        -------
+        Optional[pa.Table]
+            cached table, or None when there is no entry.
+        """
+
+        filepath = self.filepath(key)
+        try:
+            source = pa.memory_map(filepath, "r")
+            # mark as recently used for eviction
+            os.utime(filepath)
+        except FileNotFoundError:
+            return None
+
+        return pa.ipc.open_file(source).read_all()
+
+    def put(self, key: str, table: pa.Table) -> str:
+        """
+        Write a result to the cache and evict entries over the disk budget.
+
+        Parameters
+        ----------
+        key: str
+            cache key
+        table: pa.Table
+            table to cache
+
+        Returns
+        -------
+        str
+            filepath of the cache entry
+        """
+
+        filepath = self.filepath(key)
+        # write then rename so readers never map a partial file
+        tmp_filepath = f"{filepath}.{uuid.uuid4().hex}.tmp"
+        with pa.OSFile(tmp_filepath, "wb") as sink:
+            with pa.ipc.new_file(
+                sink,
+                table.schema,
+                options=pa.ipc.IpcWriteOptions(compression=self.compression),
+            ) as writer:
+                writer.write_table(table)
+        os.replace(tmp_filepath, filepath)
+
+        if self.max_bytes is not None:
+            evict_cache(cache_dir=self.cache_dir, max_bytes=self.max_bytes)
+
+        return filepath
+
+    def get_or_create(
+        self,
+        key: str,
+        create: Callable[[], pa.Table],
+    ) -> pa.Table:
+        """
+        Open a cached result or create, cache and open it.
+        On a miss the projection and dtype policy given to
+        MergedArrowCache.key for the key are applied before caching.
+
+        Parameters
+        ----------
+        key: str
+            cache key from MergedArrowCache.key of this cache
+        create: Callable[[], pa.Table]
+            function which creates the merged table on a miss
+
+        Returns
+        -------
+        pa.Table
+            cached table, memory-mapped from the cache entry.
+        """
+
+        table = self.get(key)
+        if table is not None:
+            return table
+
+        if key not in self.specs:
+            raise ValueError(f"Cache key {key} was not created by this cache's key()")
+        spec = self.specs[key]
+
+        table = create()
+        if spec["columns"] is not None:
+            table = table.select(spec["columns"])
+        table = apply_dtype_policy(table, spec["dtype_policy"])
+        self.put(key, table)
+
+        # prefer the mapped entry unless it was evicted as over budget
+        cached = self.get(key)
+
+        return cached if cached is not None else table
+
+
+if __name__ == "__main__":
+    import sqlite3
+    import tempfile
+
+    sql_path = f"{tempfile.gettempdir()}/merged_cache_example.sqlite"
+    with sqlite3.connect(sql_path) as connection:
+        connection.execute("CREATE TABLE IF NOT EXISTS Image (ImageNumber INTEGER);")
+
+    cache = MergedArrowCache(cache_dir=f"{tempfile.gettempdir()}/merged_cache")
+    key = cache.key(sql_path, dtype_policy="float32")
+    for _ in range(2):
+        start = time.perf_counter()
+        merged = cache.get_or_create(
+            key,
+            lambda: pa.table(
+                {"ImageNumber": list(range(100000)), "Cells_Data": [0.5] * 100000}
+            ),
+        )
+        print(merged.schema, f"{time.perf_counter() - start:.4f}s")
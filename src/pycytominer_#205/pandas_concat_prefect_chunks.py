@@ -12,12 +12,15 @@ import numpy as np
 import pandas as pd
 import pyarrow as pa
 import pyarrow.parquet as pq
+from parquet_profiles import ProfiledParquetWriter
+from parquet_profiles import write_table as write_profiled_table
 from prefect import Flow, Parameter, task, unmapped
 from prefect.engine.results import LocalResult
 from prefect.executors import DaskExecutor, Executor, LocalExecutor
 from prefect.storage import Local
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
+from task_cache import cache_key, chunk_key_range, evict_cache
 
 if __name__ == "__main__":
 
@@ -127,6 +130,60 @@ if __name__ == "__main__":
 
         return engine
 
+    def engine_url(engine) -> str:
+        """
+        Helper function to find the url of an engine or engine string.
+        """
+        return str(engine.url) if type(engine) is Engine else str(engine)
+
+    def collect_sql_tables_target(engine, table_name=None, **kwargs) -> str:
+        """
+        Cached result location for collect_sql_tables keyed on
+        the source fingerprint.
+        """
+        return "collect_sql_tables/" + cache_key(
+            "collect_sql_tables", engine_url(engine), table_name=table_name
+        )
+
+    def sql_select_distinct_join_basis_target(
+        engine, table_name, join_keys, chunk_size, **kwargs
+    ) -> str:
+        """
+        Cached result location for sql_select_distinct_join_basis keyed
+        on the source fingerprint and chunking options.
+        """
+        return "sql_select_distinct_join_basis/" + cache_key(
+            "sql_select_distinct_join_basis",
+            engine_url(engine),
+            table_name=table_name,
+            join_keys=join_keys,
+            chunk_size=chunk_size,
+            ordered=True,
+        )
+
+    def table_concatenator_target(
+        engine,
+        table_list,
+        prepend_tablename_to_cols,
+        avoid_prepend_for,
+        basis_list_dicts,
+        **kwargs,
+    ) -> str:
+        """
+        Cached result location for table_concatenator keyed on the
+        source fingerprint, chunk key range and schema options. Output
+        options (filename, compression) are left out of the key so that
+        changing them skips extraction.
+        """
+        return "table_concatenator/" + cache_key(
+            "table_concatenator",
+            engine_url(engine),
+            tables=[table["table_name"] for table in table_list],
+            prepend_tablename_to_cols=prepend_tablename_to_cols,
+            avoid_prepend_for=avoid_prepend_for,
+            chunk=chunk_key_range(basis_list_dicts),
+        )
+
     @task
     def engine_from_str(sql_engine: str) -> Engine:
         """
@@ -153,7 +210,7 @@ if __name__ == "__main__":
 
         return engine
 
-    @task
+    @task(checkpoint=True, target=collect_sql_tables_target)
     def collect_sql_tables(
         engine,
         table_name: Optional[str] = None,
@@ -252,13 +309,15 @@ if __name__ == "__main__":
 
         return column_list
 
-    @task
+    @task(checkpoint=True, target=sql_select_distinct_join_basis_target)
     def sql_select_distinct_join_basis(
         engine, table_name: str, join_keys: List[str], chunk_size: int
     ) -> list:
         join_keys_str = ", ".join(join_keys)
+        # ordered so chunks, and the files written from them, follow key order
         sql_stmt = f"""
         select distinct {join_keys_str} from {table_name}
+        order by {join_keys_str}
         """
         basis_dicts = pd.read_sql(
             sql_stmt,
@@ -414,7 +473,7 @@ if __name__ == "__main__":
 
         return fill_into
 
-    @task
+    @task(checkpoint=True, target=table_concatenator_target)
     def table_concatenator(
         engine,
         table_list,
@@ -444,7 +503,10 @@ if __name__ == "__main__":
     def _to_parquet(df: pd.DataFrame, filename: str) -> str:
         file_uuid = str(uuid.uuid4().hex)
         filename_uuid = f"{filename}-{file_uuid}.parquet"
-        df.to_parquet(filename_uuid)
+        # sorted by keys with sized row groups, page indexes and bloom filters
+        write_profiled_table(
+            pa.Table.from_pandas(df, preserve_index=False), filename_uuid
+        )
         return filename_uuid
 
     @task
@@ -457,12 +519,15 @@ if __name__ == "__main__":
         if os.path.isfile(full_filename):
             os.remove(full_filename)
 
-        writer = pq.ParquetWriter(full_filename, pq.read_table(pq_files[0]).schema)
-        for tbl in pq_files:
-            writer.write_table(pq.read_table(tbl))
-            os.remove(tbl)
-
-        writer.close()
+        # files follow the ordered basis, so the single file stays sorted
+        with ProfiledParquetWriter(
+            full_filename,
+            pq.read_schema(pq_files[0]),
+            ndv=sum(pq.ParquetFile(tbl).metadata.num_rows for tbl in pq_files),
+        ) as writer:
+            for tbl in pq_files:
+                writer.write_table(pq.read_table(tbl))
+                os.remove(tbl)
 
         return full_filename
 
@@ -474,6 +539,9 @@ if __name__ == "__main__":
         join_keys: List[str] = None,
         chunk_size: int = 50,
         filename: str = None,
+        cache_dir: str = "./cache",
+        cache_max_bytes: Optional[int] = None,
+        cache_max_age: Optional[float] = None,
     ) -> pd.DataFrame:
         """
         Create merged dataset for cytomining efforts.
@@ -491,6 +559,12 @@ if __name__ == "__main__":
         join_keys: List[str]
             list of keys which will be used for join
             By default TableNumber and ImageNumber.
+        cache_dir: str
+            directory for cached task results, by default ./cache
+        cache_max_bytes: int
+            optional maximum bytes of cached results kept between runs
+        cache_max_age: float
+            optional maximum seconds since a cached result was last used
 
         Returns
         -------
@@ -500,6 +574,11 @@ if __name__ == "__main__":
         if not executor:
             executor = LocalExecutor()
 
+        # evict cached task results before they may be reused
+        evict_cache(
+            cache_dir=cache_dir, max_bytes=cache_max_bytes, max_age=cache_max_age
+        )
+
         if not basis:
             basis = "image"
 
@@ -515,7 +594,9 @@ if __name__ == "__main__":
         # if len(pandas_data) == 0:
         #   pandas_data = collect_pandas_dataframes()
 
-        with Flow("to parquet", storage=Local(), result=LocalResult()) as flow:
+        with Flow(
+            "to parquet", storage=Local(), result=LocalResult(dir=cache_dir)
+        ) as flow:
 
             param_engine = Parameter("engine", default="")
             param_basis = Parameter("basis", default="image")
@@ -555,6 +636,8 @@ if __name__ == "__main__":
 
         state = flow.run(
             executor=executor,
+            # local flow runs only check task targets when checkpointing is enabled
+            context={"checkpointing": True},
             parameters=dict(
                 engine=engine,
                 basis=basis,
@@ -0,0 +1,719 @@
+"""
+Compact many small parquet files (for example chunk outputs such as
+example_{count}.parquet) into fewer files of a target size.
+
+Row groups are copied as raw bytes: column chunks, bloom filters and
+page indexes are copied from each source file and only the footer is
+rewritten (with offsets shifted to their new positions), so data is
+never decoded or re-encoded. Files are only combined when their parquet
+schemas match exactly. Row groups smaller than min_row_group_bytes are
+coalesced by reading and re-encoding them together (using an output
+profile from parquet_profiles.py) and the result is copied in the same
+way. Outputs are independent and may be compacted in parallel.
+
+Footers are read and written with a small thrift compact protocol
+codec, see https://github.com/apache/parquet-format and
+https://github.com/apache/thrift/blob/master/doc/specs/thrift-compact-protocol.md
+
+Example:
+python parquet_compact.py "example_*.parquet" --output-prefix example_compacted
+"""
+import argparse
+import glob
+import io
+import os
+import re
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from parquet_profiles import QUERY_PROFILE, open_parquet_writer, parquet_writer_options
+
+# default size of compacted files
+TARGET_FILE_BYTES = 512 * 1024 * 1024
+
+# row groups below this many compressed bytes are coalesced
+MIN_ROW_GROUP_BYTES = 8 * 1024 * 1024
+
+# bytes copied at once between files
+COPY_BUFFER_BYTES = 16 * 1024 * 1024
+
+# thrift compact protocol types
+BOOL_TRUE, BOOL_FALSE, BYTE, I16, I32, I64, DOUBLE, BINARY = 1, 2, 3, 4, 5, 6, 7, 8
+LIST, SET, MAP, STRUCT = 9, 10, 11, 12
+
+# a thrift struct is kept as {field id: (type, value)}, lists and sets as
+# (element type, [values]) and maps as (key type, value type, [(key, value)])
+Struct = Dict[int, Tuple[int, Any]]
+
+
+def _read_varint(buffer: bytes, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return result, pos
+
+
+def _write_varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_value(buffer: bytes, pos: int, value_type: int) -> Tuple[Any, int]:
+    if value_type in [BOOL_TRUE, BOOL_FALSE]:
+        # only reached within lists, where booleans take a byte
+        return buffer[pos] == BOOL_TRUE, pos + 1
+    if value_type == BYTE:
+        return struct.unpack_from("<b", buffer, pos)[0], pos + 1
+    if value_type in [I16, I32, I64]:
+        value, pos = _read_varint(buffer, pos)
+        return (value >> 1) ^ -(value & 1), pos
+    if value_type == DOUBLE:
+        return struct.unpack_from("<d", buffer, pos)[0], pos + 8
+    if value_type == BINARY:
+        length, pos = _read_varint(buffer, pos)
+        return bytes(buffer[pos : pos + length]), pos + length
+    if value_type in [LIST, SET]:
+        header = buffer[pos]
+        pos += 1
+        size, element_type = header >> 4, header & 0x0F
+        if size == 15:
+            size, pos = _read_varint(buffer, pos)
+        values = []
+        for _ in range(size):
+            value, pos = _read_value(buffer, pos, element_type)
+            values.append(value)
+        return (element_type, values), pos
+    if value_type == MAP:
+        size, pos = _read_varint(buffer, pos)
+        if size == 0:
+            return (0, 0, []), pos
+        key_type, item_type = buffer[pos] >> 4, buffer[pos] & 0x0F
+        pos += 1
+        items = []
+        for _ in range(size):
+            key, pos = _read_value(buffer, pos, key_type)
+            item, pos = _read_value(buffer, pos, item_type)
+            items.append((key, item))
+        return (key_type, item_type, items), pos
+    if value_type == STRUCT:
+        return read_thrift_struct(buffer, pos)
+
+    raise ValueError(f"Unknown thrift compact type {value_type}")
+
+
+def _write_value(value: Any, value_type: int) -> bytes:
+    if value_type in [BOOL_TRUE, BOOL_FALSE]:
+        return bytes([BOOL_TRUE if value else BOOL_FALSE])
+    if value_type == BYTE:
+        return struct.pack("<b", value)
+    if value_type in [I16, I32, I64]:
+        return _write_varint((value << 1) ^ (value >> 63))
+    if value_type == DOUBLE:
+        return struct.pack("<d", value)
+    if value_type == BINARY:
+        return _write_varint(len(value)) + value
+    if value_type in [LIST, SET]:
+        element_type, values = value
+        if len(values) < 15:
+            out = bytes([len(values) << 4 | element_type])
+        else:
+            out = bytes([0xF0 | element_type]) + _write_varint(len(values))
+        return out + b"".join(_write_value(item, element_type) for item in values)
+    if value_type == MAP:
+        key_type, item_type, items = value
+        if not items:
+            return b"\x00"
+        return (
+            _write_varint(len(items))
+            + bytes([key_type << 4 | item_type])
+            + b"".join(
+                _write_value(key, key_type) + _write_value(item, item_type)
+                for key, item in items
+            )
+        )
+    if value_type == STRUCT:
+        return write_thrift_struct(value)
+
+    raise ValueError(f"Unknown thrift compact type {value_type}")
+
+
+def read_thrift_struct(buffer: bytes, pos: int = 0) -> Tuple[Struct, int]:
+    """
+    Decode a thrift compact protocol struct.
+
+    Parameters
+    ----------
+    buffer: bytes
+        encoded data
+    pos: int
+        position of the struct within buffer
+
+    Returns
+    -------
+    Tuple[Struct, int]
+        the struct as {field id: (type, value)} and the position
+        following it.
+    """
+
+    fields = {}
+    field_id = 0
+    while True:
+        header = buffer[pos]
+        pos += 1
+        if header == 0:
+            return fields, pos
+        delta, field_type = header >> 4, header & 0x0F
+        if delta:
+            field_id += delta
+        else:
+            field_id, pos = _read_value(buffer, pos, I16)
+        if field_type in [BOOL_TRUE, BOOL_FALSE]:
+            # booleans are stored within the field type
+            fields[field_id] = (field_type, field_type == BOOL_TRUE)
+        else:
+            fields[field_id], pos = _read_value(buffer, pos, field_type)
+            fields[field_id] = (field_type, fields[field_id])
+
+
+def write_thrift_struct(fields: Struct) -> bytes:
+    """
+    Encode a struct from read_thrift_struct with the thrift compact protocol.
+
+    Parameters
+    ----------
+    fields: Struct
+        the struct as {field id: (type, value)}
+
+    Returns
+    -------
+    bytes
+        encoded struct
+    """
+
+    out = bytearray()
+    last_id = 0
+    for field_id in sorted(fields):
+        field_type, value = fields[field_id]
+        if field_type in [BOOL_TRUE, BOOL_FALSE]:
+            field_type = BOOL_TRUE if value else BOOL_FALSE
+        if 0 < field_id - last_id <= 15:
+            out.append((field_id - last_id) << 4 | field_type)
+        else:
+            out.append(field_type)
+            out += _write_value(field_id, I16)
+        if field_type not in [BOOL_TRUE, BOOL_FALSE]:
+            out += _write_value(value, field_type)
+        last_id = field_id
+    out.append(0)
+
+    return bytes(out)
+
+
+def read_footer(source: BinaryIO) -> Struct:
+    """
+    Read and decode the FileMetaData footer of a parquet file.
+
+    Parameters
+    ----------
+    source: BinaryIO
+        parquet file opened for binary reading
+
+    Returns
+    -------
+    Struct
+        FileMetaData struct
+    """
+
+    source.seek(-8, os.SEEK_END)
+    length_and_magic = source.read(8)
+    if length_and_magic[4:] != b"PAR1":
+        raise ValueError("Not a parquet file with an unencrypted footer")
+    footer_length = struct.unpack("<i", length_and_magic[:4])[0]
+    source.seek(-8 - footer_length, os.SEEK_END)
+    metadata, _ = read_thrift_struct(source.read(footer_length))
+
+    if 8 in metadata:
+        raise ValueError("Encrypted parquet files cannot be compacted")
+
+    return metadata
+
+
+def schema_key(metadata: Struct) -> bytes:
+    """
+    Encoded parquet schema of a file's metadata, which is equal
+    for files whose row groups may be combined. The root element is
+    left out as its name differs between writers (schema, root...).
+
+    Parameters
+    ----------
+    metadata: Struct
+        FileMetaData struct from read_footer
+
+    Returns
+    -------
+    bytes
+        encoded schema elements
+    """
+
+    element_type, elements = metadata[2][1]
+
+    return _write_value((element_type, elements[1:]), LIST)
+
+
+def copy_range(source: BinaryIO, sink: BinaryIO, offset: int, length: int) -> None:
+    """
+    Copy a range of bytes between files.
+
+    Parameters
+    ----------
+    source: BinaryIO
+        file to copy from
+    sink: BinaryIO
+        file to copy to, at its current position
+    offset: int
+        position of the range within source
+    length: int
+        number of bytes to copy
+    """
+
+    source.seek(offset)
+    while length > 0:
+        data = source.read(min(length, COPY_BUFFER_BYTES))
+        if not data:
+            raise ValueError("Unexpected end of parquet file while copying")
+        sink.write(data)
+        length -= len(data)
+
+
+class RowGroupCopier:
+    """
+    Write a parquet file by copying row groups from other parquet
+    files with the same schema without decoding them.
+
+    Bloom filters and page indexes are copied after all row groups,
+    followed by the footer.
+    """
+
+    def __init__(self, sink: BinaryIO, metadata: Struct) -> None:
+        """
+        Parameters
+        ----------
+        sink: BinaryIO
+            file opened for binary writing
+        metadata: Struct
+            FileMetaData of the first source, used for the schema
+            and key value metadata of the output.
+        """
+
+        self.sink = sink
+        self.metadata = metadata
+        self.schema = schema_key(metadata)
+        self.row_groups = []
+        # (source, offset, length, column chunk, kind) copied after row groups
+        self.indexes = []
+        self.sink.write(b"PAR1")
+
+    def copy_row_group(
+        self, source: BinaryIO, metadata: Struct, row_group: Struct
+    ) -> None:
+        """
+        Copy the column chunks of one row group.
+
+        Parameters
+        ----------
+        source: BinaryIO
+            parquet file opened for binary reading
+        metadata: Struct
+            FileMetaData of source
+        row_group: Struct
+            RowGroup struct from the metadata
+        """
+
+        if schema_key(metadata) != self.schema:
+            raise ValueError("Row groups may only be copied between equal schemas")
+
+        columns = []
+        for column_chunk in row_group[1][1][1]:
+            if 1 in column_chunk:
+                raise ValueError("Column chunks within other files are not supported")
+            column_chunk = dict(column_chunk)
+            column_metadata = dict(column_chunk[3][1])
+
+            # the chunk starts with its dictionary page where it has one
+            start = column_metadata[9][1]
+            if 11 in column_metadata and 0 < column_metadata[11][1] < start:
+                start = column_metadata[11][1]
+            delta = self.sink.tell() - start
+            copy_range(source, self.sink, start, column_metadata[7][1])
+
+            for field_id in [9, 10, 11]:
+                if field_id in column_metadata and column_metadata[field_id][1] > 0:
+                    column_metadata[field_id] = (
+                        I64,
+                        column_metadata[field_id][1] + delta,
+                    )
+            if 2 in column_chunk and column_chunk[2][1] > 0:
+                column_chunk[2] = (I64, column_chunk[2][1] + delta)
+
+            # bloom filters and page indexes follow the row groups
+            if 14 in column_metadata:
+                if 15 in column_metadata:
+                    self.indexes.append(
+                        (
+                            source,
+                            column_metadata[14][1],
+                            column_metadata[15][1],
+                            column_metadata,
+                            "bloom_filter",
+                            0,
+                        )
+                    )
+                else:
+                    # without a length the filter cannot be copied
+                    column_metadata.pop(14)
+            for offset_id, length_id, kind in [
+                (6, 7, "column_index"),
+                (4, 5, "offset_index"),
+            ]:
+                if offset_id in column_chunk and length_id in column_chunk:
+                    self.indexes.append(
+                        (
+                            source,
+                            column_chunk[offset_id][1],
+                            column_chunk[length_id][1],
+                            column_chunk,
+                            kind,
+                            delta,
+                        )
+                    )
+                else:
+                    column_chunk.pop(offset_id, None)
+                    column_chunk.pop(length_id, None)
+
+            column_chunk[3] = (STRUCT, column_metadata)
+            columns.append(column_chunk)
+
+        row_group = dict(row_group)
+        row_group[1] = (LIST, (STRUCT, columns))
+        if columns:
+            row_group[5] = (
+                I64,
+                min(
+                    column[3][1][11][1]
+                    if 11 in column[3][1] and column[3][1][11][1] > 0
+                    else column[3][1][9][1]
+                    for column in columns
+                ),
+            )
+        row_group[7] = (I16, len(self.row_groups))
+        self.row_groups.append(row_group)
+
+    def close(self) -> None:
+        """
+        Copy bloom filters and page indexes and write the footer.
+        """
+
+        # bloom filters first, then column indexes, then offset indexes
+        order = {"bloom_filter": 0, "column_index": 1, "offset_index": 2}
+        for source, offset, length, fields, kind, delta in sorted(
+            self.indexes, key=lambda index: order[index[4]]
+        ):
+            position = self.sink.tell()
+            if kind == "offset_index":
+                # page locations hold positions of pages within the file
+                source.seek(offset)
+                offset_index, _ = read_thrift_struct(source.read(length))
+                for page_location in offset_index[1][1][1]:
+                    page_location[1] = (I64, page_location[1][1] + delta)
+                encoded = write_thrift_struct(offset_index)
+                self.sink.write(encoded)
+                fields[4], fields[5] = (I64, position), (I32, len(encoded))
+            else:
+                copy_range(source, self.sink, offset, length)
+                fields[14 if kind == "bloom_filter" else 6] = (I64, position)
+
+        metadata = {
+            field_id: value
+            for field_id, value in self.metadata.items()
+            if field_id in [1, 2, 5, 6, 7]
+        }
+        metadata[3] = (I64, sum(row_group[3][1] for row_group in self.row_groups))
+        metadata[4] = (LIST, (STRUCT, self.row_groups))
+        footer = write_thrift_struct(metadata)
+        self.sink.write(footer)
+        self.sink.write(struct.pack("<i", len(footer)))
+        self.sink.write(b"PAR1")
+
+
+def row_group_bytes(row_group: Struct) -> int:
+    """
+    Compressed bytes of a row group's column chunks.
+
+    Parameters
+    ----------
+    row_group: Struct
+        RowGroup struct
+
+    Returns
+    -------
+    int
+        compressed bytes
+    """
+
+    return sum(column[3][1][7][1] for column in row_group[1][1][1])
+
+
+def compact_files(
+    paths: List[str],
+    output_path: str,
+    min_row_group_bytes: int = MIN_ROW_GROUP_BYTES,
+    profile: Optional[Dict[str, Any]] = None,
+) -> Dict[str, int]:
+    """
+    Compact parquet files with the same schema into one file,
+    keeping rows in the order of paths.
+
+    Parameters
+    ----------
+    paths: List[str]
+        parquet files to compact
+    output_path: str
+        filepath of the compacted file, written through a temporary
+        file so it is either complete or absent.
+    min_row_group_bytes: int
+        row groups with fewer compressed bytes are coalesced
+        by re-encoding them together.
+    profile: Dict[str, Any]
+        output profile used when re-encoding, by default
+        parquet_profiles.QUERY_PROFILE.
+
+    Returns
+    -------
+    Dict[str, int]
+        numbers of rows, copied row groups and re-encoded row groups
+    """
+
+    if profile is None:
+        profile = QUERY_PROFILE
+
+    stats = {"rows": 0, "copied_row_groups": 0, "reencoded_row_groups": 0}
+    pending: List[pa.Table] = []
+    pending_bytes = 0
+    sources: List[Union[BinaryIO, io.BytesIO]] = []
+    temp_path = f"{output_path}.tmp"
+
+    def flush(copier: RowGroupCopier) -> None:
+        nonlocal pending, pending_bytes
+        if not pending:
+            return
+        table = pa.concat_tables(pending)
+        buffer = io.BytesIO()
+        writer = open_parquet_writer(
+            buffer, table.schema, **parquet_writer_options(table.schema, profile)
+        )
+        writer.write_table(table, row_group_size=max(table.num_rows, 1))
+        writer.close()
+        metadata = read_footer(buffer)
+        for row_group in metadata[4][1][1]:
+            copier.copy_row_group(buffer, metadata, row_group)
+        # the buffer is read again for indexes when the copier closes
+        sources.append(buffer)
+        stats["reencoded_row_groups"] += len(pending)
+        pending, pending_bytes = [], 0
+
+    try:
+        with open(temp_path, "wb") as sink:
+            copier = None
+            for path in paths:
+                source = open(path, "rb")
+                sources.append(source)
+                metadata = read_footer(source)
+                if copier is None:
+                    copier = RowGroupCopier(sink, metadata)
+                elif schema_key(metadata) != copier.schema:
+                    raise ValueError(f"Schema of {path} differs from {paths[0]}")
+
+                parquet_file = pq.ParquetFile(path)
+                for number, row_group in enumerate(metadata[4][1][1]):
+                    stats["rows"] += row_group[3][1]
+                    size = row_group_bytes(row_group)
+                    if size < min_row_group_bytes:
+                        pending.append(parquet_file.read_row_group(number))
+                        pending_bytes += size
+                        if pending_bytes >= min_row_group_bytes:
+                            flush(copier)
+                        continue
+                    # keep rows in order by writing pending row groups first
+                    flush(copier)
+                    copier.copy_row_group(source, metadata, row_group)
+                    stats["copied_row_groups"] += 1
+
+            if copier is not None:
+                flush(copier)
+                copier.close()
+        os.replace(temp_path, output_path)
+    finally:
+        for source in sources:
+            source.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return stats
+
+
+def natural_sort_key(path: str) -> List[Union[int, str]]:
+    """
+    Sort key placing example_2.parquet before example_10.parquet.
+
+    Parameters
+    ----------
+    path: str
+        filepath
+
+    Returns
+    -------
+    List[Union[int, str]]
+        sort key
+    """
+
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", path)]
+
+
+def plan_outputs(
+    paths: List[str], target_bytes: int = TARGET_FILE_BYTES
+) -> List[List[str]]:
+    """
+    Group consecutive parquet files with the same schema into
+    outputs of up to target_bytes (larger files are kept alone).
+
+    Parameters
+    ----------
+    paths: List[str]
+        parquet files in the order rows should be kept
+    target_bytes: int
+        target size of each output
+
+    Returns
+    -------
+    List[List[str]]
+        paths of each output
+    """
+
+    outputs = []
+    output_bytes = 0
+    last_schema = None
+    for path in paths:
+        with open(path, "rb") as source:
+            schema = schema_key(read_footer(source))
+        size = os.path.getsize(path)
+        if not outputs or schema != last_schema or output_bytes + size > target_bytes:
+            outputs.append([])
+            output_bytes = 0
+        outputs[-1].append(path)
+        output_bytes += size
+        last_schema = schema
+
+    return outputs
+
+
+def compact_parquet(
+    paths: List[str],
+    output_prefix: str,
+    target_bytes: int = TARGET_FILE_BYTES,
+    min_row_group_bytes: int = MIN_ROW_GROUP_BYTES,
+    workers: Optional[int] = None,
+    remove_inputs: bool = False,
+) -> List[str]:
+    """
+    Compact parquet files into files of up to target_bytes,
+    compacting outputs in parallel.
+
+    Parameters
+    ----------
+    paths: List[str]
+        parquet files in the order rows should be kept
+    output_prefix: str
+        outputs are written to {output_prefix}_{number}.parquet
+    target_bytes: int
+        target size of each output
+    min_row_group_bytes: int
+        row groups with fewer compressed bytes are coalesced
+    workers: int
+        number of outputs compacted at once, by default 1.
+    remove_inputs: bool
+        whether to remove input files once all outputs are written
+
+    Returns
+    -------
+    List[str]
+        filepaths of the outputs
+    """
+
+    plans = plan_outputs(paths, target_bytes=target_bytes)
+    output_paths = [f"{output_prefix}_{number}.parquet" for number in range(len(plans))]
+    if set(output_paths) & set(paths):
+        raise ValueError("Outputs would overwrite input files")
+
+    with ThreadPoolExecutor(max_workers=workers if workers else 1) as executor:
+        list(
+            executor.map(
+                lambda plan: compact_files(
+                    plan[0], plan[1], min_row_group_bytes=min_row_group_bytes
+                ),
+                zip(plans, output_paths),
+            )
+        )
+
+    if remove_inputs:
+        for path in paths:
+            os.remove(path)
+
+    return output_paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compact small parquet files by copying row groups."
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="parquet files or glob patterns, kept in order"
+    )
+    parser.add_argument("--output-prefix", required=True)
+    parser.add_argument(
+        "--target-mb", type=float, default=TARGET_FILE_BYTES / 1024 / 1024
+    )
+    parser.add_argument(
+        "--min-row-group-mb", type=float, default=MIN_ROW_GROUP_BYTES / 1024 / 1024
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--remove-inputs", action="store_true")
+    args = parser.parse_args()
+
+    paths = []
+    for pattern in args.inputs:
+        paths += sorted(glob.glob(pattern), key=natural_sort_key) or [pattern]
+
+    print(
+        compact_parquet(
+            paths,
+            output_prefix=args.output_prefix,
+            target_bytes=int(args.target_mb * 1024 * 1024),
+            min_row_group_bytes=int(args.min_row_group_mb * 1024 * 1024),
+            workers=args.workers,
+            remove_inputs=args.remove_inputs,
+        )
+    )
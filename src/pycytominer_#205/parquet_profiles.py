@@ -0,0 +1,352 @@
+"""
+Query-optimised parquet output profile for exported single-cell data.
+
+Rows are sorted by TableNumber, ImageNumber and ObjectNumber, row groups
+are sized to a target number of bytes and files are written with column
+statistics, page (column and offset) indexes and bloom filters on plate
+and well columns. Readers may then skip to a single plate or well by
+reading a few pages instead of the whole file.
+"""
+import warnings
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# default profile for single-cell exports
+QUERY_PROFILE = {
+    # object numbers are prefixed by table name in exports, for example
+    # Cells_ObjectNumber, and are matched by suffix
+    "sort_keys": ["TableNumber", "ImageNumber", "ObjectNumber"],
+    "row_group_bytes": 128 * 1024 * 1024,
+    "bloom_filter_columns": ["TableNumber", "Image_Metadata_Well"],
+    "bloom_filter_fpp": 0.01,
+    "compression": "zstd",
+    "write_statistics": True,
+    "write_page_index": True,
+}
+
+
+def sort_columns(schema: pa.Schema, sort_keys: List[str]) -> List[str]:
+    """
+    Find columns to sort by within a schema, matching keys exactly
+    or as a suffix after a table name (ObjectNumber matches
+    Cells_ObjectNumber, Nuclei_ObjectNumber...).
+
+    Parameters
+    ----------
+    schema: pa.Schema
+        schema of the data to be sorted
+    sort_keys: List[str]
+        keys to sort by in order of precedence
+
+    Returns
+    -------
+    List[str]
+        column names to sort by
+    """
+
+    columns = []
+    for key in sort_keys:
+        if key in schema.names:
+            columns.append(key)
+        else:
+            columns += [name for name in schema.names if name.endswith(f"_{key}")]
+
+    return columns
+
+
+def sort_table(table: pa.Table, sort_keys: Optional[List[str]] = None) -> pa.Table:
+    """
+    Sort a table by the profile sort keys. Nulls are placed first so
+    image rows precede their objects in concatenated data.
+
+    Parameters
+    ----------
+    table: pa.Table
+        table to sort
+    sort_keys: List[str]
+        keys to sort by, by default those of QUERY_PROFILE.
+
+    Returns
+    -------
+    pa.Table
+        sorted table
+    """
+
+    if sort_keys is None:
+        sort_keys = QUERY_PROFILE["sort_keys"]
+
+    columns = sort_columns(table.schema, sort_keys)
+    if not columns:
+        return table
+
+    try:
+        # pyarrow >= 25 places nulls per sort key
+        indices = pc.sort_indices(
+            table, sort_keys=[(column, "ascending", "at_start") for column in columns]
+        )
+    except (TypeError, ValueError, pa.ArrowInvalid):
+        indices = pc.sort_indices(
+            table,
+            sort_keys=[(column, "ascending") for column in columns],
+            null_placement="at_start",
+        )
+
+    return table.take(indices)
+
+
+def rows_per_row_group(table: pa.Table, row_group_bytes: int) -> int:
+    """
+    Estimate the number of rows which fill a row group of the
+    target size using the in-memory width of the table.
+
+    Parameters
+    ----------
+    table: pa.Table
+        table which will be written
+    row_group_bytes: int
+        target uncompressed bytes of each row group
+
+    Returns
+    -------
+    int
+        rows per row group
+    """
+
+    if table.num_rows == 0:
+        return 1
+
+    return max(1, int(row_group_bytes / max(table.nbytes / table.num_rows, 1)))
+
+
+def parquet_writer_options(
+    schema: pa.Schema,
+    profile: Optional[Dict[str, Any]] = None,
+    ndv: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Keyword arguments for pq.ParquetWriter or pq.write_table
+    from an output profile.
+
+    Parameters
+    ----------
+    schema: pa.Schema
+        schema of the data which will be written
+    profile: Dict[str, Any]
+        output profile, by default QUERY_PROFILE.
+    ndv: int
+        optional expected number of distinct values for bloom filters,
+        pyarrow's default is used otherwise.
+
+    Returns
+    -------
+    Dict[str, Any]
+        parquet writer keyword arguments
+    """
+
+    if profile is None:
+        profile = QUERY_PROFILE
+
+    options = {
+        "compression": profile["compression"],
+        "write_statistics": profile["write_statistics"],
+        "write_page_index": profile["write_page_index"],
+    }
+
+    # exporters prepend table names, for example Image_Image_Metadata_Well
+    bloom_filter_columns = sort_columns(schema, profile["bloom_filter_columns"])
+    if bloom_filter_columns:
+        options["bloom_filter_options"] = {
+            name: {"fpp": profile["bloom_filter_fpp"], "ndv": ndv}
+            if ndv
+            else {"fpp": profile["bloom_filter_fpp"]}
+            for name in bloom_filter_columns
+        }
+
+    return options
+
+
+def open_parquet_writer(
+    filepath: str, schema: pa.Schema, **options: Any
+) -> pq.ParquetWriter:
+    """
+    Open a parquet writer, leaving out bloom filters when
+    the installed pyarrow does not support them.
+
+    Parameters
+    ----------
+    filepath: str
+        filepath of the parquet file to write
+    schema: pa.Schema
+        schema of the data which will be written
+    **options
+        parquet writer keyword arguments
+
+    Returns
+    -------
+    pq.ParquetWriter
+        opened parquet writer
+    """
+
+    try:
+        return pq.ParquetWriter(filepath, schema, **options)
+    except TypeError:
+        if "bloom_filter_options" not in options:
+            raise
+        warnings.warn("pyarrow does not support bloom filters, writing without them")
+        options.pop("bloom_filter_options")
+        return pq.ParquetWriter(filepath, schema, **options)
+
+
+class ProfiledParquetWriter:
+    """
+    Stream tables into a parquet file using an output profile,
+    buffering rows until each row group reaches its target size.
+
+    Each written table is sorted by the profile sort keys. Tables should
+    be written in key order (for example chunks of an ordered basis) so
+    the whole file is sorted.
+
+    Example:
+    with ProfiledParquetWriter("example.parquet", schema) as writer:
+        for table in tables:
+            writer.write_table(table)
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        schema: pa.Schema,
+        profile: Optional[Dict[str, Any]] = None,
+        ndv: Optional[int] = None,
+    ) -> None:
+        self.filepath = filepath
+        self.schema = schema
+        self.profile = profile if profile is not None else QUERY_PROFILE
+        self.writer = open_parquet_writer(
+            filepath, schema, **parquet_writer_options(schema, self.profile, ndv)
+        )
+        self.buffer = []
+        self.buffer_bytes = 0
+
+    def write_table(self, table: pa.Table) -> None:
+        """
+        Sort and buffer a table, writing full row groups.
+
+        Parameters
+        ----------
+        table: pa.Table
+            table with the writer schema
+        """
+
+        self.buffer.append(sort_table(table, self.profile["sort_keys"]))
+        self.buffer_bytes += table.nbytes
+
+        if self.buffer_bytes >= self.profile["row_group_bytes"]:
+            buffered = pa.concat_tables(self.buffer)
+            row_group_size = rows_per_row_group(
+                buffered, self.profile["row_group_bytes"]
+            )
+            full_rows = buffered.num_rows - buffered.num_rows % row_group_size
+            self.writer.write_table(
+                buffered.slice(0, full_rows), row_group_size=row_group_size
+            )
+            remainder = buffered.slice(full_rows)
+            self.buffer = [remainder] if remainder.num_rows else []
+            self.buffer_bytes = remainder.nbytes if remainder.num_rows else 0
+
+    def close(self) -> None:
+        """
+        Write buffered rows as a final row group and close the file.
+        """
+
+        if self.buffer:
+            buffered = pa.concat_tables(self.buffer)
+            self.writer.write_table(
+                buffered,
+                row_group_size=rows_per_row_group(
+                    buffered, self.profile["row_group_bytes"]
+                ),
+            )
+            self.buffer = []
+        self.writer.close()
+
+    def __enter__(self) -> "ProfiledParquetWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def write_table(
+    table: pa.Table,
+    filepath: str,
+    profile: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Write a whole table to parquet using an output profile.
+
+    Parameters
+    ----------
+    table: pa.Table
+        table to write
+    filepath: str
+        filepath of the parquet file to write
+    profile: Dict[str, Any]
+        output profile, by default QUERY_PROFILE.
+
+    Returns
+    -------
+    str
+        filepath of the parquet file
+    """
+
+    with ProfiledParquetWriter(
+        filepath, table.schema, profile=profile, ndv=table.num_rows
+    ) as writer:
+        writer.write_table(table)
+
+    return filepath
+
+
+def read_plate_well(
+    filepath: str,
+    table_number: Optional[str] = None,
+    well: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+) -> pa.Table:
+    """
+    Read rows of one plate and/or well from a profiled parquet file,
+    skipping row groups and pages using their statistics.
+
+    Parameters
+    ----------
+    filepath: str
+        filepath of a parquet file written with a query profile
+    table_number: str
+        optional TableNumber to read
+    well: str
+        optional Image_Metadata_Well to read, also matched as a suffix
+        (Image_Image_Metadata_Well)
+    columns: List[str]
+        optional columns to read
+
+    Returns
+    -------
+    pa.Table
+        rows of the plate and/or well
+    """
+
+    schema = pq.read_schema(filepath)
+
+    filters = []
+    for key, value in [("TableNumber", table_number), ("Image_Metadata_Well", well)]:
+        if value is None:
+            continue
+        # match prepended names such as Image_Image_Metadata_Well
+        names = sort_columns(schema, [key])
+        filters.append((names[0] if names else key, "=", value))
+
+    return pq.read_table(filepath, columns=columns, filters=filters or None)
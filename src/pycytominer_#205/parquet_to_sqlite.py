@@ -0,0 +1,359 @@
+"""
+Convert exported parquet back to SQLite (htp_convert within sketch.md)
+for legacy tools which still require *.sqlite files.
+
+Arrow record batches are streamed into SQLite using executemany within
+large transactions with journaling and syncs disabled during the load.
+Indexes are built once the data is in. The database is written to a
+temporary file and renamed when complete, as an interrupted load without
+a journal would leave an unusable file.
+
+Accepts either a per-compartment dataset directory (see
+databaseframe_arrow_concat_dataset.py) or a single wide parquet file of
+stacked (concat) tables, where each column is prefixed by its table name.
+
+Example:
+python parquet_to_sqlite.py ./data/testing_dataset testing.sqlite
+"""
+import argparse
+import os
+import pathlib
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# reverse of the sketch.md data type mapping
+ARROW_TO_SQLITE_TYPES = [
+    (pa.types.is_boolean, "INTEGER"),
+    (pa.types.is_integer, "INTEGER"),
+    (pa.types.is_floating, "REAL"),
+    (pa.types.is_decimal, "REAL"),
+    (pa.types.is_string, "TEXT"),
+    (pa.types.is_large_string, "TEXT"),
+    (pa.types.is_temporal, "TEXT"),
+    (pa.types.is_binary, "BLOB"),
+    (pa.types.is_large_binary, "BLOB"),
+]
+
+# load settings, safe only because the target is renamed into place when complete
+LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = OFF;",
+    "PRAGMA synchronous = OFF;",
+    "PRAGMA locking_mode = EXCLUSIVE;",
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA cache_size = -262144;",
+]
+
+
+def sqlite_column_type(arrow_type: pa.DataType) -> str:
+    """
+    Find the SQLite column type for an arrow type.
+
+    Parameters
+    ----------
+    arrow_type: pa.DataType
+        arrow data type of a column
+
+    Returns
+    -------
+    str
+        SQLite column type, or an empty string (no affinity)
+        for null and unknown types.
+    """
+
+    for is_type, sqlite_type in ARROW_TO_SQLITE_TYPES:
+        if is_type(arrow_type):
+            return sqlite_type
+
+    return ""
+
+
+def table_columns(
+    schema: pa.Schema, table_name: str, join_keys: List[str]
+) -> List[Tuple[str, str]]:
+    """
+    Find the columns of one table within a schema of table
+    name prefixed columns.
+
+    Parameters
+    ----------
+    schema: pa.Schema
+        schema with columns prefixed by table name
+    table_name: str
+        table name to find columns for
+    join_keys: List[str]
+        keys shared by all tables which are not prefixed
+
+    Returns
+    -------
+    List[Tuple[str, str]]
+        list of (parquet column name, SQLite column name) tuples
+    """
+
+    return [(name, name) for name in join_keys if name in schema.names] + [
+        (name, name[len(table_name) + 1 :])
+        for name in schema.names
+        if name.startswith(f"{table_name}_") and name not in join_keys
+    ]
+
+
+def table_batches(
+    filepath: str,
+    columns: List[Tuple[str, str]],
+    join_keys: List[str],
+    wide: bool,
+    batch_size: int,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Read the record batches of one table from a parquet file.
+
+    Parameters
+    ----------
+    filepath: str
+        parquet filepath to read from
+    columns: List[Tuple[str, str]]
+        list of (parquet column name, SQLite column name) tuples
+    join_keys: List[str]
+        keys shared by all tables
+    wide: bool
+        whether the file holds stacked tables, in which case only
+        rows with a value in one of this table's columns are kept.
+    batch_size: int
+        maximum rows per record batch
+
+    Yields
+    ------
+    pa.RecordBatch
+        batches of the table's columns
+    """
+
+    parquet_file = pq.ParquetFile(filepath)
+    for batch in parquet_file.iter_batches(
+        batch_size=batch_size, columns=[name for name, _ in columns]
+    ):
+        if wide:
+            # rows of other tables hold nulls for all of this table's columns
+            mask = None
+            for name, _ in columns:
+                if name in join_keys:
+                    continue
+                valid = pc.is_valid(batch.column(name))
+                mask = valid if mask is None else pc.or_(mask, valid)
+            if mask is None:
+                continue
+            batch = batch.filter(mask)
+        if batch.num_rows:
+            yield batch
+
+
+def create_indexes(
+    connection: sqlite3.Connection,
+    table_name: str,
+    column_names: List[str],
+    join_keys: List[str],
+    index_columns: Optional[List[List[str]]] = None,
+) -> List[str]:
+    """
+    Create indexes for a loaded table.
+
+    Parameters
+    ----------
+    connection: sqlite3.Connection
+        connection to the target database
+    table_name: str
+        table name to index
+    column_names: List[str]
+        SQLite column names of the table
+    join_keys: List[str]
+        keys shared by all tables
+    index_columns: List[List[str]]
+        optional column lists to index. By default the join keys
+        along with ObjectNumber when present.
+
+    Returns
+    -------
+    List[str]
+        names of the created indexes
+    """
+
+    if index_columns is None:
+        index_columns = [
+            [key for key in join_keys if key in column_names]
+            + (["ObjectNumber"] if "ObjectNumber" in column_names else [])
+        ]
+
+    created = []
+    for columns in index_columns:
+        if not columns:
+            continue
+        index_name = f"{table_name}_{'_'.join(columns)}_idx"
+        columns_str = ", ".join(f'"{column}"' for column in columns)
+        connection.execute(
+            f'CREATE INDEX "{index_name}" ON "{table_name}" ({columns_str});'
+        )
+        created.append(index_name)
+
+    return created
+
+
+def parquet_to_sqlite(
+    source: str,
+    target_path: str,
+    tables: Optional[List[str]] = None,
+    join_keys: Optional[List[str]] = None,
+    batch_size: int = 65536,
+    transaction_rows: int = 1000000,
+    index_columns: Optional[Dict[str, List[List[str]]]] = None,
+    analyze: bool = True,
+) -> Dict[str, int]:
+    """
+    Convert a parquet dataset directory or wide parquet file to SQLite.
+
+    Parameters
+    ----------
+    source: str
+        per-compartment dataset directory or wide parquet filepath
+    target_path: str
+        filepath of the SQLite database to create, replaced if it exists
+    tables: List[str]
+        table names to convert. By default all files within a dataset
+        directory or Image, Cells, Cytoplasm and Nuclei for a wide file.
+    join_keys: List[str]
+        keys shared by all tables which are not prefixed
+        By default TableNumber and ImageNumber.
+    batch_size: int
+        rows per record batch passed to executemany
+    transaction_rows: int
+        rows inserted before each commit
+    index_columns: Dict[str, List[List[str]]]
+        optional table name to column lists to index, see create_indexes.
+    analyze: bool
+        whether to gather statistics for the query planner
+        (and sqlite_estimate.py) after loading.
+
+    Returns
+    -------
+    Dict[str, int]
+        dictionary of table name to rows inserted
+    """
+
+    # set default join_key
+    if not join_keys:
+        join_keys = ["TableNumber", "ImageNumber"]
+
+    if index_columns is None:
+        index_columns = {}
+
+    wide = not os.path.isdir(source)
+    if wide:
+        if not tables:
+            tables = ["Image", "Cells", "Cytoplasm", "Nuclei"]
+        sources = [(table_name, source) for table_name in tables]
+    else:
+        sources = [
+            (filepath.stem, str(filepath))
+            for filepath in sorted(pathlib.Path(source).glob("*.parquet"))
+            if not tables or filepath.stem in tables
+        ]
+
+    tmp_path = f"{target_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    connection = sqlite3.connect(tmp_path, isolation_level=None)
+    for pragma in LOAD_PRAGMAS:
+        connection.execute(pragma)
+
+    inserted = {}
+    table_column_names = {}
+    for table_name, filepath in sources:
+        schema = pq.read_schema(filepath)
+        columns = table_columns(schema, table_name, join_keys)
+        if len(columns) == len([key for key in join_keys if key in schema.names]):
+            # no columns for this table within the file
+            continue
+
+        coldefs = ", ".join(
+            f'"{sqlite_name}" {sqlite_column_type(schema.field(name).type)}'.strip()
+            for name, sqlite_name in columns
+        )
+        connection.execute(f'CREATE TABLE "{table_name}" ({coldefs});')
+        table_column_names[table_name] = [sqlite_name for _, sqlite_name in columns]
+
+        insert_stmt = (
+            f'INSERT INTO "{table_name}" VALUES '
+            f"({', '.join('?' for _ in columns)});"
+        )
+
+        inserted[table_name] = 0
+        uncommitted = 0
+        connection.execute("BEGIN;")
+        for batch in table_batches(
+            filepath=filepath,
+            columns=columns,
+            join_keys=join_keys,
+            wide=wide,
+            batch_size=batch_size,
+        ):
+            # note: sqlite stores NaN doubles as NULL
+            connection.executemany(
+                insert_stmt,
+                zip(*[column.to_pylist() for column in batch.columns]),
+            )
+            inserted[table_name] += batch.num_rows
+            uncommitted += batch.num_rows
+            if uncommitted >= transaction_rows:
+                connection.execute("COMMIT;")
+                connection.execute("BEGIN;")
+                uncommitted = 0
+        connection.execute("COMMIT;")
+
+    # build indexes after the data is in
+    for table_name, column_names in table_column_names.items():
+        create_indexes(
+            connection=connection,
+            table_name=table_name,
+            column_names=column_names,
+            join_keys=join_keys,
+            index_columns=index_columns.get(table_name),
+        )
+
+    if analyze:
+        connection.execute("ANALYZE;")
+
+    connection.close()
+    os.replace(tmp_path, target_path)
+
+    return inserted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert exported parquet back to SQLite."
+    )
+    parser.add_argument(
+        "source", help="per-compartment dataset directory or wide parquet file"
+    )
+    parser.add_argument("target_path", help="filepath of the SQLite database")
+    parser.add_argument("--tables", nargs="*", default=None)
+    parser.add_argument("--batch-size", type=int, default=65536)
+    parser.add_argument("--transaction-rows", type=int, default=1000000)
+    parser.add_argument("--no-analyze", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    print(
+        parquet_to_sqlite(
+            source=args.source,
+            target_path=args.target_path,
+            tables=args.tables,
+            batch_size=args.batch_size,
+            transaction_rows=args.transaction_rows,
+            analyze=not args.no_analyze,
+        )
+    )
+    print(f"created {args.target_path} in {time.perf_counter() - start:.2f}s")
@@ -12,6 +12,7 @@ import numpy as np
 import polars as pl
 import pyarrow as pa
 import pyarrow.parquet as pq
+from parquet_profiles import ProfiledParquetWriter
 from prefect import Flow, Parameter, task, unmapped
 from prefect.executors import DaskExecutor, Executor, LocalExecutor
 from sqlalchemy import create_engine
@@ -255,8 +256,10 @@ if __name__ == "__main__":
         engine, table_name: str, join_keys: List[str], chunk_size: int
     ) -> list:
         join_keys_str = ", ".join(join_keys)
+        # ordered so chunks, and the file written from them, follow key order
         sql_stmt = f"""
         select distinct {join_keys_str} from {table_name}
+        order by {join_keys_str}
         """
         basis_dicts = cx.read_sql(
             engine.replace("///", "//"),
@@ -441,11 +444,14 @@ if __name__ == "__main__":
         filename: str,
     ):
         full_filename = f"{filename}.parquet"
-        writer = pq.ParquetWriter(full_filename, tbl_list[0].schema)
-        for tbl in tbl_list:
-            writer.write_table(tbl)
-
-        writer.close()
+        # sorted by keys with sized row groups, page indexes and bloom filters
+        with ProfiledParquetWriter(
+            full_filename,
+            tbl_list[0].schema,
+            ndv=sum(tbl.num_rows for tbl in tbl_list),
+        ) as writer:
+            for tbl in tbl_list:
+                writer.write_table(tbl)
 
         return full_filename
 
@@ -0,0 +1,366 @@
+"""
+Reconcile schemas across plates before any data is read.
+
+Declared column types are read from pragma_table_info of every plate
+in parallel and combined into one unified schema using type promotion
+rules (for example INTEGER and REAL become double, REAL and FLOAT are
+both double). Each plate receives a plan of the casts and null fills
+needed to conform to the unified schema, along with SELECT statements
+which apply its casts while reading, so multi-plate datasets share one
+schema instead of failing at concat or coercing types afterwards
+(see nan_data_fill within databaseframe_pandas_concat.py).
+
+Example:
+python schema_reconcile.py "plates/SQ000*.sqlite" --output plans.json
+"""
+import argparse
+import glob
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+from sqlite_estimate import AFFINITY_TO_ARROW_TYPES, column_affinity
+
+# arrow types by name from sqlite_estimate's affinity mapping
+ARROW_TYPES = {
+    "int64": pa.int64(),
+    "double": pa.float64(),
+    "string": pa.string(),
+    "large_binary": pa.large_binary(),
+}
+
+# promotion order of arrow types, types are promoted to the highest found.
+# "null" is given to columns without a declared type so they take
+# the type of the same column within other plates, though at least
+# double as they may hold real values.
+TYPE_PROMOTION_ORDER = ["null", "int64", "double", "string", "large_binary"]
+
+# sqlite cast used within select statements for each promoted type
+SQLITE_CASTS = {"int64": "INTEGER", "double": "REAL", "string": "TEXT"}
+
+# promoted types whose casts only apply to numeric values
+NUMERIC_TYPES = ["int64", "double"]
+
+
+def read_plate_schema(sql_path: str) -> List[Dict[str, str]]:
+    """
+    Read declared column types of all tables within a plate.
+
+    Parameters
+    ----------
+    sql_path: str
+        filepath of the SQLite plate
+
+    Returns
+    -------
+    List[Dict[str, str]]
+        list of dictionaries similar to the following.
+        [{'table_name', 'column_name', 'column_type', 'arrow_type'},...]
+    """
+
+    # open read-only so reconciling never modifies a plate,
+    # as_uri percent-encodes characters such as # within the path
+    connection = sqlite3.connect(
+        Path(sql_path).resolve().as_uri() + "?mode=ro", uri=True
+    )
+    schema = [
+        {
+            "table_name": table_name,
+            "column_name": column_name,
+            "column_type": column_type,
+            "arrow_type": (
+                AFFINITY_TO_ARROW_TYPES[column_affinity(column_type)]
+                if column_type
+                else "null"
+            ),
+        }
+        for (table_name,) in connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name NOT LIKE 'sqlite_%' ORDER BY name;"
+        ).fetchall()
+        for column_name, column_type in connection.execute(
+            "SELECT name, type FROM pragma_table_info(?);", [table_name]
+        ).fetchall()
+    ]
+    connection.close()
+
+    return schema
+
+
+def promote_types(arrow_types: List[str]) -> str:
+    """
+    Promote arrow type names to a single type which holds all of them.
+
+    Parameters
+    ----------
+    arrow_types: List[str]
+        arrow type names, see TYPE_PROMOTION_ORDER
+
+    Returns
+    -------
+    str
+        promoted arrow type name
+    """
+
+    promoted = max(arrow_types, key=TYPE_PROMOTION_ORDER.index)
+
+    # untyped columns may hold real values which an integer cast
+    # would truncate
+    if promoted == "int64" and "null" in arrow_types:
+        return "double"
+
+    # columns without a declared type anywhere are read as binary,
+    # following sqlite's BLOB affinity
+    return "large_binary" if promoted == "null" else promoted
+
+
+def reconcile_schemas(
+    plate_schemas: Dict[str, List[Dict[str, str]]],
+    join_keys: List[str] = None,
+) -> Dict:
+    """
+    Build a unified schema and per-plate cast and fill plans.
+
+    Parameters
+    ----------
+    plate_schemas: Dict[str, List[Dict[str, str]]]
+        plate filepath to schema, see read_plate_schema
+    join_keys: List[str]
+        list of keys shared by all tables.
+        By default TableNumber and ImageNumber.
+
+    Returns
+    -------
+    Dict
+        dictionary with the unified "tables" (table name to column
+        name to arrow type name) and "plans" by plate filepath, where
+        each plan lists "casts" and "fills" by table.
+    """
+
+    # set default join_key
+    if not join_keys:
+        join_keys = ["TableNumber", "ImageNumber"]
+
+    found_types: Dict[str, Dict[str, List[str]]] = {}
+    for schema in plate_schemas.values():
+        for column in schema:
+            found_types.setdefault(column["table_name"], {}).setdefault(
+                column["column_name"], []
+            ).append(column["arrow_type"])
+
+    tables = {}
+    for table_name, columns in found_types.items():
+        # join keys first, then columns in order of first appearance
+        names = [name for name in join_keys if name in columns] + [
+            name for name in columns if name not in join_keys
+        ]
+        tables[table_name] = {name: promote_types(columns[name]) for name in names}
+
+    plans = {}
+    for sql_path, schema in plate_schemas.items():
+        plate_types = {
+            (column["table_name"], column["column_name"]): column["arrow_type"]
+            for column in schema
+        }
+        plate_tables = {column["table_name"] for column in schema}
+        casts = {}
+        fills = {}
+        for table_name, columns in tables.items():
+            if table_name not in plate_tables:
+                # a table missing from a plate has no rows to fill
+                continue
+            for name, arrow_type in columns.items():
+                plate_type = plate_types.get((table_name, name))
+                if plate_type is None:
+                    fills.setdefault(table_name, {})[name] = arrow_type
+                elif plate_type != arrow_type:
+                    casts.setdefault(table_name, {})[name] = {
+                        "from": plate_type,
+                        "to": arrow_type,
+                    }
+        plans[sql_path] = {
+            "casts": casts,
+            "fills": fills,
+            "missing_tables": sorted(set(tables) - plate_tables),
+        }
+
+    return {"tables": tables, "plans": plans}
+
+
+def reconcile_plates(
+    sql_paths: List[str],
+    join_keys: List[str] = None,
+    workers: Optional[int] = None,
+) -> Dict:
+    """
+    Read plate schemas in parallel and reconcile them.
+
+    Parameters
+    ----------
+    sql_paths: List[str]
+        filepaths of the SQLite plates
+    join_keys: List[str]
+        list of keys shared by all tables.
+        By default TableNumber and ImageNumber.
+    workers: int
+        number of threads reading schemas, by default
+        ThreadPoolExecutor's default.
+
+    Returns
+    -------
+    Dict
+        unified tables and per-plate plans, see reconcile_schemas
+    """
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        plate_schemas = dict(zip(sql_paths, executor.map(read_plate_schema, sql_paths)))
+
+    return reconcile_schemas(plate_schemas=plate_schemas, join_keys=join_keys)
+
+
+def unified_arrow_schema(
+    reconciled: Dict,
+    join_keys: List[str] = None,
+) -> pa.Schema:
+    """
+    Create a unified arrow schema of stacked (concat) tables with
+    table names prepended to columns other than the join keys,
+    matching DatabaseFrame.unified_schema within
+    databaseframe_arrow_concat_rowid_chunks.py.
+
+    Parameters
+    ----------
+    reconciled: Dict
+        result of reconcile_schemas or reconcile_plates
+    join_keys: List[str]
+        list of keys shared by all tables which are not prepended.
+        By default TableNumber and ImageNumber.
+
+    Returns
+    -------
+    pa.Schema
+        unified schema with join keys first
+    """
+
+    # set default join_key
+    if not join_keys:
+        join_keys = ["TableNumber", "ImageNumber"]
+
+    fields = {}
+    for table_name, columns in reconciled["tables"].items():
+        for name, arrow_type in columns.items():
+            field_name = name if name in join_keys else f"{table_name}_{name}"
+            if field_name in fields:
+                # join keys shared between tables are promoted together
+                arrow_type = promote_types([arrow_type, fields[field_name]])
+            fields[field_name] = arrow_type
+
+    return pa.schema(
+        [
+            pa.field(name, ARROW_TYPES[fields[name]])
+            for name in join_keys
+            if name in fields
+        ]
+        + [
+            pa.field(name, ARROW_TYPES[arrow_type])
+            for name, arrow_type in fields.items()
+            if name not in join_keys
+        ]
+    )
+
+
+def plan_select(
+    reconciled: Dict,
+    sql_path: str,
+    table_name: str,
+    join_keys: List[str] = None,
+) -> str:
+    """
+    Create a SELECT statement which reads a plate's table with
+    promoted columns cast to their unified types. Missing columns are
+    left out and filled with nulls after reading, for example by
+    DatabaseFrame.conform_to_schema with unified_arrow_schema.
+
+    Note: only widening casts are planned, so values are not
+    truncated. Promoted numeric columns only cast integer and real
+    values, other values (such as 'nan' text, which CAST would turn
+    into 0.0) are read as nulls.
+
+    Parameters
+    ----------
+    reconciled: Dict
+        result of reconcile_schemas or reconcile_plates
+    sql_path: str
+        filepath of the plate
+    table_name: str
+        table to select from
+    join_keys: List[str]
+        list of keys shared by all tables which are not prepended.
+        By default TableNumber and ImageNumber.
+
+    Returns
+    -------
+    str
+        SQL SELECT statement
+    """
+
+    # set default join_key
+    if not join_keys:
+        join_keys = ["TableNumber", "ImageNumber"]
+
+    plan = reconciled["plans"][sql_path]
+    casts = plan["casts"].get(table_name, {})
+    fills = plan["fills"].get(table_name, {})
+
+    selects = []
+    for name, arrow_type in reconciled["tables"][table_name].items():
+        alias = name if name in join_keys else f"{table_name}_{name}"
+        if name in fills:
+            # connectorx cannot infer types of null literals, so missing
+            # columns are filled after reading by conform_to_schema
+            continue
+        if name in casts and arrow_type in NUMERIC_TYPES:
+            value = (
+                f"""CASE WHEN typeof("{name}") IN ('integer', 'real') """
+                f'THEN CAST("{name}" AS {SQLITE_CASTS[arrow_type]}) END'
+            )
+        elif name in casts and arrow_type in SQLITE_CASTS:
+            value = f'CAST("{name}" AS {SQLITE_CASTS[arrow_type]})'
+        else:
+            value = f'"{name}"'
+        selects.append(f'{value} AS "{alias}"')
+
+    return f"SELECT {', '.join(selects)} FROM \"{table_name}\";"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Reconcile schemas of SQLite plates using metadata only."
+    )
+    parser.add_argument("patterns", nargs="+", help="glob patterns of plates")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default=None, help="filepath of JSON plans")
+    args = parser.parse_args()
+
+    sql_paths = list(
+        dict.fromkeys(
+            sql_path for pattern in args.patterns for sql_path in glob.glob(pattern)
+        )
+    )
+    reconciled = reconcile_plates(sql_paths=sql_paths, workers=args.workers)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(reconciled, output_file, indent=2)
+
+    print(unified_arrow_schema(reconciled))
+    for sql_path, plan in reconciled["plans"].items():
+        print(
+            f"{sql_path}: "
+            f"{sum(len(columns) for columns in plan['casts'].values())} casts, "
+            f"{sum(len(columns) for columns in plan['fills'].values())} fills, "
+            f"{len(plan['missing_tables'])} missing tables"
+        )
@@ -0,0 +1,505 @@
+"""
+Pre-flight cost estimate for converting a SQLite file, built
+from a schema catalog and SQLite page and row statistics.
+
+Example:
+python sqlite_estimate.py SQ00014613.sqlite --memory-budget 16GB
+"""
+import argparse
+import json
+import math
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# declared SQLite affinity to Arrow types, see sketch.md
+# "Data Type Mapping" reference table.
+AFFINITY_TO_ARROW_TYPES = {
+    "INTEGER": "int64",
+    "REAL": "double",
+    "NUMERIC": "double",
+    "TEXT": "string",
+    "BLOB": "large_binary",
+}
+
+# estimated bytes per value for fixed width arrow types
+ARROW_TYPE_WIDTHS = {"int64": 8, "double": 8}
+
+# estimated python object overhead for pandas object columns
+PANDAS_OBJECT_OVERHEAD = 57
+
+# estimated peak memory multiple of a chunk during read -> concat -> write
+CHUNK_PEAK_FACTOR = 3
+
+# estimated parquet bytes per arrow byte for cellprofiler features
+PARQUET_COMPRESSION_RATIO = 0.55
+
+
+def column_affinity(column_type: str) -> str:
+    """
+    Determine SQLite column affinity from a declared type
+    following https://www.sqlite.org/datatype3.html section 3.1.
+
+    Note: DATETIME columns are read as text elsewhere within
+    these experiments, so they are given TEXT affinity here.
+
+    Parameters
+    ----------
+    column_type: str
+        declared type of a column from pragma_table_info
+
+    Returns
+    -------
+    str
+        One of INTEGER, TEXT, BLOB, REAL or NUMERIC.
+    """
+
+    column_type = column_type.upper()
+
+    if "INT" in column_type:
+        return "INTEGER"
+    if any(name in column_type for name in ["CHAR", "CLOB", "TEXT", "DATETIME"]):
+        return "TEXT"
+    if "BLOB" in column_type or column_type == "":
+        return "BLOB"
+    if any(name in column_type for name in ["REAL", "FLOA", "DOUB"]):
+        return "REAL"
+
+    return "NUMERIC"
+
+
+def collect_schema_catalog(
+    connection: sqlite3.Connection,
+    text_sample_size: int = 1000,
+) -> List[Dict]:
+    """
+    Collect a schema catalog of all columns within all tables
+    of a SQLite database using only metadata and small samples.
+
+    Parameters
+    ----------
+    connection: sqlite3.Connection
+        connection to the SQLite database
+    text_sample_size: int
+        number of rows sampled to estimate average text widths
+
+    Returns
+    -------
+    List[Dict]
+        list of dictionaries with values similar to the following.
+        [{'table_name', 'column_name', 'column_type', 'notnull',
+        'affinity', 'arrow_type', 'avg_width'},...]
+    """
+
+    catalog = []
+
+    for (table_name,) in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite_%';"
+    ).fetchall():
+        for column_name, column_type, notnull in connection.execute(
+            "SELECT name, type, [notnull] FROM pragma_table_info(?);",
+            [table_name],
+        ).fetchall():
+            affinity = column_affinity(column_type)
+            arrow_type = AFFINITY_TO_ARROW_TYPES[affinity]
+
+            if arrow_type in ARROW_TYPE_WIDTHS:
+                avg_width = ARROW_TYPE_WIDTHS[arrow_type]
+            else:
+                # sample variable width columns for their average length
+                avg_width = connection.execute(
+                    f"SELECT avg(length({column_name})) FROM "
+                    f"(SELECT {column_name} FROM {table_name} LIMIT ?);",
+                    [text_sample_size],
+                ).fetchone()[0]
+
+            catalog.append(
+                {
+                    "table_name": table_name,
+                    "column_name": column_name,
+                    "column_type": column_type,
+                    "notnull": bool(notnull),
+                    "affinity": affinity,
+                    "arrow_type": arrow_type,
+                    "avg_width": float(avg_width or 0),
+                }
+            )
+
+    return catalog
+
+
+def collect_table_stats(
+    connection: sqlite3.Connection,
+    table_names: List[str],
+    exact_counts: bool = False,
+) -> Dict[str, Dict]:
+    """
+    Collect row and page counts for tables within a SQLite database.
+
+    Row counts are read from sqlite_stat1 when ANALYZE has been run,
+    otherwise from max(rowid) which is a single b-tree seek. Page counts
+    are read from the dbstat virtual table when SQLite was compiled with it.
+
+    Parameters
+    ----------
+    connection: sqlite3.Connection
+        connection to the SQLite database
+    table_names: List[str]
+        names of tables to collect statistics for
+    exact_counts: bool
+        whether to use count(*) (a full scan) for row counts
+
+    Returns
+    -------
+    Dict[str, Dict]
+        dictionary of table name to row_count, row_count_source
+        and page_count values.
+    """
+
+    page_size = connection.execute("PRAGMA page_size;").fetchone()[0]
+
+    stat1 = {}
+    if connection.execute(
+        "SELECT count(*) FROM sqlite_master WHERE name = 'sqlite_stat1';"
+    ).fetchone()[0]:
+        for table_name, stat in connection.execute(
+            "SELECT tbl, stat FROM sqlite_stat1;"
+        ).fetchall():
+            stat1[table_name] = int(stat.split(" ")[0])
+
+    try:
+        pages = dict(
+            connection.execute(
+                "SELECT name, count(*) FROM dbstat GROUP BY name;"
+            ).fetchall()
+        )
+    except sqlite3.OperationalError:
+        # dbstat is unavailable, pages are apportioned by rows below
+        pages = {}
+
+    stats = {}
+    for table_name in table_names:
+        if exact_counts:
+            row_count = connection.execute(
+                f"SELECT count(*) FROM {table_name};"
+            ).fetchone()[0]
+            source = "count"
+        elif table_name in stat1:
+            row_count = stat1[table_name]
+            source = "sqlite_stat1"
+        else:
+            row_count = (
+                connection.execute(f"SELECT max(rowid) FROM {table_name};").fetchone()[
+                    0
+                ]
+                or 0
+            )
+            source = "max_rowid"
+
+        stats[table_name] = {
+            "row_count": row_count,
+            "row_count_source": source,
+            "page_count": pages.get(table_name),
+            "bytes_on_disk": pages[table_name] * page_size
+            if table_name in pages
+            else None,
+        }
+
+    return stats
+
+
+def memory_budget_default() -> int:
+    """
+    Default memory budget of half the physical memory on this host.
+
+    Returns
+    -------
+    int
+        memory budget in bytes
+    """
+
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+
+
+def parse_bytes(value: str) -> int:
+    """
+    Parse a human readable byte string such as 512MB or 16GB.
+
+    Parameters
+    ----------
+    value: str
+        byte string to parse
+
+    Returns
+    -------
+    int
+        number of bytes
+    """
+
+    units = {"KB": 1024, "MB": 1024**2, "GB": 1024**3, "TB": 1024**4}
+    value = value.strip().upper()
+    for unit, multiple in units.items():
+        if value.endswith(unit):
+            return int(float(value[: -len(unit)]) * multiple)
+
+    return int(value)
+
+
+def estimate(
+    sql_path: str,
+    basis: str = "Image",
+    join_keys: Optional[List[str]] = None,
+    memory_budget: Optional[int] = None,
+    cpu_count: Optional[int] = None,
+    exact_counts: bool = False,
+) -> Dict:
+    """
+    Estimate the cost of converting a SQLite file before reading data.
+
+    Parameters
+    ----------
+    sql_path: str
+        filepath of the SQLite database
+    basis: str
+        basis table whose rows define chunks, by default Image.
+    join_keys: List[str]
+        list of keys shared by all tables
+        By default TableNumber and ImageNumber.
+    memory_budget: int
+        memory budget in bytes, by default half of physical memory.
+    cpu_count: int
+        number of available cpus, by default os.cpu_count().
+    exact_counts: bool
+        whether to use count(*) (a full scan) for row counts
+
+    Returns
+    -------
+    Dict
+        Estimate with rows, columns, bytes by backend and output
+        along with a recommended chunk_size and worker count.
+        A ValueError is raised when the database holds no tables.
+    """
+
+    # set default join_key
+    if not join_keys:
+        join_keys = ["TableNumber", "ImageNumber"]
+
+    if memory_budget is None:
+        memory_budget = memory_budget_default()
+
+    if cpu_count is None:
+        cpu_count = os.cpu_count() or 1
+
+    # open read-only so estimating never modifies the source file,
+    # as_uri percent-encodes characters such as # within the path
+    connection = sqlite3.connect(
+        Path(sql_path).resolve().as_uri() + "?mode=ro", uri=True
+    )
+    catalog = collect_schema_catalog(connection=connection)
+    table_names = sorted({column["table_name"] for column in catalog})
+    stats = collect_table_stats(
+        connection=connection, table_names=table_names, exact_counts=exact_counts
+    )
+    connection.close()
+
+    if not table_names:
+        raise ValueError(f"No tables to estimate within {sql_path}")
+
+    tables = {}
+    for table_name in table_names:
+        columns = [
+            column
+            for column in catalog
+            if column["table_name"] == table_name
+            and column["column_name"] not in join_keys
+        ]
+        tables[table_name] = {
+            **stats[table_name],
+            "column_count": len(columns),
+            # arrow and polars use value buffers, offsets and validity bitmaps
+            "arrow_row_bytes": sum(
+                column["avg_width"]
+                + (4 if column["arrow_type"] not in ARROW_TYPE_WIDTHS else 0)
+                + 1 / 8
+                for column in columns
+            ),
+            # pandas uses 8 byte values and python objects for text
+            "pandas_row_bytes": sum(
+                8
+                if column["arrow_type"] in ARROW_TYPE_WIDTHS
+                else 8 + PANDAS_OBJECT_OVERHEAD + column["avg_width"]
+                for column in columns
+            ),
+        }
+
+    key_columns = [
+        column
+        for column in catalog
+        if column["table_name"] == table_names[0] and column["column_name"] in join_keys
+    ]
+    key_row_bytes = sum(
+        8 if column["arrow_type"] in ARROW_TYPE_WIDTHS else 8 + column["avg_width"]
+        for column in key_columns
+    )
+
+    concat_rows = sum(table["row_count"] for table in tables.values())
+    merged_rows = (
+        max(
+            table["row_count"]
+            for table_name, table in tables.items()
+            if table_name.lower() != basis.lower()
+        )
+        if len(tables) > 1
+        else concat_rows
+    )
+    column_count = len(join_keys) + sum(
+        table["column_count"] for table in tables.values()
+    )
+
+    wide_arrow_row_bytes = key_row_bytes + sum(
+        table["arrow_row_bytes"] for table in tables.values()
+    )
+    wide_pandas_row_bytes = key_row_bytes + sum(
+        table["pandas_row_bytes"] for table in tables.values()
+    )
+
+    backends = {
+        # concat layout with every missing column null-filled
+        "pandas_concat": concat_rows * wide_pandas_row_bytes,
+        "arrow_concat": concat_rows * wide_arrow_row_bytes,
+        # per-compartment dataset layout without null-padded columns
+        "arrow_dataset": sum(
+            table["row_count"] * (key_row_bytes + table["arrow_row_bytes"])
+            for table in tables.values()
+        ),
+        # compartments joined into one row per object
+        "pandas_merged": merged_rows * wide_pandas_row_bytes,
+        "arrow_merged": merged_rows * wide_arrow_row_bytes,
+    }
+
+    # chunks are made from distinct basis rows (images)
+    basis_rows = next(
+        (
+            table["row_count"]
+            for table_name, table in tables.items()
+            if table_name.lower() == basis.lower()
+        ),
+        1,
+    )
+    chunk_bytes_per_basis_row = (
+        backends["pandas_concat"] / max(basis_rows, 1) * CHUNK_PEAK_FACTOR
+    )
+
+    # use as many workers as the budget allows for at least one basis row each
+    workers = max(
+        1,
+        min(
+            cpu_count,
+            basis_rows,
+            int(memory_budget // max(chunk_bytes_per_basis_row, 1)),
+        ),
+    )
+    # keep every worker busy with at least one chunk
+    chunk_size = max(
+        1,
+        min(
+            math.ceil(basis_rows / workers),
+            int((memory_budget / workers) // max(chunk_bytes_per_basis_row, 1)),
+        ),
+    )
+
+    return {
+        "sql_path": sql_path,
+        "bytes_on_disk": os.path.getsize(sql_path),
+        "tables": tables,
+        "concat_rows": concat_rows,
+        "merged_rows": merged_rows,
+        "column_count": column_count,
+        "in_memory_bytes": {name: int(value) for name, value in backends.items()},
+        "parquet_bytes": int(backends["arrow_dataset"] * PARQUET_COMPRESSION_RATIO),
+        "memory_budget": memory_budget,
+        "fits_in_memory": backends["pandas_concat"] * CHUNK_PEAK_FACTOR
+        <= memory_budget,
+        "recommended_chunk_size": chunk_size,
+        "recommended_workers": workers,
+        "chunk_count": math.ceil(basis_rows / chunk_size),
+    }
+
+
+def format_bytes(value: float) -> str:
+    """
+    Format a number of bytes as a human readable string.
+
+    Parameters
+    ----------
+    value: float
+        number of bytes
+
+    Returns
+    -------
+    str
+        human readable byte string
+    """
+
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(value) < 1024:
+            return f"{value:.1f}{unit}"
+        value /= 1024
+
+    return f"{value:.1f}TB"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Estimate the cost of converting a SQLite file."
+    )
+    parser.add_argument("sql_path", help="filepath of the SQLite database")
+    parser.add_argument("--basis", default="Image", help="basis table for chunks")
+    parser.add_argument(
+        "--memory-budget",
+        type=parse_bytes,
+        default=None,
+        help="memory budget such as 16GB, by default half of physical memory",
+    )
+    parser.add_argument("--cpu-count", type=int, default=None)
+    parser.add_argument(
+        "--exact-counts",
+        action="store_true",
+        help="use count(*) for row counts (full scan of each table)",
+    )
+    parser.add_argument("--json", action="store_true", help="print json output")
+    args = parser.parse_args()
+
+    result = estimate(
+        sql_path=args.sql_path,
+        basis=args.basis,
+        memory_budget=args.memory_budget,
+        cpu_count=args.cpu_count,
+        exact_counts=args.exact_counts,
+    )
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"SQLite file: {result['sql_path']}")
+        print(f"  on disk: {format_bytes(result['bytes_on_disk'])}")
+        for table_name, table in result["tables"].items():
+            print(
+                f"  {table_name}: {table['row_count']} rows "
+                f"({table['row_count_source']}), {table['column_count']} columns"
+            )
+        print(f"Concat rows: {result['concat_rows']}")
+        print(f"Merged rows: {result['merged_rows']}")
+        print(f"Columns: {result['column_count']}")
+        for backend, value in result["in_memory_bytes"].items():
+            print(f"  {backend}: {format_bytes(value)}")
+        print(f"Parquet output: {format_bytes(result['parquet_bytes'])}")
+        print(f"Memory budget: {format_bytes(result['memory_budget'])}")
+        print(f"Fits in memory: {result['fits_in_memory']}")
+        print(
+            f"Recommended: chunk_size={result['recommended_chunk_size']} "
+            f"workers={result['recommended_workers']} "
+            f"({result['chunk_count']} chunks)"
+        )
@@ -0,0 +1,349 @@
+"""
+Creates a small representative SQLite file from a larger one
+for testing cytomining/pycytominer#205 by copying only sampled
+images and their objects into a new database.
+
+Unlike shrink_SQ00014613.sqlite_for_tests.py this never copies the
+full source file and avoids DELETE + VACUUM rewrites by using
+ATTACH + INSERT ... SELECT.
+
+Example:
+python sqlite_subset.py SQ00014613.sqlite test_SQ00014613.sqlite \
+    --strata Image_Metadata_Plate Image_Metadata_Well --per-stratum 1
+"""
+import argparse
+import hashlib
+import math
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+def collect_source_tables(connection: sqlite3.Connection) -> List[Dict]:
+    """
+    Collect table names, create statements and columns
+    from the attached source database.
+
+    Parameters
+    ----------
+    connection: sqlite3.Connection
+        connection with the source database attached as "source"
+
+    Returns
+    -------
+    List[Dict]
+        list of dictionaries with table_name, sql and columns keys.
+    """
+
+    return [
+        {
+            "table_name": table_name,
+            "sql": sql,
+            "columns": [
+                row[0]
+                for row in connection.execute(
+                    "SELECT name FROM pragma_table_info(?, 'source');", [table_name]
+                ).fetchall()
+            ],
+        }
+        for table_name, sql in connection.execute(
+            "SELECT name, sql FROM source.sqlite_master "
+            "WHERE type = 'table' AND name NOT LIKE 'sqlite_%';"
+        ).fetchall()
+    ]
+
+
+def seeded_hash(rowid: int, seed: int) -> int:
+    """
+    Hash a rowid with a seed, used as a sqlite function to order rows
+    pseudo-randomly as sqlite random() cannot be seeded.
+
+    Parameters
+    ----------
+    rowid: int
+        rowid of the row
+    seed: int
+        seed for the ordering
+
+    Returns
+    -------
+    int
+        non-negative 63-bit hash, different seeds give unrelated orderings
+    """
+
+    return (
+        int.from_bytes(
+            hashlib.blake2b(f"{seed}:{rowid}".encode(), digest_size=8).digest(),
+            "little",
+        )
+        >> 1
+    )
+
+
+def sample_images(
+    connection: sqlite3.Connection,
+    basis: str,
+    join_keys: List[str],
+    strata: List[str],
+    per_stratum: int,
+    seed: int = 0,
+) -> int:
+    """
+    Sample basis rows per stratum into the temp.sampled_images table
+    using a window function so only key and strata columns are read.
+
+    Parameters
+    ----------
+    connection: sqlite3.Connection
+        connection with the source database attached as "source"
+    basis: str
+        basis table name containing images
+    join_keys: List[str]
+        keys which link images to objects
+    strata: List[str]
+        columns of the basis table to stratify by, may be empty
+    per_stratum: int
+        number of images to keep per stratum
+    seed: int
+        seed for the deterministic pseudo-random ordering
+
+    Returns
+    -------
+    int
+        number of sampled images
+    """
+
+    join_keys_str = ", ".join(join_keys)
+    partition_str = f"PARTITION BY {', '.join(strata)}" if strata else ""
+
+    connection.execute("DROP TABLE IF EXISTS temp.sampled_images;")
+    connection.create_function("seeded_hash", 2, seeded_hash, deterministic=True)
+    connection.execute(
+        f"""
+        CREATE TEMP TABLE sampled_images AS
+        SELECT {join_keys_str} FROM (
+            SELECT {join_keys_str},
+                ROW_NUMBER() OVER (
+                    {partition_str}
+                    ORDER BY seeded_hash(rowid, :seed)
+                ) AS stratum_row
+            FROM source.{basis}
+        )
+        WHERE stratum_row <= :per_stratum;
+        """,
+        {"seed": seed, "per_stratum": per_stratum},
+    )
+    connection.execute(
+        f"CREATE INDEX temp.sampled_images_keys ON sampled_images ({join_keys_str});"
+    )
+
+    return connection.execute("SELECT count(*) FROM temp.sampled_images;").fetchone()[0]
+
+
+def per_stratum_for_target_size(
+    connection: sqlite3.Connection,
+    source_path: str,
+    basis: str,
+    strata: List[str],
+    target_size: int,
+) -> int:
+    """
+    Determine images per stratum which approximately produce
+    a database of the target size, assuming objects are spread
+    evenly across images.
+
+    Parameters
+    ----------
+    connection: sqlite3.Connection
+        connection with the source database attached as "source"
+    source_path: str
+        filepath of the source database
+    basis: str
+        basis table name containing images
+    strata: List[str]
+        columns of the basis table to stratify by, may be empty
+    target_size: int
+        approximate size in bytes of the target database
+
+    Returns
+    -------
+    int
+        number of images to keep per stratum
+    """
+
+    image_count = connection.execute(
+        f"SELECT count(*) FROM source.{basis};"
+    ).fetchone()[0]
+    strata_count = (
+        connection.execute(
+            f"SELECT count(*) FROM (SELECT DISTINCT {', '.join(strata)} "
+            f"FROM source.{basis});"
+        ).fetchone()[0]
+        if strata
+        else 1
+    )
+    bytes_per_image = os.path.getsize(source_path) / max(image_count, 1)
+
+    return max(1, math.floor(target_size / bytes_per_image / max(strata_count, 1)))
+
+
+def subset_sqlite(
+    source_path: str,
+    target_path: str,
+    basis: str = "Image",
+    join_keys: Optional[List[str]] = None,
+    strata: Optional[List[str]] = None,
+    per_stratum: Optional[int] = None,
+    target_size: Optional[int] = None,
+    max_objects: Optional[int] = None,
+    seed: int = 0,
+) -> Dict[str, int]:
+    """
+    Create a new SQLite database containing sampled images from the
+    source database and only the objects which belong to them.
+
+    Parameters
+    ----------
+    source_path: str
+        filepath of the source database, opened read-only
+    target_path: str
+        filepath of the new database, replaced if it exists
+    basis: str
+        basis table name containing images, by default Image.
+    join_keys: List[str]
+        keys which link images to objects
+        By default TableNumber and ImageNumber.
+    strata: List[str]
+        columns of the basis table to stratify by, similar to the
+        strata argument of SingleCells. By default no strata.
+    per_stratum: int
+        number of images to keep per stratum, by default 1.
+    target_size: int
+        approximate size in bytes of the target database, used to
+        determine per_stratum when it is not provided.
+    max_objects: int
+        optional maximum ObjectNumber to keep per image
+    seed: int
+        seed for the deterministic image sampling
+
+    Returns
+    -------
+    Dict[str, int]
+        dictionary of table name to rows copied
+    """
+
+    # set default join_key
+    if not join_keys:
+        join_keys = ["TableNumber", "ImageNumber"]
+
+    if strata is None:
+        strata = []
+
+    if os.path.exists(target_path):
+        os.remove(target_path)
+
+    # open with uri support so the source may be attached read-only,
+    # as_uri percent-encodes characters such as # which SQLite would
+    # otherwise read as the start of a fragment
+    connection = sqlite3.connect(Path(target_path).resolve().as_uri(), uri=True)
+    # the target is disposable until complete so skip journaling
+    connection.execute("PRAGMA journal_mode = OFF;")
+    connection.execute("PRAGMA synchronous = OFF;")
+    connection.execute(
+        "ATTACH DATABASE ? AS source;",
+        [Path(source_path).resolve().as_uri() + "?mode=ro"],
+    )
+
+    tables = collect_source_tables(connection=connection)
+    for table in tables:
+        connection.execute(table["sql"])
+
+    if per_stratum is None:
+        per_stratum = (
+            per_stratum_for_target_size(
+                connection=connection,
+                source_path=source_path,
+                basis=basis,
+                strata=strata,
+                target_size=target_size,
+            )
+            if target_size
+            else 1
+        )
+
+    sample_images(
+        connection=connection,
+        basis=basis,
+        join_keys=join_keys,
+        strata=strata,
+        per_stratum=per_stratum,
+        seed=seed,
+    )
+
+    copied = {}
+    join_keys_str = ", ".join(join_keys)
+    for table in tables:
+        sql_stmt = f"INSERT INTO main.{table['table_name']} SELECT source_table.* "
+        sql_stmt += f"FROM source.{table['table_name']} AS source_table"
+
+        if all(key in table["columns"] for key in join_keys):
+            # only copy rows which belong to the sampled images
+            sql_stmt += f" JOIN temp.sampled_images USING ({join_keys_str})"
+            if max_objects is not None and "ObjectNumber" in table["columns"]:
+                sql_stmt += f" WHERE source_table.ObjectNumber <= {int(max_objects)}"
+
+        copied[table["table_name"]] = connection.execute(sql_stmt).rowcount
+
+    connection.commit()
+
+    # build indexes after the data is in
+    for (sql,) in connection.execute(
+        "SELECT sql FROM source.sqlite_master "
+        "WHERE type = 'index' AND sql IS NOT NULL;"
+    ).fetchall():
+        connection.execute(sql)
+
+    connection.commit()
+    connection.execute("DETACH DATABASE source;")
+    connection.close()
+
+    return copied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create a small representative SQLite file for testing."
+    )
+    parser.add_argument("source_path", help="filepath of the source database")
+    parser.add_argument("target_path", help="filepath of the new database")
+    parser.add_argument("--basis", default="Image", help="basis table of images")
+    parser.add_argument(
+        "--strata", nargs="*", default=[], help="columns to stratify by"
+    )
+    parser.add_argument("--per-stratum", type=int, default=None)
+    parser.add_argument(
+        "--target-size",
+        type=int,
+        default=None,
+        help="approximate target size in bytes used when --per-stratum is unset",
+    )
+    parser.add_argument("--max-objects", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    print(
+        subset_sqlite(
+            source_path=args.source_path,
+            target_path=args.target_path,
+            basis=args.basis,
+            strata=args.strata,
+            per_stratum=args.per_stratum,
+            target_size=args.target_size,
+            max_objects=args.max_objects,
+            seed=args.seed,
+        )
+    )
+    print(f"created {args.target_path} in {time.perf_counter() - start:.2f}s")
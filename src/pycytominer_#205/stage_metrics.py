@@ -0,0 +1,321 @@
+"""
+Lightweight per-stage metrics for extraction and merge pipelines.
+
+Records wall time, peak RSS, Arrow memory pool bytes and rows or
+bytes processed for each pipeline stage (read, fill, join, write...)
+without an external profiler. Results are passed to optional callbacks
+as each stage completes and may be saved as a JSON report.
+"""
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+def current_rss() -> int:
+    """
+    Current resident set size of this process in bytes.
+
+    Returns
+    -------
+    int
+        resident set size in bytes
+    """
+
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return peak_rss()
+
+
+def peak_rss() -> int:
+    """
+    Peak resident set size of this process in bytes since start
+    or since the last reset_peak_rss().
+
+    Returns
+    -------
+    int
+        peak resident set size in bytes
+    """
+
+    try:
+        with open("/proc/self/status", "r") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    # ru_maxrss is kilobytes on linux and bytes on macos
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def reset_peak_rss() -> bool:
+    """
+    Reset the peak resident set size high-water mark so that the
+    peak of a single stage may be observed (linux only).
+
+    Returns
+    -------
+    bool
+        whether the high-water mark was reset
+    """
+
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def arrow_pool_bytes() -> Dict[str, Optional[int]]:
+    """
+    Bytes allocated by and peak of the default Arrow memory pool.
+    pyarrow is only inspected if something else already imported it.
+
+    Returns
+    -------
+    Dict[str, Optional[int]]
+        dictionary with allocated, max and backend keys
+    """
+
+    if "pyarrow" not in sys.modules:
+        return {"allocated": None, "max": None, "backend": None}
+
+    pool = sys.modules["pyarrow"].default_memory_pool()
+
+    return {
+        "allocated": pool.bytes_allocated(),
+        "max": pool.max_memory(),
+        "backend": pool.backend_name,
+    }
+
+
+class Stage:
+    """
+    Measurements for a single run of a pipeline stage.
+    """
+
+    def __init__(self, name: str, **labels) -> None:
+        self.name = name
+        self.labels = labels
+        self.rows = 0
+        self.bytes = 0
+        self.thread = threading.current_thread().name
+        self.start_time = time.time()
+        self.wall_time = None
+        self.rss_start = current_rss()
+        self.rss_end = None
+        self.peak_rss = None
+        self.peak_rss_isolated = False
+        self.arrow_start = arrow_pool_bytes()
+        self.arrow_end = None
+
+    def add(self, rows: int = 0, bytes: int = 0) -> None:
+        """
+        Add rows or bytes processed by this stage.
+
+        Parameters
+        ----------
+        rows: int
+            number of rows processed
+        bytes: int
+            number of bytes processed
+        """
+
+        self.rows += rows
+        self.bytes += bytes
+
+    def to_dict(self) -> dict:
+        """
+        Stage measurements as a json-compatible dictionary.
+
+        Returns
+        -------
+        dict
+            dictionary of stage measurements
+        """
+
+        return {
+            "name": self.name,
+            "labels": self.labels,
+            "thread": self.thread,
+            "start_time": self.start_time,
+            "wall_time": self.wall_time,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "rss_start": self.rss_start,
+            "rss_end": self.rss_end,
+            "peak_rss": self.peak_rss,
+            "peak_rss_delta": self.peak_rss - self.rss_start
+            if self.peak_rss is not None
+            else None,
+            "peak_rss_isolated": self.peak_rss_isolated,
+            "arrow_allocated_start": self.arrow_start["allocated"],
+            "arrow_allocated_end": self.arrow_end["allocated"]
+            if self.arrow_end
+            else None,
+            "arrow_pool_max": self.arrow_end["max"] if self.arrow_end else None,
+            "arrow_pool_backend": self.arrow_end["backend"] if self.arrow_end else None,
+        }
+
+
+class StageMetrics:
+    """
+    Collect per-stage measurements from a pipeline.
+
+    Example:
+    metrics = StageMetrics(callbacks=[print])
+    with metrics.stage("read", table="Cells") as stage:
+        df = read(...)
+        stage.add(rows=len(df))
+    metrics.to_json("report.json")
+    """
+
+    def __init__(
+        self,
+        callbacks: Optional[List[Callable[[dict], None]]] = None,
+    ) -> None:
+        self.callbacks = callbacks if callbacks is not None else []
+        self.stages = []
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback: Callable[[dict], None]) -> None:
+        """
+        Add a callback which receives each stage dictionary on completion.
+
+        Parameters
+        ----------
+        callback: Callable[[dict], None]
+            function called with Stage.to_dict() results
+        """
+
+        self.callbacks.append(callback)
+
+    @contextmanager
+    def stage(self, name: str, **labels) -> Iterator[Stage]:
+        """
+        Measure a pipeline stage within a with-statement.
+
+        Note: the RSS high-water mark is process-wide, so a stage peak is
+        only isolated (peak_rss_isolated) when no other stage was running
+        as it began. Overlapping stages report the shared peak.
+
+        Parameters
+        ----------
+        name: str
+            name of the stage, for example read, fill, join or write
+        **labels
+            additional labels stored with the stage, for example table
+
+        Yields
+        ------
+        Stage
+            stage which may be given rows and bytes processed
+        """
+
+        with self._lock:
+            isolated = self._active == 0 and reset_peak_rss()
+            self._active += 1
+
+        stage = Stage(name, **labels)
+        stage.peak_rss_isolated = isolated
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.wall_time = time.perf_counter() - start
+            stage.rss_end = current_rss()
+            stage.peak_rss = peak_rss()
+            stage.arrow_end = arrow_pool_bytes()
+            stage_dict = stage.to_dict()
+
+            with self._lock:
+                self._active -= 1
+                self.stages.append(stage_dict)
+
+            for callback in self.callbacks:
+                callback(stage_dict)
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        Summarize measurements by stage name.
+
+        Returns
+        -------
+        Dict[str, dict]
+            dictionary of stage name to count, total wall time,
+            rows, bytes and maximum peak RSS delta.
+        """
+
+        summary = {}
+        for stage in self.stages:
+            entry = summary.setdefault(
+                stage["name"],
+                {
+                    "count": 0,
+                    "wall_time": 0.0,
+                    "rows": 0,
+                    "bytes": 0,
+                    "max_peak_rss_delta": 0,
+                    "max_arrow_pool": None,
+                },
+            )
+            entry["count"] += 1
+            entry["wall_time"] += stage["wall_time"]
+            entry["rows"] += stage["rows"]
+            entry["bytes"] += stage["bytes"]
+            entry["max_peak_rss_delta"] = max(
+                entry["max_peak_rss_delta"], stage["peak_rss_delta"] or 0
+            )
+            if stage["arrow_pool_max"] is not None:
+                entry["max_arrow_pool"] = max(
+                    entry["max_arrow_pool"] or 0, stage["arrow_pool_max"]
+                )
+
+        return summary
+
+    def report(self) -> dict:
+        """
+        Full report of all stages along with a summary.
+
+        Returns
+        -------
+        dict
+            dictionary with summary, peak_rss and stages keys
+        """
+
+        return {
+            "summary": self.summary(),
+            "peak_rss": max([stage["peak_rss"] for stage in self.stages], default=None),
+            "stages": self.stages,
+        }
+
+    def to_json(self, filepath: str) -> str:
+        """
+        Write the report to a JSON file.
+
+        Parameters
+        ----------
+        filepath: str
+            filepath to write the report to
+
+        Returns
+        -------
+        str
+            filepath of the report
+        """
+
+        with open(filepath, "w") as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+        return filepath
@@ -0,0 +1,220 @@
+"""
+Content-addressed cache keys for workflow task results which are
+built from a SQLite source fingerprint, chunk key ranges and schema
+options, along with size and age based cache eviction.
+
+Note: nothing here imports prefect so keys may be shared between
+Prefect 1 targets, Prefect 2 cache_key_fn's and other caches.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+# byte ranges of the sqlite header which change with database content
+# reference: https://www.sqlite.org/fileformat.html#the_database_header
+SQLITE_HEADER_CHANGE_COUNTER = slice(24, 28)
+SQLITE_HEADER_PAGE_COUNT = slice(28, 32)
+SQLITE_HEADER_SCHEMA_COOKIE = slice(40, 44)
+
+# seconds for which *.tmp files (writes in flight, see MergedArrowCache.put)
+# are kept by evict_cache before they are taken to be abandoned
+TMP_GRACE_SECONDS = 3600
+
+
+def sqlite_path_from_url(sql_url: str) -> str:
+    """
+    Helper function to find a SQLite filepath from a SQLAlchemy
+    or ConnectorX style url or a plain filepath.
+
+    Parameters
+    ----------
+    sql_url: str
+        url or filepath of the SQLite database
+
+    Returns
+    -------
+    str
+        filepath of the SQLite database
+    """
+
+    for prefix in ["sqlite:///", "sqlite://"]:
+        if str(sql_url).startswith(prefix):
+            return str(sql_url)[len(prefix) :]
+
+    return str(sql_url)
+
+
+def sqlite_fingerprint(sql_url: str) -> str:
+    """
+    Fingerprint a SQLite file without reading its contents.
+
+    Uses the file size and modification time along with the header's
+    file change counter, page count and schema cookie, which SQLite
+    updates on every committed write. A -wal file is included when
+    present as WAL mode commits do not update the main file header.
+
+    Parameters
+    ----------
+    sql_url: str
+        url or filepath of the SQLite database
+
+    Returns
+    -------
+    str
+        hex digest fingerprint of the SQLite file
+    """
+
+    sql_path = sqlite_path_from_url(sql_url)
+
+    with open(sql_path, "rb") as sqlite_file:
+        header = sqlite_file.read(100)
+
+    parts = [
+        os.path.abspath(sql_path),
+        os.stat(sql_path).st_size,
+        os.stat(sql_path).st_mtime_ns,
+        header[SQLITE_HEADER_CHANGE_COUNTER].hex(),
+        header[SQLITE_HEADER_PAGE_COUNT].hex(),
+        header[SQLITE_HEADER_SCHEMA_COOKIE].hex(),
+    ]
+
+    if os.path.exists(f"{sql_path}-wal"):
+        parts += [
+            os.stat(f"{sql_path}-wal").st_size,
+            os.stat(f"{sql_path}-wal").st_mtime_ns,
+        ]
+
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+def cache_key(name: str, sql_url: str, **options: Any) -> str:
+    """
+    Create a cache key for a task from the source fingerprint
+    and the task options which affect its result.
+
+    Parameters
+    ----------
+    name: str
+        name of the task
+    sql_url: str
+        url or filepath of the SQLite database
+    **options
+        json-serializable options which affect the task result,
+        for example the chunk key range or join keys. Options which
+        only affect later stages (compression, filenames) should be
+        left out so changing them keeps extraction cached.
+
+    Returns
+    -------
+    str
+        cache key in the form {name}-{hex digest}
+    """
+
+    digest = hashlib.sha256(
+        json.dumps(
+            {"fingerprint": sqlite_fingerprint(sql_url), "options": options},
+            sort_keys=True,
+            default=str,
+        ).encode()
+    ).hexdigest()
+
+    return f"{name}-{digest}"
+
+
+def chunk_key_range(basis_list_dicts: List[Dict]) -> Dict[str, Any]:
+    """
+    Describe a chunk of join basis dictionaries by its first and
+    last keys along with a digest of all keys in the chunk.
+
+    Parameters
+    ----------
+    basis_list_dicts: List[Dict]
+        list of join key dictionaries within a chunk
+
+    Returns
+    -------
+    Dict[str, Any]
+        dictionary with first, last, count and digest keys
+    """
+
+    return {
+        "first": basis_list_dicts[0] if basis_list_dicts else None,
+        "last": basis_list_dicts[-1] if basis_list_dicts else None,
+        "count": len(basis_list_dicts),
+        "digest": hashlib.sha256(
+            json.dumps(basis_list_dicts, sort_keys=True, default=str).encode()
+        ).hexdigest(),
+    }
+
+
+def evict_cache(
+    cache_dir: str,
+    max_bytes: Optional[int] = None,
+    max_age: Optional[float] = None,
+) -> List[str]:
+    """
+    Evict cached results by age and then by least recent use
+    until the cache directory is within a size budget. Files being
+    written by other processes (*.tmp younger than TMP_GRACE_SECONDS)
+    are left alone.
+
+    Parameters
+    ----------
+    cache_dir: str
+        directory of cached results
+    max_bytes: int
+        optional maximum total bytes of cached results to keep
+    max_age: float
+        optional maximum age in seconds since a result was last used
+
+    Returns
+    -------
+    List[str]
+        filepaths which were removed
+    """
+
+    if not os.path.isdir(cache_dir):
+        return []
+
+    entries = []
+    now = time.time()
+    for root, _, files in os.walk(cache_dir):
+        for file in files:
+            filepath = os.path.join(root, file)
+            try:
+                stat = os.stat(filepath)
+            except FileNotFoundError:
+                # renamed or removed by another writer meanwhile
+                continue
+            if file.endswith(".tmp") and now - stat.st_mtime < TMP_GRACE_SECONDS:
+                continue
+            # treat the most recent of access or modification as last use
+            entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, filepath))
+
+    removed = []
+
+    def remove(filepath: str) -> None:
+        try:
+            os.remove(filepath)
+        except FileNotFoundError:
+            # evicted by another process meanwhile
+            pass
+        removed.append(filepath)
+
+    if max_age is not None:
+        for last_used, _, filepath in entries:
+            if now - last_used > max_age:
+                remove(filepath)
+        entries = [entry for entry in entries if entry[2] not in removed]
+
+    if max_bytes is not None:
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, filepath in sorted(entries):
+            if total_bytes <= max_bytes:
+                break
+            remove(filepath)
+            total_bytes -= size
+
+    return removed
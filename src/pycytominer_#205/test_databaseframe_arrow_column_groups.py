@@ -0,0 +1,16 @@
+"""
+Profile the column group export and stitched reader
+against a larger SQLite file.
+"""
+from databaseframe_arrow_column_groups import DatabaseFrame, read_stitched_table
+
+sql_path = "testing_err_fixed_SQ00014613.sqlite"
+sql_url = f"sqlite:///{sql_path}"
+
+dbf = DatabaseFrame(engine=sql_url)
+print(
+    dbf.to_parquet_column_groups(
+        dirpath="./data/testing_column_groups", group_size=500, workers=4
+    )
+)
+print(read_stitched_table(dirpath="./data/testing_column_groups", table_name="Cells"))
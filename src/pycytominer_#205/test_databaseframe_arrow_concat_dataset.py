@@ -0,0 +1,19 @@
+"""
+Profile the per-compartment parquet dataset export and lazy
+wide reader against a larger SQLite file.
+"""
+from databaseframe_arrow_concat_dataset import (
+    DatabaseFrame,
+    collect_wide_schema,
+    iter_wide_batches,
+)
+
+sql_path = "testing_err_fixed_SQ00014613.sqlite"
+sql_url = f"sqlite:///{sql_path}"
+
+dbf = DatabaseFrame(engine=sql_url)
+print(dbf.to_parquet_dataset(dirpath="./data/testing_dataset"))
+print(collect_wide_schema(dirpath="./data/testing_dataset"))
+print(
+    sum(batch.num_rows for batch in iter_wide_batches(dirpath="./data/testing_dataset"))
+)
@@ -0,0 +1,16 @@
+"""
+Profile the rowid range concat export against a larger SQLite file.
+"""
+import pyarrow.parquet as pq
+from databaseframe_arrow_concat_rowid_chunks import DatabaseFrame
+
+sql_path = "testing_err_fixed_SQ00014613.sqlite"
+sql_url = f"sqlite:///{sql_path}"
+
+dbf = DatabaseFrame(engine=sql_url)
+print(
+    dbf.to_parquet(
+        filename="./data/testing_rowid_chunks.parquet", chunk_size=50000, workers=4
+    )
+)
+print(pq.ParquetFile("./data/testing_rowid_chunks.parquet").metadata)
@@ -2,12 +2,15 @@
 DatabaseFrame class for extracting data as similar
 collection of in-memory data
 """
+import os
 from typing import List, Optional
 
 import connectorx as cx
 import polars as pl
+from chunk_pipeline import ChunkPipeline
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
+from stage_metrics import StageMetrics
 
 sql_path = "testing_err_fixed_SQ00014613.sqlite"
 sql_url = f"sqlite:///{sql_path}"
@@ -299,6 +302,8 @@ class DatabaseFrame:
         join_keys: List[str] = None,
         chunk_size: int = 50,
         filename: str = None,
+        metrics: StageMetrics = None,
+        pipeline: ChunkPipeline = None,
     ) -> pl.DataFrame:
         """
         Create merged dataset for cytomining efforts.
@@ -316,6 +321,12 @@ class DatabaseFrame:
         join_keys: List[str]
             list of keys which will be used for join
             By default TableNumber and ImageNumber.
+        metrics: StageMetrics
+            optional per-stage metrics for read, fill, join and write.
+        pipeline: ChunkPipeline
+            optional pipeline which overlaps reading, filling and
+            writing of chunks. Its read, transform and write functions
+            are set here, so only pool sizes need to be provided.
 
         Returns
         -------
@@ -323,6 +334,9 @@ class DatabaseFrame:
             Single merged dataset from compartments provided.
         """
 
+        if not metrics:
+            metrics = StageMetrics()
+
         if not basis:
             basis = "image"
 
@@ -348,29 +362,71 @@ class DatabaseFrame:
             for i in range(0, len(basis_dicts), chunk_size)
         ]
 
-        count = 0
-        for basis_list_dicts in basis_list_dicts_chunks:
-            concatted = pl.DataFrame()
+        def read_chunk(chunk: tuple) -> List[pl.DataFrame]:
+            count, basis_list_dicts = chunk
+            frames = []
             for table in self.collect_sql_tables():
-                to_concat = self.sql_table_to_pl_dataframe(
-                    table_name=table["table_name"],
-                    prepend_tablename_to_cols=True,
-                    avoid_prepend_for=["TableNumber", "ImageNumber"],
-                    basis_list_dicts=basis_list_dicts,
-                )
+                # note: column renames take place within the read's select
+                with metrics.stage(
+                    "read", table=table["table_name"], chunk=count
+                ) as stage:
+                    to_concat = self.sql_table_to_pl_dataframe(
+                        table_name=table["table_name"],
+                        prepend_tablename_to_cols=True,
+                        avoid_prepend_for=["TableNumber", "ImageNumber"],
+                        basis_list_dicts=basis_list_dicts,
+                    )
+                    stage.add(rows=len(to_concat), bytes=to_concat.estimated_size())
+                frames.append((table["table_name"], to_concat))
+            return count, frames
+
+        def transform_chunk(chunk: tuple) -> pl.DataFrame:
+            count, frames = chunk
+            concatted = pl.DataFrame()
+            for table_name, to_concat in frames:
                 if len(concatted) == 0:
                     concatted = to_concat
                 else:
-                    concatted = self.nan_data_fill(
-                        fill_into=concatted, fill_from=to_concat
-                    )
-                    to_concat = self.nan_data_fill(
-                        fill_into=to_concat, fill_from=concatted
-                    )
-                    concatted = pl.concat([concatted, to_concat])
+                    with metrics.stage("fill", table=table_name, chunk=count) as stage:
+                        concatted = self.nan_data_fill(
+                            fill_into=concatted, fill_from=to_concat
+                        )
+                        to_concat = self.nan_data_fill(
+                            fill_into=to_concat, fill_from=concatted
+                        )
+                        stage.add(
+                            rows=len(concatted) + len(to_concat),
+                            bytes=concatted.estimated_size()
+                            + to_concat.estimated_size(),
+                        )
+                    with metrics.stage("join", table=table_name, chunk=count) as stage:
+                        concatted = pl.concat([concatted, to_concat])
+                        stage.add(rows=len(concatted), bytes=concatted.estimated_size())
+            return count, concatted
+
+        def write_chunk(chunk: tuple) -> str:
+            count, concatted = chunk
+            with metrics.stage("write", chunk=count) as stage:
+                concatted.write_parquet(f"{filename}_{count}.parquet")
+                stage.add(
+                    rows=len(concatted),
+                    bytes=os.path.getsize(f"{filename}_{count}.parquet"),
+                )
+            return f"{filename}_{count}.parquet"
+
+        chunks = list(enumerate(basis_list_dicts_chunks))
+
+        if pipeline:
+            # overlap reads, fills and writes with bounded chunks in flight
+            pipeline.read = read_chunk
+            pipeline.transform = transform_chunk
+            pipeline.write = write_chunk
+            pipeline.run(chunks)
+        else:
+            for chunk in chunks:
+                write_chunk(transform_chunk(read_chunk(chunk)))
 
-            concatted.write_parquet(f"{filename}_{count}.parquet")
-            count += 1
+        count = len(chunks)
 
         return count
 
@@ -378,5 +434,18 @@ class DatabaseFrame:
 dbf = DatabaseFrame(engine=sql_url)
 print("\nFinal result\n")
 print(dbf)
-print(dbf.to_parquet(filename="./example", chunk_size=20))
+metrics = StageMetrics()
+print(dbf.to_parquet(filename="./example", chunk_size=20, metrics=metrics))
+print(metrics.summary())
+print(metrics.to_json("./example_metrics.json"))
+pipeline = ChunkPipeline(readers=4, max_in_flight=6)
+print(
+    dbf.to_parquet(
+        filename="./example_pipelined",
+        chunk_size=20,
+        metrics=metrics,
+        pipeline=pipeline,
+    )
+)
+print(pipeline.report())
 print(pl.read_parquet("example*.parquet"))
@@ -5,6 +5,7 @@ collection of in-memory data
 import glob
 import os
 import uuid
+from datetime import timedelta
 from typing import List, Optional
 
 import numpy as np
@@ -16,12 +17,60 @@ from prefect import flow, task
 from prefect.task_runners import ConcurrentTaskRunner
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
+from task_cache import cache_key, chunk_key_range
 
 if __name__ == "__main__":
 
     sql_path = "testing_err_fixed_SQ00014613.sqlite"
     sql_url = f"sqlite:///{sql_path}"
 
+    # cached task results expire after this duration
+    cache_expiration = timedelta(days=7)
+
+    def engine_url(engine) -> str:
+        """
+        Helper function to find the url of an engine or engine string.
+        """
+        return str(engine.url) if type(engine) is Engine else str(engine)
+
+    def collect_sql_tables_cache_key(context, parameters: dict) -> str:
+        """
+        Cache key for collect_sql_tables from the source fingerprint.
+        """
+        return cache_key(
+            "collect_sql_tables",
+            engine_url(parameters["engine"]),
+            table_name=parameters.get("table_name"),
+        )
+
+    def sql_select_distinct_join_basis_cache_key(context, parameters: dict) -> str:
+        """
+        Cache key for sql_select_distinct_join_basis from the
+        source fingerprint and chunking options.
+        """
+        return cache_key(
+            "sql_select_distinct_join_basis",
+            engine_url(parameters["engine"]),
+            table_name=parameters["table_name"],
+            join_keys=parameters["join_keys"],
+            chunk_size=parameters["chunk_size"],
+        )
+
+    def sql_table_to_pl_dataframe_cache_key(context, parameters: dict) -> str:
+        """
+        Cache key for per-chunk table reads from the source fingerprint,
+        chunk key range and schema options. Output options (filename,
+        compression) are left out so changing them skips extraction.
+        """
+        return cache_key(
+            "sql_table_to_pl_dataframe",
+            engine_url(parameters["engine"]),
+            table_name=parameters["table_name"],
+            prepend_tablename_to_cols=parameters.get("prepend_tablename_to_cols"),
+            avoid_prepend_for=parameters.get("avoid_prepend_for"),
+            chunk=chunk_key_range(parameters.get("basis_list_dicts") or []),
+        )
+
     @task
     def engine_from_str(sql_engine: str) -> Engine:
         """
@@ -48,7 +97,7 @@ if __name__ == "__main__":
 
         return engine
 
-    @task
+    @task(cache_key_fn=collect_sql_tables_cache_key, cache_expiration=cache_expiration)
     def collect_sql_tables(
         engine,
         table_name: Optional[str] = None,
@@ -145,7 +194,10 @@ if __name__ == "__main__":
 
         return column_list
 
-    @flow(task_runner=ConcurrentTaskRunner())
+    @task(
+        cache_key_fn=sql_select_distinct_join_basis_cache_key,
+        cache_expiration=cache_expiration,
+    )
     def sql_select_distinct_join_basis(
         engine, table_name: str, join_keys: List[str], chunk_size: int
     ) -> list:
@@ -158,7 +210,7 @@ if __name__ == "__main__":
 
         basis_dicts = pd.read_sql(
             sql_stmt,
-            engine_from_str(engine).result(),
+            engine_from_str.fn(engine),
         ).to_dict(orient="records")
 
         chunked_basis_dicts = [
@@ -168,7 +220,10 @@ if __name__ == "__main__":
 
         return chunked_basis_dicts
 
-    @task
+    @task(
+        cache_key_fn=sql_table_to_pl_dataframe_cache_key,
+        cache_expiration=cache_expiration,
+    )
     def sql_table_to_pl_dataframe(
         engine,
         table_name: str,
@@ -0,0 +1,43 @@
+"""
+Check that image sampling within sqlite_subset.py is deterministic
+for a seed and differs between seeds.
+"""
+import sqlite3
+
+from sqlite_subset import sample_images
+
+connection = sqlite3.connect(":memory:")
+connection.execute("ATTACH DATABASE ':memory:' AS source;")
+connection.execute(
+    "CREATE TABLE source.Image (TableNumber INTEGER, ImageNumber INTEGER);"
+)
+connection.executemany(
+    "INSERT INTO source.Image VALUES (?, ?);",
+    [(1, image_number) for image_number in range(1, 101)],
+)
+
+
+def sampled(seed: int) -> list:
+    sample_images(
+        connection,
+        basis="Image",
+        join_keys=["TableNumber", "ImageNumber"],
+        strata=[],
+        per_stratum=8,
+        seed=seed,
+    )
+    return sorted(
+        row[0]
+        for row in connection.execute(
+            "SELECT ImageNumber FROM temp.sampled_images;"
+        ).fetchall()
+    )
+
+
+samples = {seed: sampled(seed) for seed in [0, 1, 7, 12345]}
+print(samples)
+
+assert sampled(7) == samples[7], "samples differ for the same seed"
+assert len({tuple(sample) for sample in samples.values()}) == len(
+    samples
+), "different seeds gave the same sample"